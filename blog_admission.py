@@ -0,0 +1,205 @@
+#!python3
+"""Admission control: bounded in-flight work, handed out by client class.
+
+Requests are classed by user agent:
+
+    unfurl   link-preview bots (Slack, iMessage, WhatsApp, ...), which give up
+             after a few seconds and are the reason this service exists
+    human    browsers
+    crawler  everything else: search crawlers, scanners, scripts
+
+At most max_in_flight requests run at once. Past that a request waits in its
+class's queue, and a freed slot always goes to the oldest waiter of the
+highest class, so a Slackbot fetch never waits behind a crawler sweep. When a
+class's queue is full, or a request has waited its class's max_wait, it's
+shed: AdmissionMiddleware answers it with the degraded app instead, which
+must not do upstream work.
+
+Everything here runs on the event loop, so it needs no locks.
+"""
+
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, Optional
+
+from blog_origin import LatencyWindow
+
+UNFURL = "unfurl"
+HUMAN = "human"
+CRAWLER = "crawler"
+CLASSES = (UNFURL, HUMAN, CRAWLER)  # highest priority first
+
+MAX_IN_FLIGHT = 16
+QUEUE_LIMITS = {UNFURL: 64, HUMAN: 32, CRAWLER: 8}
+# Unfurl bots give up after a few seconds; crawlers can come back later
+MAX_WAIT_SECONDS = {UNFURL: 2.0, HUMAN: 2.0, CRAWLER: 0.25}
+
+# Lowercase user agent substrings of link-preview fetchers
+UNFURL_AGENTS = (
+    "slackbot",
+    "slack-imgproxy",
+    "twitterbot",
+    "facebookexternalhit",
+    "facebot",
+    "linkedinbot",
+    "whatsapp",
+    "telegrambot",
+    "discordbot",
+    "skypeuripreview",
+    "microsoftpreview",
+    "google-pagerenderer",
+    "mastodon",
+    "redditbot",
+    "iframely",
+    "embedly",
+    "pinterestbot",
+)
+_CRAWLER_MARKERS = ("bot", "crawl", "spider", "scan", "http", "python", "curl")
+
+
+def classify(user_agent: Optional[str]) -> str:
+    ua = (user_agent or "").lower()
+    if any(agent in ua for agent in UNFURL_AGENTS):
+        return UNFURL
+    if ua.startswith("mozilla/") and not any(m in ua for m in _CRAWLER_MARKERS):
+        return HUMAN
+    return CRAWLER
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        queue_limits: Dict[str, int] = QUEUE_LIMITS,
+        max_wait: Dict[str, float] = MAX_WAIT_SECONDS,
+    ):
+        self.max_in_flight = max_in_flight
+        self.queue_limits = queue_limits
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.queues: Dict[str, deque] = {c: deque() for c in CLASSES}
+        # (event, class) -> count; events are admitted, queued, shed_full and
+        # shed_timeout
+        self.counts: Counter = Counter()
+        self.waits: Dict[str, LatencyWindow] = {c: LatencyWindow() for c in CLASSES}
+
+    def waiting(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    async def admit(self, cls: str) -> bool:
+        """Wait for a slot; False if the request is shed instead. Every True
+        must be followed by release()."""
+        if self.in_flight < self.max_in_flight and not self.waiting():
+            self.in_flight += 1
+            self.counts["admitted", cls] += 1
+            return True
+        queue = self.queues[cls]
+        if len(queue) >= self.queue_limits[cls]:
+            self.counts["shed_full", cls] += 1
+            return False
+
+        self.counts["queued", cls] += 1
+        slot = asyncio.get_running_loop().create_future()
+        queue.append(slot)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(slot, self.max_wait[cls])
+        except asyncio.TimeoutError:
+            # release() may have handed us the slot just as the wait ran out;
+            # pass it on, or it stays taken for good
+            self._forget(queue, slot)
+            if slot.done() and not slot.cancelled():
+                self.release()
+            self.counts["shed_timeout", cls] += 1
+            return False
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot we were already given
+            self._forget(queue, slot)
+            if slot.done() and not slot.cancelled():
+                self.release()
+            raise
+        self.waits[cls].record(time.perf_counter() - start)
+        self.counts["admitted", cls] += 1
+        return True
+
+    @staticmethod
+    def _forget(queue: deque, slot: asyncio.Future) -> None:
+        try:
+            queue.remove(slot)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the highest waiting class"""
+        self.in_flight -= 1
+        for cls in CLASSES:
+            queue = self.queues[cls]
+            while queue:
+                slot = queue.popleft()
+                if not slot.done():
+                    self.in_flight += 1
+                    slot.set_result(None)
+                    return
+
+    def shed_total(self) -> int:
+        return sum(
+            n for (event, _), n in self.counts.items() if event.startswith("shed")
+        )
+
+    def report(self) -> Dict[str, object]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "shed": self.shed_total(),
+            "classes": {
+                cls: {
+                    "admitted": self.counts["admitted", cls],
+                    "queued": self.counts["queued", cls],
+                    "shed_full": self.counts["shed_full", cls],
+                    "shed_timeout": self.counts["shed_timeout", cls],
+                    "waiting": len(self.queues[cls]),
+                    "wait": self.waits[cls].summary(),
+                }
+                for cls in CLASSES
+            },
+        }
+
+    def reset(self) -> None:
+        """Forget counts and waiters (tests); slots in use stay counted"""
+        for queue in self.queues.values():
+            queue.clear()
+        self.counts.clear()
+        for window in self.waits.values():
+            window.clear()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: requests go through the controller under the class
+    choose(scope) returns, or skip it when that's None. Shed requests are
+    answered by degraded(scope, receive, send, cls)."""
+
+    def __init__(
+        self,
+        app,
+        choose: Callable[[dict], Optional[str]],
+        degraded,
+        controller: Callable[[], AdmissionController],
+    ):
+        self.app = app
+        self.choose = choose
+        self.degraded = degraded
+        # A callable, so the controller can be swapped (e.g. in tests)
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        cls = self.choose(scope) if scope["type"] == "http" else None
+        if cls is None:
+            return await self.app(scope, receive, send)
+        controller = self.controller()
+        if not await controller.admit(cls):
+            return await self.degraded(scope, receive, send, cls)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
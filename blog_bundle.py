@@ -0,0 +1,209 @@
+#!python3
+"""Read-only bundle of rendered redirect pages, memory-mapped and shared.
+
+Each worker process otherwise keeps its own rendered_cache and redoes the
+same fetch/parse/render work. One worker writes the current renders into a
+single file; every worker maps it read-only, so the OS page cache holds one
+copy, and looks entries up in place without deserializing anything.
+
+Layout (little-endian):
+
+    header  MAGIC, version, slot count, entry count, created (unix time)
+    slots   open-addressing hash table; each slot is
+            (key hash, data offset, key length, digest length, html length,
+             table)
+    data    per entry: key | content digest | payload
+
+Entries live in one of two tables, which share the hash table but never
+each other's keys: RENDERS, keyed page#anchor with the rendered HTML as
+payload, and INDEXES, keyed by page URL with the caller's serialized index.
+
+A slot with hash 0 is empty. The file is written next to its final path and
+renamed over it, so a reader sees either the old bundle or the new one;
+BundleReader notices the rename and swaps its mapping.
+
+Index payloads are unpickled, so the bundle must only ever be writable by
+this service: its directory is created 0700, and a file or directory that
+is owned by another user or writable by group or others is refused.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+MAGIC = b"IGORBNDL"
+VERSION = 2
+BUNDLE_CHECK_SECONDS = 5.0
+
+RENDERS = 0
+INDEXES = 1
+
+_HEADER = struct.Struct("<8sIIId")
+_SLOT = struct.Struct("<QQIIIB3x")
+
+
+def _key_hash(table: int, key: bytes) -> int:
+    # Stable across processes (unlike hash()); never 0, which marks empty slots
+    digest = hashlib.blake2b(bytes([table]) + key, digest_size=8).digest()
+    return int.from_bytes(digest, "little") | 1
+
+
+def _private(st: os.stat_result) -> bool:
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+class BundleEntry(NamedTuple):
+    digest: bytes
+    # A view into the mapping, no copy
+    html: memoryview
+
+
+def write_bundle(
+    path: str,
+    entries: Iterable[Tuple[str, bytes, bytes]],
+    created: float,
+    indexes: Iterable[Tuple[str, bytes, bytes]] = (),
+) -> int:
+    """Write (key, digest, payload) entries to path, renders and then indexes,
+    replacing it atomically. Returns the number of entries."""
+    rows = [(RENDERS, *entry) for entry in entries]
+    rows += [(INDEXES, *entry) for entry in indexes]
+    slot_count = 8
+    while slot_count < 2 * len(rows):
+        slot_count *= 2
+
+    slots = [None] * slot_count
+    data = bytearray()
+    data_start = _HEADER.size + slot_count * _SLOT.size
+    for table, key, digest, html in rows:
+        key_bytes = key.encode("utf-8")
+        h = _key_hash(table, key_bytes)
+        i = h & (slot_count - 1)
+        while slots[i] is not None:
+            i = (i + 1) & (slot_count - 1)
+        slot = (h, data_start + len(data), len(key_bytes), len(digest), len(html))
+        slots[i] = slot + (table,)
+        data += key_bytes + digest + html
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not _private(os.stat(directory)):
+        raise PermissionError(f"{directory} isn't private to this user")
+    # mkstemp creates the file 0600
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".bundle-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, slot_count, len(rows), created))
+            for slot in slots:
+                f.write(_SLOT.pack(*(slot or (0, 0, 0, 0, 0, 0))))
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return len(rows)
+
+
+class Bundle:
+    """One mapped bundle file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if not _private(st) or not _private(os.stat(os.path.dirname(path) or ".")):
+                raise ValueError(f"{path} isn't private to this user")
+            self.inode = st.st_ino
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slot_count, self.entries, self.created = (
+            _HEADER.unpack_from(self.map, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} bundle")
+        self.view = memoryview(self.map)
+
+    def get(self, key: str, table: int = RENDERS) -> Optional[BundleEntry]:
+        key_bytes = key.encode("utf-8")
+        h = _key_hash(table, key_bytes)
+        mask = self.slot_count - 1
+        i = h & mask
+        while True:
+            slot_hash, offset, key_len, digest_len, html_len, slot_table = (
+                _SLOT.unpack_from(self.map, _HEADER.size + i * _SLOT.size)
+            )
+            if slot_hash == 0:
+                return None
+            if (
+                slot_hash == h
+                and slot_table == table
+                and self.view[offset : offset + key_len] == key_bytes
+            ):
+                return self._entry(offset + key_len, digest_len, html_len)
+            i = (i + 1) & mask
+
+    def items(self, table: int) -> Iterator[Tuple[str, BundleEntry]]:
+        """(key, entry) for every entry of table, in slot order"""
+        for i in range(self.slot_count):
+            slot_hash, offset, key_len, digest_len, html_len, slot_table = (
+                _SLOT.unpack_from(self.map, _HEADER.size + i * _SLOT.size)
+            )
+            if slot_hash and slot_table == table:
+                key = bytes(self.view[offset : offset + key_len]).decode("utf-8")
+                yield key, self._entry(offset + key_len, digest_len, html_len)
+
+    def _entry(self, start: int, digest_len: int, html_len: int) -> BundleEntry:
+        return BundleEntry(
+            bytes(self.view[start : start + digest_len]),
+            self.view[start + digest_len : start + digest_len + html_len],
+        )
+
+
+class BundleReader:
+    """The current bundle at path, remapped when a new one is renamed in.
+    Checks the file at most every check_seconds."""
+
+    def __init__(
+        self,
+        path: str,
+        check_seconds: float = BUNDLE_CHECK_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.check_seconds = check_seconds
+        self.clock = clock
+        self.bundle: Optional[Bundle] = None
+        self._checked_at: Optional[float] = None
+
+    def current(self) -> Optional[Bundle]:
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return self.bundle
+        self._checked_at = now
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self.bundle = None
+            return None
+        if self.bundle is None or self.bundle.inode != inode:
+            try:
+                # Readers holding entries of the old bundle keep its mapping
+                # alive until they're done with them
+                self.bundle = Bundle(self.path)
+            except (OSError, ValueError):
+                self.bundle = None
+        return self.bundle
+
+    def reload(self) -> Optional[Bundle]:
+        """Check the file now, e.g. right after writing a new bundle"""
+        self._checked_at = None
+        return self.current()
+
+    def get(self, key: str, max_age: float) -> Optional[BundleEntry]:
+        """Entry for key from a bundle written less than max_age seconds ago"""
+        bundle = self.current()
+        if bundle is None or time.time() - bundle.created >= max_age:
+            return None
+        return bundle.get(key)
@@ -0,0 +1,137 @@
+#!python3
+"""Recorded origin responses, for benchmarks and tests without the network.
+
+With ORIGIN_FIXTURES=record the fetch layer saves every origin response it
+gets (body, status, headers and how long it took) into a FixtureStore; with
+ORIGIN_FIXTURES=replay it gets them from the store instead of the network,
+after the recorded latency. A URL without a fixture fails like an unreachable
+origin, and one whose recorded latency exceeds the fetch timeout times out,
+so a replay follows the same code paths every time.
+
+Each fixture is two files named after the URL: the body exactly as received,
+and a JSON file with everything else.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+# Counters for the admin metrics endpoint
+stats: Counter = Counter()
+
+
+class Fixture(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    encoding: Optional[str]
+    seconds: float
+    body: bytes
+
+    def to_response(self):
+        """A requests.Response as if it had just been fetched"""
+        import requests
+
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status
+        response.headers.update(self.headers)
+        response.encoding = self.encoding
+        response.elapsed = timedelta(seconds=self.seconds)
+        response._content = self.body
+        return response
+
+
+def _file_stem(url: str) -> str:
+    readable = re.sub(r"[^A-Za-z0-9]+", "_", url.split("://", 1)[-1]).strip("_")
+    digest = hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
+    return f"{readable[:80]}-{digest}"
+
+
+class FixtureStore:
+    """Fixtures in a directory; get() stands in for requests.get"""
+
+    def __init__(self, directory: str, latency_scale: float = 1.0):
+        self.directory = directory
+        # 1.0 replays the recorded latencies, 0 doesn't wait at all
+        self.latency_scale = latency_scale
+        self._cache: Dict[str, Fixture] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str):
+        stem = os.path.join(self.directory, _file_stem(url))
+        return f"{stem}.json", f"{stem}.body"
+
+    def save(self, url: str, response, seconds: float) -> Fixture:
+        fixture = Fixture(
+            url,
+            response.status_code,
+            dict(response.headers),
+            response.encoding,
+            round(seconds, 4),
+            response.content,
+        )
+        meta_path, body_path = self._paths(url)
+        meta = {**fixture._asdict(), "recorded": datetime.now().isoformat()}
+        del meta["body"]
+        os.makedirs(self.directory, exist_ok=True)
+        # Body first: a fixture only counts once its metadata is in place
+        for path, data in (
+            (body_path, fixture.body),
+            (meta_path, json.dumps(meta, indent=2).encode()),
+        ):
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".fixture-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        with self._lock:
+            self._cache[url] = fixture
+        stats["recorded"] += 1
+        return fixture
+
+    def load(self, url: str) -> Optional[Fixture]:
+        with self._lock:
+            fixture = self._cache.get(url)
+        if fixture is not None:
+            return fixture
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        meta.pop("recorded", None)
+        fixture = Fixture(body=body, **meta)
+        with self._lock:
+            self._cache[url] = fixture
+        return fixture
+
+    def get(self, url: str, timeout: Optional[float] = None, **kwargs):
+        """The recorded response for url, after its recorded latency"""
+        import requests
+
+        fixture = self.load(url)
+        if fixture is None:
+            stats["missing"] += 1
+            raise requests.ConnectionError(f"No fixture for {url}")
+        delay = fixture.seconds * self.latency_scale
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            stats["timed_out"] += 1
+            raise requests.Timeout(f"Recorded fetch of {url} took {fixture.seconds}s")
+        time.sleep(delay)
+        stats["replayed"] += 1
+        return fixture.to_response()
@@ -0,0 +1,132 @@
+#!python3
+"""Which links and pages get requested most, in fixed memory.
+
+A count-min sketch estimates how often any key was seen, using a fixed
+depth x width table of counters however many distinct keys show up (crawlers
+sweeping junk paths included). A small top-K table, ordered by a min-heap,
+remembers the hottest keys themselves so they can be listed.
+
+Counts are halved every DECAY_EVERY updates, so the ranking follows what is
+hot now rather than what was hot last month.
+"""
+
+import heapq
+import itertools
+import sys
+import threading
+from array import array
+from typing import Dict, Hashable, List, Tuple
+
+SKETCH_WIDTH = 2048  # a power of two
+SKETCH_DEPTH = 4
+TOP_K = 100
+DECAY_EVERY = 50_000
+
+_MASK64 = (1 << 64) - 1
+# One odd multiplier per row; a row's slot is the top bits of hash * multiplier
+_ROW_MULTIPLIERS = (
+    0x9E3779B97F4A7C15,
+    0xC2B2AE3D27D4EB4F,
+    0x165667B19E3779F9,
+    0xD6E8FEB86659FD93,
+    0xFF51AFD7ED558CCD,
+    0xC4CEB9FE1A85EC53,
+)
+
+
+class HotKeys:
+    def __init__(
+        self,
+        k: int = TOP_K,
+        width: int = SKETCH_WIDTH,
+        depth: int = SKETCH_DEPTH,
+        decay_every: int = DECAY_EVERY,
+    ):
+        if width & (width - 1) or depth > len(_ROW_MULTIPLIERS):
+            raise ValueError("width must be a power of two, depth at most 6")
+        self.k = k
+        self.width = width
+        self._shift = 64 - (width.bit_length() - 1)
+        self._multipliers = _ROW_MULTIPLIERS[:depth]
+        self.decay_every = decay_every
+        self.rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+        # The current top-K keys and their estimated counts
+        self.top: Dict[Hashable, int] = {}
+        # (count, seq, key) min-heap over self.top; entries whose count no
+        # longer matches self.top are stale and skipped when popped
+        self._heap: List[Tuple[int, int, Hashable]] = []
+        self._seq = itertools.count()
+        self.updates = 0
+        self._lock = threading.Lock()
+
+    def _slots(self, key: Hashable) -> List[int]:
+        h = hash(key) & _MASK64
+        h ^= h >> 33  # the low bits of hash() can be weak; mix in the high ones
+        return [((h * m) & _MASK64) >> self._shift for m in self._multipliers]
+
+    def estimate(self, key: Hashable) -> int:
+        """How often key was seen (never under-, possibly over-counted)"""
+        return min(row[i] for row, i in zip(self.rows, self._slots(key)))
+
+    def record(self, key: Hashable) -> int:
+        """Count one occurrence of key; returns its new estimate"""
+        slots = self._slots(key)
+        with self._lock:
+            # Conservative update: only raise the counters that are at the min
+            count = min(row[i] for row, i in zip(self.rows, slots)) + 1
+            for row, i in zip(self.rows, slots):
+                if row[i] < count:
+                    row[i] = count
+            self._offer(key, count)
+            self.updates += 1
+            if self.updates % self.decay_every == 0:
+                self._decay()
+        return count
+
+    def _offer(self, key: Hashable, count: int) -> None:
+        if key not in self.top and len(self.top) >= self.k:
+            coldest_count, _, coldest = self._coldest()
+            if count <= coldest_count:
+                return
+            heapq.heappop(self._heap)
+            del self.top[coldest]
+        self.top[key] = count
+        heapq.heappush(self._heap, (count, next(self._seq), key))
+        if len(self._heap) > 4 * self.k:
+            self._rebuild_heap()
+
+    def _coldest(self) -> Tuple[int, int, Hashable]:
+        heap = self._heap
+        while self.top.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(c, next(self._seq), key) for key, c in self.top.items()]
+        heapq.heapify(self._heap)
+
+    def _decay(self) -> None:
+        self.rows = [array("I", (v >> 1 for v in row)) for row in self.rows]
+        self.top = {key: c >> 1 for key, c in self.top.items() if c > 1}
+        self._rebuild_heap()
+
+    def hottest(self, n: int) -> List[Tuple[Hashable, int]]:
+        """Up to n (key, estimated count) pairs, hottest first"""
+        with self._lock:
+            ranked = sorted(self.top.items(), key=lambda item: -item[1])
+        return ranked[:n]
+
+    def nbytes(self) -> int:
+        return (
+            sum(sys.getsizeof(row) for row in self.rows)
+            + sys.getsizeof(self.top)
+            + sys.getsizeof(self._heap)
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            for row in self.rows:
+                row[:] = array("I", bytes(4 * self.width))
+            self.top.clear()
+            self._heap.clear()
+            self.updates = 0
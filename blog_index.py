@@ -0,0 +1,322 @@
+#!python3
+"""Compact per-page index of sections, built once per fetched page.
+
+The preview helpers used to walk a BeautifulSoup tree on every lookup, and a
+parsed tree is 10-20x the size of its HTML. build_page_index() walks the tree
+once, extracts everything the helpers need, and the tree is dropped:
+
+- every paragraph's text is stored once, UTF-8 encoded, in one shared bytes
+  buffer, and addressed by paragraph number through an offsets array
+- a section (any element with an id, usually a heading) is a slotted record
+  holding its interned anchor, heading text, level, first image and a range
+  of paragraph numbers
+- the page-level fallback paragraphs (article/main/div.content) are one more
+  range of paragraph numbers into the same buffer
+
+Each section also carries a digest of its content, so when a page is refetched
+diff_indexes() can tell which anchors actually changed, and whatever was
+derived from the unchanged ones (rendered responses, search postings) is kept.
+"""
+
+import hashlib
+import sys
+import urllib.parse
+from array import array
+from typing import Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
+
+HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+
+def resolve_image_url(src: str, page_url: str) -> str:
+    """Resolve a potentially relative image URL to an absolute URL."""
+    if src.startswith(("http://", "https://")):
+        return src
+    parsed = urllib.parse.urlparse(page_url)
+    base = f"{parsed.scheme}://{parsed.netloc}"
+    if src.startswith("/"):
+        return base + src
+    return base + "/" + src
+
+
+def _digest(*parts: Optional[str]) -> bytes:
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        h.update(b"\x00" if part is None else part.encode("utf-8") + b"\x01")
+    return h.digest()
+
+
+class Section:
+    __slots__ = (
+        "anchor",
+        "heading",
+        "level",
+        "image",
+        "para_start",
+        "para_count",
+        "digest",
+    )
+
+    def __init__(self, anchor, heading, level, image, para_start, para_count, digest):
+        # The element's id as written, for the redirect fragment
+        self.anchor: str = anchor
+        # Heading text, None if the element isn't h1-h6 (or has no text)
+        self.heading: Optional[str] = heading
+        # 1-6 for h1-h6, 0 for other elements with an id
+        self.level: int = level
+        # First image before the next same-or-higher level heading
+        self.image: Optional[str] = image
+        # Range into PageIndex.para_refs
+        self.para_start: int = para_start
+        self.para_count: int = para_count
+        # Digest of heading, level, image and paragraph text
+        self.digest: bytes = digest
+
+    def nbytes(self) -> int:
+        size = (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.anchor)
+            + sys.getsizeof(self.digest)
+        )
+        if self.heading:
+            size += sys.getsizeof(self.heading)
+        if self.image:
+            size += sys.getsizeof(self.image)
+        return size
+
+
+class PageIndex:
+    __slots__ = (
+        "url",
+        "og_image",
+        "text",
+        "offsets",
+        "para_refs",
+        "sections",
+        "fallback_start",
+        "fallback_count",
+        "fallback_digest",
+    )
+
+    def __init__(self, url: str):
+        self.url = url
+        self.og_image: Optional[str] = None
+        # Paragraph i is text[offsets[i]:offsets[i + 1]]
+        self.text = b""
+        self.offsets = array("I", [0])
+        # Paragraph numbers, in ranges owned by sections and the fallback
+        self.para_refs = array("I")
+        # Keyed by lowercased id: links are matched case-insensitively (see
+        # section()), Section.anchor keeps the id as written
+        self.sections: Dict[str, Section] = {}
+        self.fallback_start = 0
+        self.fallback_count = 0
+        self.fallback_digest = b""
+
+    def paragraph(self, i: int) -> str:
+        return self.text[self.offsets[i] : self.offsets[i + 1]].decode("utf-8")
+
+    def _paragraphs(self, start: int, count: int) -> Iterator[str]:
+        for ref in self.para_refs[start : start + count]:
+            yield self.paragraph(ref)
+
+    def section_paragraphs(self, section: Section) -> Iterator[str]:
+        return self._paragraphs(section.para_start, section.para_count)
+
+    def fallback_paragraphs(self) -> Iterator[str]:
+        return self._paragraphs(self.fallback_start, self.fallback_count)
+
+    def section(self, anchor: str) -> Optional[Section]:
+        """The section whose id matches anchor, ignoring case"""
+        return self.sections.get(anchor.lower())
+
+    def content_digest(self, anchor: Optional[str]) -> Optional[bytes]:
+        """Digest of everything a preview of anchor is built from: the section,
+        plus the page's fallback text and og:image where the section has no
+        paragraphs or image of its own. None if the anchor isn't on the page."""
+        section = self.section(anchor) if anchor else None
+        if anchor and section is None:
+            return None
+        # Tagged and length-prefixed, so different parts can't join into the
+        # same bytes; the result is a fixed-size ETag that doesn't leak og_image
+        h = hashlib.blake2b(digest_size=16)
+        parts = [(b"s", section.digest if section else b"")]
+        if section is None or not section.para_count:
+            parts.append((b"f", self.fallback_digest))
+        if section is None or not section.image:
+            parts.append((b"i", (self.og_image or "").encode("utf-8")))
+        for tag, part in parts:
+            h.update(tag + len(part).to_bytes(4, "little") + part)
+        return h.digest()
+
+    def nbytes(self) -> int:
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.text)
+            + sys.getsizeof(self.offsets)
+            + sys.getsizeof(self.para_refs)
+            + sys.getsizeof(self.sections)
+            + sum(s.nbytes() for s in self.sections.values())
+            + (sys.getsizeof(self.og_image) if self.og_image else 0)
+        )
+
+    def memory_report(self) -> Dict[str, object]:
+        total = self.nbytes()
+        return {
+            "bytes": total,
+            "sections": len(self.sections),
+            "paragraphs": len(self.offsets) - 1,
+            "text_bytes": len(self.text),
+            "bytes_per_section": total // len(self.sections) if self.sections else 0,
+        }
+
+
+def collect_text(paragraphs: Iterator[str], max_chars: int) -> Optional[str]:
+    """Join paragraphs until there are at least max_chars, None if there are none"""
+    collected: List[str] = []
+    total_chars = 0
+    for text in paragraphs:
+        if total_chars >= max_chars:
+            break
+        collected.append(text)
+        total_chars += len(text) + 1  # +1 for space between paragraphs
+    return " ".join(collected) if collected else None
+
+
+class _Builder:
+    def __init__(self, url: str):
+        self.index = PageIndex(url)
+        self.buffer = bytearray()
+        # id(tag) -> paragraph number, so a <p> shared by a section and the
+        # fallback is stored once
+        self.para_numbers: Dict[int, int] = {}
+
+    def paragraph_number(self, tag) -> Optional[int]:
+        key = id(tag)
+        if key not in self.para_numbers:
+            text = tag.get_text(separator=" ", strip=True)
+            if not text:
+                self.para_numbers[key] = None
+            else:
+                self.buffer += text.encode("utf-8")
+                self.index.offsets.append(len(self.buffer))
+                self.para_numbers[key] = len(self.index.offsets) - 2
+        return self.para_numbers[key]
+
+    def add_refs(self, tags) -> Tuple[int, int]:
+        start = len(self.index.para_refs)
+        for tag in tags:
+            number = self.paragraph_number(tag)
+            if number is not None:
+                self.index.para_refs.append(number)
+        return start, len(self.index.para_refs) - start
+
+    def section_paragraph_tags(self, element):
+        """<p> siblings after the element, up to the next heading"""
+        current = element.find_next_sibling()
+        while current:
+            if current.name == "p":
+                yield current
+            elif current.name in HEADINGS:
+                break
+            current = current.find_next_sibling()
+
+    def section_image(self, heading, level: int) -> Optional[str]:
+        current = heading.find_next_sibling()
+        while current:
+            # Stop at a heading of same or higher level
+            if current.name in HEADINGS and int(current.name[1]) <= level:
+                break
+            # Check for img directly or inside this element
+            if current.name == "img" and current.get("src"):
+                return resolve_image_url(current["src"], self.index.url)
+            img = current.find("img")
+            if img and img.get("src"):
+                return resolve_image_url(img["src"], self.index.url)
+            current = current.find_next_sibling()
+        return None
+
+    def add_section(self, element) -> None:
+        anchor = sys.intern(str(element["id"]))
+        key = sys.intern(anchor.lower())
+        if key in self.index.sections:
+            # Like soup.find(id=...), the first element with an id wins
+            return
+        heading, level, image = None, 0, None
+        if element.name in HEADINGS:
+            level = int(element.name[1])
+            heading = element.get_text(strip=True) or None
+            image = self.section_image(element, level)
+        start, count = self.add_refs(self.section_paragraph_tags(element))
+        digest = _digest(heading, str(level), image, *self.texts(start, count))
+        self.index.sections[key] = Section(
+            anchor, heading, level, image, start, count, digest
+        )
+
+    def texts(self, start: int, count: int) -> Iterator[str]:
+        # The buffer isn't frozen into index.text until build() finishes
+        offsets = self.index.offsets
+        for ref in self.index.para_refs[start : start + count]:
+            yield self.buffer[offsets[ref] : offsets[ref + 1]].decode("utf-8")
+
+    def build(self, soup) -> PageIndex:
+        image = soup.find("meta", property="og:image")
+        if image and image.get("content"):
+            self.index.og_image = resolve_image_url(image["content"], self.index.url)
+
+        for element in soup.find_all(id=True):
+            self.add_section(element)
+
+        # Fallback: paragraphs in the main content, or anywhere
+        article = (
+            soup.find("article")
+            or soup.find("main")
+            or soup.find("div", class_="content")
+        )
+        paragraphs = article.find_all("p") if article else soup.find_all("p")
+        self.index.fallback_start, self.index.fallback_count = self.add_refs(paragraphs)
+        self.index.fallback_digest = _digest(
+            *self.texts(self.index.fallback_start, self.index.fallback_count)
+        )
+
+        self.index.text = bytes(self.buffer)
+        return self.index
+
+
+def build_page_index(soup, url: str) -> PageIndex:
+    """Extract a PageIndex from a parsed page; the soup can be dropped after"""
+    return _Builder(url).build(soup)
+
+
+class IndexDiff(NamedTuple):
+    added: FrozenSet[str]
+    removed: FrozenSet[str]
+    changed: FrozenSet[str]
+    unchanged: FrozenSet[str]
+    # Fallback text or og:image changed; that shows up in the anchor-less
+    # preview and in sections without paragraphs/an image of their own
+    page_changed: bool
+
+    @property
+    def stale_anchors(self) -> FrozenSet[str]:
+        """Anchors whose derived data has to be recomputed"""
+        return self.added | self.removed | self.changed
+
+
+def diff_indexes(old: Optional[PageIndex], new: PageIndex) -> IndexDiff:
+    """What changed between two indexes of the same page"""
+    if old is None:
+        return IndexDiff(
+            frozenset(new.sections), frozenset(), frozenset(), frozenset(), True
+        )
+    old_anchors, new_anchors = set(old.sections), set(new.sections)
+    common = old_anchors & new_anchors
+    changed = {a for a in common if old.sections[a].digest != new.sections[a].digest}
+    return IndexDiff(
+        added=frozenset(new_anchors - old_anchors),
+        removed=frozenset(old_anchors - new_anchors),
+        changed=frozenset(changed),
+        unchanged=frozenset(common - changed),
+        page_changed=(
+            old.fallback_digest != new.fallback_digest or old.og_image != new.og_image
+        ),
+    )
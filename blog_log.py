@@ -0,0 +1,147 @@
+#!python3
+"""Structured, sampled, non-blocking logging for the request path.
+
+Events are a name plus keyword fields, e.g.
+
+    log_event("url_rejected", logging.WARNING, sample_rate=0.1, url=url)
+
+- Sampling: each call site picks a sample_rate, so noisy events (a crawler
+  sweeping bad ?path= values) log a fraction of occurrences.
+- Rate limiting: WARNING and above are capped per event name with a token
+  bucket, so an origin outage logs a few errors a minute, not one per request.
+- Non-blocking: records go on a bounded in-memory queue and a listener thread
+  formats and writes them. If the queue is full the record is dropped and
+  counted instead of stalling the request.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+LOGGER_NAME = "igor_blog"
+QUEUE_MAX_RECORDS = 10_000
+ERRORS_PER_MINUTE = 10  # per event name, for WARNING and above
+ERROR_BURST = 5
+
+stats: Counter = Counter()
+
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=QUEUE_MAX_RECORDS)
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event and the event's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts a drop instead of raising when the queue is full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default prepare() formats on the calling thread; leave that to the
+        # listener so the request thread only pays for the enqueue.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            stats["dropped"] += 1
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+_buckets: Dict[str, _TokenBucket] = {}
+
+
+def configure(handlers: Optional[Iterable[logging.Handler]] = None) -> logging.Logger:
+    """(Re)start the listener thread writing to handlers (default: JSON to stderr)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+        if handlers is None:
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(JsonFormatter())
+            handlers = [stream]
+        _listener = logging.handlers.QueueListener(
+            _queue, *handlers, respect_handler_level=True
+        )
+        _listener.start()
+
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.handlers = [_DroppingQueueHandler(_queue)]
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        return logger
+
+
+def _logger() -> logging.Logger:
+    if _listener is None:
+        return configure()
+    return logging.getLogger(LOGGER_NAME)
+
+
+def log_event(
+    event: str, level: int = logging.INFO, sample_rate: float = 1.0, **fields
+) -> None:
+    """Log a structured event, subject to sampling and error rate limits"""
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        stats["sampled_out"] += 1
+        return
+
+    if level >= logging.WARNING:
+        bucket = _buckets.get(event)
+        if bucket is None:
+            bucket = _buckets[event] = _TokenBucket(ERRORS_PER_MINUTE, ERROR_BURST)
+        if not bucket.allow():
+            stats["rate_limited"] += 1
+            return
+
+    if sample_rate < 1.0:
+        fields["sample_rate"] = sample_rate
+    stats["emitted"] += 1
+    _logger().log(level, event, extra={"fields": fields})
+
+
+def flush() -> None:
+    """Block until the listener has written everything queued so far"""
+    if _listener is not None:
+        _queue.join()
+
+
+def reset() -> None:
+    """Clear counters and rate-limit state"""
+    stats.clear()
+    _buckets.clear()
@@ -0,0 +1,260 @@
+#!python3
+"""Memory introspection for /admin/memory.
+
+- sizeof: deep size estimate of a cache, each object counted once.
+- current_rss / peak_rss: the process's resident set, now and at its peak.
+- RssSampler + RssSamplingMiddleware: RSS before and after a sample of
+  requests, and whether the request raised the process peak, for sizing
+  containers from data. RSS is per process, so with concurrent requests a
+  sample includes whatever else ran at the same time; the window shows the
+  distribution rather than blaming a single request.
+- TraceSession: tracemalloc snapshots grouped by module or line, each diffed
+  against the previous one, to see what grows between two points in time.
+
+resource and tracemalloc are imported on first use, not at cold start.
+"""
+
+import os
+import sys
+import threading
+from collections import Counter, deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+RSS_SAMPLES = 1000
+MAX_TRACE_STATS = 25
+TRACE_FRAMES = 1
+GROUP_BY = ("lineno", "filename")
+
+# Counters for the admin metrics endpoint
+stats: Counter = Counter()
+
+_ATOMIC = (str, bytes, bytearray, memoryview, int, float, bool, type(None))
+
+
+def sizeof(obj, _seen: Optional[set] = None) -> int:
+    """Bytes held by obj and everything it references, each object counted
+    once. Containers and plain objects are followed; objects with an nbytes()
+    (PageIndex, HotKeys) report their own size. An estimate: allocator
+    overhead and interned or shared strings aren't accounted for exactly."""
+    seen = set() if _seen is None else _seen
+    # Iterative, caches can nest deeper than the recursion limit allows
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        if isinstance(o, _ATOMIC):
+            total += sys.getsizeof(o)
+            continue
+        nbytes = getattr(o, "nbytes", None)
+        if callable(nbytes):
+            total += nbytes()
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif not isinstance(o, type) and hasattr(o, "__dict__"):
+            stack.append(vars(o))
+        for slot in getattr(type(o), "__slots__", ()):
+            if hasattr(o, slot):
+                stack.append(getattr(o, slot))
+    return total
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size in bytes; None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> int:
+    """The process's resident set high-water mark in bytes"""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSample(NamedTuple):
+    path: str
+    rss_before: int
+    rss_after: int
+    peak_before: int
+    peak_after: int
+
+    @property
+    def growth(self) -> int:
+        return self.rss_after - self.rss_before
+
+
+class RssSampler:
+    """The last RSS_SAMPLES request samples"""
+
+    def __init__(self, size: int = RSS_SAMPLES):
+        self.samples: deque = deque(maxlen=size)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, sample: RssSample) -> None:
+        with self._lock:
+            self.samples.append(sample)
+            self.count += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.samples.clear()
+            self.count = 0
+
+    def summary(self, top: int = 5) -> Dict[str, object]:
+        with self._lock:
+            samples = list(self.samples)
+        growth = sorted(s.growth for s in samples)
+
+        def percentile(q):
+            if not growth:
+                return None
+            return growth[min(len(growth) - 1, int(len(growth) * q / 100))]
+
+        return {
+            "count": self.count,
+            "max_rss_bytes": max((s.rss_after for s in samples), default=None),
+            "growth_p50_bytes": percentile(50),
+            "growth_p95_bytes": percentile(95),
+            "growth_max_bytes": growth[-1] if growth else None,
+            # Requests during which the process reached a new peak
+            "raised_peak": sum(s.peak_after > s.peak_before for s in samples),
+            "largest": [
+                {"path": s.path, "growth_bytes": s.growth, "rss_bytes": s.rss_after}
+                for s in sorted(samples, key=lambda s: -s.growth)[:top]
+            ],
+        }
+
+
+class RssSamplingMiddleware:
+    """ASGI middleware: record RSS around the requests sample(scope) picks"""
+
+    def __init__(self, app, sample: Callable[[dict], bool], sampler: RssSampler):
+        self.app = app
+        self.sample = sample
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.sample(scope):
+            return await self.app(scope, receive, send)
+        rss_before, peak_before = current_rss(), peak_rss()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            rss_after = current_rss()
+            if rss_before is not None and rss_after is not None:
+                self.sampler.record(
+                    RssSample(
+                        scope["path"], rss_before, rss_after, peak_before, peak_rss()
+                    )
+                )
+            else:
+                stats["rss_unavailable"] += 1
+
+
+def _where(frame) -> str:
+    # site-packages/bs4/element.py:1234 -> bs4/element.py:1234
+    parts = frame.filename.replace(os.sep, "/").split("/")
+    return f"{'/'.join(parts[-2:])}:{frame.lineno}"
+
+
+class TraceSession:
+    """tracemalloc, started and stopped on demand; each snapshot is diffed
+    against the previous one"""
+
+    def __init__(self):
+        self.previous = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tracing() -> bool:
+        if "tracemalloc" not in sys.modules:
+            return False
+        return sys.modules["tracemalloc"].is_tracing()
+
+    def start(self, frames: int = TRACE_FRAMES) -> Dict[str, object]:
+        import tracemalloc
+
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.previous = None
+                stats["trace_started"] += 1
+        return self.status()
+
+    def stop(self) -> Dict[str, object]:
+        import tracemalloc
+
+        with self._lock:
+            tracemalloc.stop()
+            self.previous = None
+        return self.status()
+
+    def status(self) -> Dict[str, object]:
+        if not self.tracing():
+            return {"tracing": False}
+        import tracemalloc
+
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        }
+
+    def snapshot(
+        self, group_by: str = "lineno", limit: int = MAX_TRACE_STATS
+    ) -> Dict[str, object]:
+        """Largest allocation sites now, and the biggest changes since the
+        previous snapshot. group_by is "lineno" (module and line) or
+        "filename" (module)."""
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by is one of {GROUP_BY}")
+        if not self.tracing():
+            return self.status()
+        import tracemalloc
+
+        # Leave out tracemalloc's own allocations and import machinery
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ]
+        )
+        with self._lock:
+            previous, self.previous = self.previous, snapshot
+        stats["snapshots"] += 1
+
+        top: List[Dict[str, object]] = [
+            {"where": _where(s.traceback[0]), "bytes": s.size, "count": s.count}
+            for s in snapshot.statistics(group_by)[:limit]
+        ]
+        report: Dict[str, object] = {**self.status(), "group_by": group_by, "top": top}
+        if previous is not None:
+            report["diff"] = [
+                {
+                    "where": _where(d.traceback[0]),
+                    "bytes": d.size,
+                    "bytes_diff": d.size_diff,
+                    "count_diff": d.count_diff,
+                }
+                for d in snapshot.compare_to(previous, group_by)[:limit]
+                if d.size_diff or d.count_diff
+            ]
+        return report
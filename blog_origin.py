@@ -0,0 +1,350 @@
+#!python3
+"""Guards around fetches from the blog origin (idvork.in).
+
+- CircuitBreaker: after enough consecutive failures a host is treated as down
+  and fetches fail fast, until a single trial request is let through.
+- Deadline: one latency budget per request, shared by every fetch made while
+  serving it, so several sequential lookups can't add up past what unfurl
+  bots are willing to wait.
+- LatencyWindow: recent latencies of one kind of operation, for percentiles.
+- hedged_call: if a fetch is slower than usual, race a second one against it.
+- OriginScheduler: every fetch takes a slot, under a global and a per-host
+  cap. Request-path fetches come first: background work (refresh) only gets
+  a slot while no request-path fetch is waiting for one.
+"""
+
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+FOREGROUND = "foreground"  # serving a request
+BACKGROUND = "background"  # refresh and other work nobody is waiting on
+PRIORITIES = (FOREGROUND, BACKGROUND)
+
+# Counters for the admin metrics endpoint
+stats: Counter = Counter()
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a fetch may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_seconds:
+                    return False
+                # Cool-down over: let one trial request through
+                self.state = self.HALF_OPEN
+                return True
+            # HALF_OPEN: a trial is already in flight
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker()
+        return breaker
+
+
+def breaker_snapshots() -> Dict[str, Dict[str, object]]:
+    return {host: b.snapshot() for host, b in _breakers.items()}
+
+
+class Deadline:
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "request_deadline", default=None
+)
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Share one latency budget across every fetch made inside the block"""
+    deadline = Deadline(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def fetch_timeout(default: float) -> Optional[float]:
+    """Timeout for the next fetch: default, capped by the request's remaining
+    budget. None means the budget is spent and the fetch shouldn't happen."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        return None
+    return min(default, remaining)
+
+
+_current_priority: ContextVar[str] = ContextVar("origin_priority", default=FOREGROUND)
+
+
+@contextmanager
+def background_work():
+    """Fetches made inside the block yield to request-path fetches"""
+    token = _current_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+class LatencyWindow:
+    """The last `size` latencies (seconds) of one operation"""
+
+    def __init__(self, size: int = 1000):
+        self.samples: deque = deque(maxlen=size)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q in [0, 100]; None until there are samples"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q / 100))
+        return ordered[index]
+
+    def clear(self) -> None:
+        self.samples.clear()
+        self.count = 0
+
+    def summary(self) -> Dict[str, object]:
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        return {
+            "count": self.count,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+        }
+
+
+def hedged_call(
+    primary: Callable[[], T],
+    hedge: Optional[Callable[[], T]],
+    delay: float,
+    pool: Executor,
+) -> T:
+    """Run primary; if it hasn't finished after delay seconds, start hedge too
+    and return whichever finishes first without raising. If both raise, the
+    primary's exception is raised. The loser is left to finish on its own."""
+    first = pool.submit(primary)
+    if hedge is None or wait([first], timeout=delay).done:
+        return first.result()
+
+    stats["hedges_fired"] += 1
+    second = pool.submit(hedge)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    stats["hedges_won"] += 1
+                return future.result()
+    return first.result()
+
+
+class OriginScheduler:
+    """Slots for origin fetches: at most max_concurrency at once, and
+    max_per_host to any one host. A background fetch waits while any
+    foreground fetch is waiting, so live traffic is never queued behind
+    refresh work."""
+
+    def __init__(self, max_concurrency: int, max_per_host: int):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.active = 0
+        self.per_host: Counter = Counter()
+        self.waiting: Counter = Counter()
+        self.peak_waiting: Counter = Counter()
+        # (event, priority) -> count; events are granted and rejected
+        self.counts: Counter = Counter()
+        self.waits: Dict[str, LatencyWindow] = {p: LatencyWindow() for p in PRIORITIES}
+        self._cond = threading.Condition()
+
+    def _free(self, host: str, priority: str) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        if self.per_host[host] >= self.max_per_host:
+            return False
+        return priority == FOREGROUND or not self.waiting[FOREGROUND]
+
+    def lease(
+        self, host: str, priority: str = FOREGROUND, timeout: float = 0.0
+    ) -> Optional["SlotLease"]:
+        """A slot to host, or None if none came free within timeout seconds.
+        The slot is given back when the lease is released."""
+        start = time.perf_counter()
+        with self._cond:
+            self.waiting[priority] += 1
+            self.peak_waiting[priority] = max(
+                self.peak_waiting[priority], self.waiting[priority]
+            )
+            try:
+                granted = self._cond.wait_for(
+                    lambda: self._free(host, priority), timeout
+                )
+            finally:
+                self.waiting[priority] -= 1
+            if granted:
+                self.active += 1
+                self.per_host[host] += 1
+                self.waits[priority].record(time.perf_counter() - start)
+                self.counts["granted", priority] += 1
+            else:
+                self.counts["rejected", priority] += 1
+                # Background fetches may have been waiting on this one
+                self._cond.notify_all()
+        return SlotLease(self, host) if granted else None
+
+    def _give_back(self, host: str) -> None:
+        with self._cond:
+            self.active -= 1
+            self.per_host[host] -= 1
+            if not self.per_host[host]:
+                del self.per_host[host]
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, host: str, priority: str = FOREGROUND, timeout: float = 0.0):
+        """Hold a slot to host for the block; yields False instead if none
+        came free within timeout seconds"""
+        lease = self.lease(host, priority, timeout)
+        if lease is None:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            lease.release()
+
+    def report(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "max_per_host": self.max_per_host,
+                "per_host": dict(self.per_host),
+                "priorities": {
+                    p: {
+                        "granted": self.counts["granted", p],
+                        "rejected": self.counts["rejected", p],
+                        "waiting": self.waiting[p],
+                        "peak_waiting": self.peak_waiting[p],
+                        "wait": self.waits[p].summary(),
+                    }
+                    for p in PRIORITIES
+                },
+            }
+
+    def clear(self) -> None:
+        """Forget counts and wait times; slots in use stay counted"""
+        with self._cond:
+            self.counts.clear()
+            self.peak_waiting.clear()
+            for window in self.waits.values():
+                window.clear()
+
+
+class SlotLease:
+    """A granted slot that more than one thread can hold: hold() before handing
+    it to another thread, and every holder release()s it when done. The slot is
+    given back with the last release."""
+
+    def __init__(self, scheduler: OriginScheduler, host: str):
+        self.scheduler = scheduler
+        self.host = host
+        self.holders = 1
+        self._lock = threading.Lock()
+
+    def hold(self) -> None:
+        with self._lock:
+            self.holders += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.holders -= 1
+            last = self.holders == 0
+        if last:
+            self.scheduler._give_back(self.host)
+
+
+def reset() -> None:
+    """Close all breakers and clear counters"""
+    with _breakers_lock:
+        _breakers.clear()
+    stats.clear()
@@ -0,0 +1,209 @@
+#!python3
+"""Opt-in cProfile of single requests, kept in a small ring for /admin/profiles.
+
+ProfilingMiddleware asks a chooser whether to profile each request (an
+authenticated header, or a sampling rate). For a chosen request it sets a
+RequestProfile in a context variable; the blocking work the request hands to
+threads runs through call() or bind(), which profile it in whichever thread
+it runs, and the merged result goes into a ProfileRing. Reports are only
+sorted and formatted when /admin/profiles/{id} asks for one.
+
+cProfile only sees the thread it was enabled in, which is why the work is
+profiled at each thread entry point rather than in the middleware. For a
+request that isn't chosen the cost is the chooser plus one context variable
+lookup per thread hop; cProfile and pstats aren't even imported until the
+first profiled request.
+"""
+
+import functools
+import io
+import itertools
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, TypeVar
+
+T = TypeVar("T")
+
+MAX_PROFILES = 50
+REPORT_LINES = 40
+SORT_KEYS = ("cumulative", "tottime")
+
+# Counters for the admin metrics endpoint
+stats: Counter = Counter()
+
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar(
+    "request_profile", default=None
+)
+_thread = threading.local()
+
+
+class RequestProfile:
+    """cProfile data for one request, from every thread that worked on it"""
+
+    def __init__(self):
+        self.profilers: List[object] = []
+        # sort -> pstats text, formatted on first read
+        self._reports: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable[..., T], *args) -> T:
+        if getattr(_thread, "profiling", False):
+            # Already inside a profiled call on this thread; enabling a second
+            # profiler would silently replace the first
+            return fn(*args)
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Some other profiler is active (and from 3.12 they're global)
+            stats["busy"] += 1
+            return fn(*args)
+        _thread.profiling = True
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            _thread.profiling = False
+            with self._lock:
+                self.profilers.append(profiler)
+
+    def report(self, sort: str, lines: int = REPORT_LINES) -> str:
+        """pstats text of the merged profile in sort order (one of SORT_KEYS).
+        Sorting and formatting is slow, so it's left until someone reads it,
+        and it blocks: call it off the event loop."""
+        import pstats
+
+        with self._lock:
+            if sort in self._reports:
+                return self._reports[sort]
+            profilers = list(self.profilers)
+        text = ""
+        if profilers:
+            out = io.StringIO()
+            merged = pstats.Stats(*profilers, stream=out)
+            merged.strip_dirs().sort_stats(sort).print_stats(lines)
+            text = out.getvalue()
+        with self._lock:
+            self._reports[sort] = text
+        return text
+
+    def reports(self, lines: int = REPORT_LINES) -> Dict[str, str]:
+        """report() in every SORT_KEYS order"""
+        return {sort: self.report(sort, lines) for sort in SORT_KEYS}
+
+
+def call(fn: Callable[..., T], *args) -> T:
+    """fn(*args), profiled if the current request is being profiled"""
+    profile = _active.get()
+    if profile is None:
+        return fn(*args)
+    return profile.run(fn, *args)
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """fn, made to profile into the current request's profile in whatever
+    thread it ends up running (for pools that don't copy the context)"""
+    profile = _active.get()
+    if profile is None:
+        return fn
+    return functools.partial(profile.run, fn)
+
+
+class ProfileRecord(NamedTuple):
+    id: int
+    method: str
+    path: str
+    reason: str
+    status: Optional[int]
+    started: str
+    seconds: float
+    # Raw profile data; see RequestProfile.report()
+    profile: RequestProfile
+
+    def summary(self) -> Dict[str, object]:
+        return {k: v for k, v in self._asdict().items() if k != "profile"}
+
+
+class ProfileRing:
+    """The last MAX_PROFILES request profiles"""
+
+    def __init__(self, capacity: int = MAX_PROFILES):
+        self.records: deque = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, **fields) -> ProfileRecord:
+        with self._lock:
+            record = ProfileRecord(id=next(self._ids), **fields)
+            self.records.append(record)
+        return record
+
+    def get(self, profile_id: int) -> Optional[ProfileRecord]:
+        with self._lock:
+            return next((r for r in self.records if r.id == profile_id), None)
+
+    def summaries(self) -> List[Dict[str, object]]:
+        """Newest first"""
+        with self._lock:
+            return [r.summary() for r in reversed(self.records)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.records.clear()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: profile the requests choose(scope) returns a reason
+    for, and add them to ring"""
+
+    def __init__(
+        self,
+        app,
+        choose: Callable[[dict], Optional[str]],
+        ring: ProfileRing,
+    ):
+        self.app = app
+        self.choose = choose
+        self.ring = ring
+
+    async def __call__(self, scope, receive, send):
+        reason = self.choose(scope) if scope["type"] == "http" else None
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        stats[reason] += 1
+        profile = RequestProfile()
+        status = None
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        token = _active.set(profile)
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _active.reset(token)
+            # Only the raw profile is kept: formatting it here would hold up
+            # the event loop, and every other request with it
+            self.ring.add(
+                method=scope["method"],
+                path=scope["path"],
+                reason=reason,
+                status=status,
+                started=started.isoformat(),
+                seconds=round(time.perf_counter() - start, 4),
+                profile=profile,
+            )
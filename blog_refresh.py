@@ -0,0 +1,52 @@
+#!python3
+"""Planning for the scheduled cache refresh (the refresh_cache Modal function).
+
+Every REFRESH_MINUTES the scheduled function asks the web function to refresh
+its hottest pages. Refetching a page whose cache entry will still be fresh at
+the next run is wasted work, so plan_refresh() picks, from the top-N pages by
+hits, those that are missing, expired, or will expire before the next run.
+
+Nothing here touches Modal or the network, so it can be tested directly.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Mapping, NamedTuple, Optional
+
+REFRESH_MINUTES = 5
+REFRESH_TOP_N = 20
+
+
+class RefreshResult(NamedTuple):
+    url: str
+    ok: bool
+    seconds: float
+    # Sections added, removed or changed; None if the page couldn't be indexed
+    changed_sections: Optional[int]
+    page_changed: bool
+
+
+def plan_refresh(
+    hits: Mapping[str, int],
+    expiries: Mapping[str, datetime],
+    now: datetime,
+    top_n: int = REFRESH_TOP_N,
+    interval: timedelta = timedelta(minutes=REFRESH_MINUTES),
+) -> List[str]:
+    """Hottest-first URLs among the top_n by hits whose cache entry won't
+    last until the next refresh"""
+    hottest = sorted(hits, key=lambda url: (-hits[url], url))[:top_n]
+    next_run = now + interval
+    return [url for url in hottest if url not in expiries or expiries[url] <= next_run]
+
+
+def summarize(results: List[RefreshResult], seconds: float) -> Dict[str, object]:
+    """Totals for the refresh log line and the /admin/refresh response"""
+    return {
+        "seconds": round(seconds, 3),
+        "pages": len(results),
+        "failed": sum(not r.ok for r in results),
+        "pages_changed": sum(
+            bool(r.changed_sections) or r.page_changed for r in results if r.ok
+        ),
+        "sections_changed": sum(r.changed_sections or 0 for r in results),
+    }
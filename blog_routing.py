@@ -0,0 +1,233 @@
+#!python3
+"""Canonical (page, anchor) keys for every way a share link can arrive.
+
+The same section shows up as /manager-book/leadership, /Manager-Book/Leadership/,
+?path=manager-book%23leadership, /manager-book.html/leadership/extra and so on.
+canonical_key() maps all of those to RouteKey("manager-book", "leadership"),
+and every cache layer keys on the RouteKey so equivalent links share entries.
+
+A bare /leadership means the manager book's section, as it always has, unless
+the manager book is known not to have one. key_for_request() then asks an
+AnchorIndex (built from every indexed page) which page does.
+
+Pages and anchors are lowercased in the key, but GitHub Pages paths are
+case-sensitive: PageSpellings remembers how a request wrote a page, so the
+origin is asked for (and browsers are sent to) that spelling.
+"""
+
+import threading
+import urllib.parse
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Set
+
+BLOG_BASE_URL = "https://idvork.in"
+DEFAULT_PAGE = "manager-book"
+
+# Paths browsers and crawlers request on their own; treat them as the default page
+_DEFAULT_PATHS = {"favicon.ico", "index.html", "index.htm"}
+
+MAX_PAGE_SPELLINGS = 1024
+
+
+class RouteKey(NamedTuple):
+    page: str
+    anchor: Optional[str]
+
+    @property
+    def url(self) -> str:
+        """Blog page to fetch for this key (also the page cache key)"""
+        return f"{BLOG_BASE_URL}/{self.page}"
+
+    @property
+    def redirect_url(self) -> str:
+        # Always include # for backwards compatibility
+        return f"{self.url}#{self.anchor or ''}"
+
+    @property
+    def path(self) -> str:
+        """The ?path= form: page#anchor, or just page"""
+        return f"{self.page}#{self.anchor}" if self.anchor else self.page
+
+
+def _normalize_page(page: str, lower: bool = True) -> str:
+    page = page.strip().strip("/")
+    if lower:
+        page = page.lower()
+    for suffix in (".html", ".htm"):
+        if page.lower().endswith(suffix):
+            page = page[: -len(suffix)]
+    return page or DEFAULT_PAGE
+
+
+def _normalize_anchor(anchor: Optional[str]) -> Optional[str]:
+    if anchor is None:
+        return None
+    anchor = anchor.strip().lstrip("#").strip("/").lower()
+    return anchor or None
+
+
+def _split_path_param(path_param: str, lower: bool = True):
+    """?path= is page#anchor, page/anchor, or just page"""
+    if "#" in path_param:
+        page, anchor = path_param.split("#", 1)
+    elif "/" in path_param.strip("/"):
+        page, anchor = path_param.strip("/").split("/", 1)
+        anchor = anchor.split("/", 1)[0]
+    else:
+        page, anchor = path_param, None
+    return _normalize_page(page, lower), _normalize_anchor(anchor)
+
+
+def _split_full_path(full_path: str, lower: bool = True):
+    """URL path segments: /anchor (on the manager book), or /page/anchor[/ignored...]"""
+    if "#" in full_path:
+        # An escaped fragment, e.g. /manager-book%23leadership
+        return _split_path_param(full_path, lower)
+
+    segments = [s for s in full_path.split("/") if s.strip()]
+    if not segments or (len(segments) == 1 and segments[0].lower() in _DEFAULT_PATHS):
+        return DEFAULT_PAGE, None
+    if len(segments) == 1:
+        # Single param - for backwards compatibility, treat as manager-book anchor
+        return DEFAULT_PAGE, _normalize_anchor(segments[0])
+    # Anything past page/anchor is ignored
+    return _normalize_page(segments[0], lower), _normalize_anchor(segments[1])
+
+
+@lru_cache(maxsize=4096)
+def canonical_key(full_path: str, path_param: Optional[str] = None) -> RouteKey:
+    """Map a request's path (and optional ?path= value) to its canonical key"""
+    if path_param:
+        page, anchor = _split_path_param(urllib.parse.unquote(path_param))
+    else:
+        page, anchor = _split_full_path(urllib.parse.unquote(full_path))
+    return RouteKey(page, anchor)
+
+
+def page_as_written(full_path: str, path_param: Optional[str] = None) -> str:
+    """canonical_key()'s page before lowercasing"""
+    if path_param:
+        page, _ = _split_path_param(urllib.parse.unquote(path_param), lower=False)
+    else:
+        page, _ = _split_full_path(urllib.parse.unquote(full_path), lower=False)
+    return page
+
+
+def _is_bare_anchor(full_path: str) -> bool:
+    """Whether a path is the single-segment /anchor form"""
+    full_path = urllib.parse.unquote(full_path)
+    if "#" in full_path:
+        return False
+    segments = [s for s in full_path.split("/") if s.strip()]
+    return len(segments) == 1 and segments[0].lower() not in _DEFAULT_PATHS
+
+
+class AnchorIndex:
+    """Which pages have a section with a given anchor, for bare /anchor links.
+
+    The manager book wins whenever it has the anchor, or isn't indexed yet,
+    so links that work today keep going where they go. Otherwise the anchor
+    goes to the page that has it, the alphabetically first one if several do.
+    Built from pages already fetched, so resolving never fetches anything."""
+
+    def __init__(self, default_page: str = DEFAULT_PAGE):
+        self.default_page = default_page
+        self.anchors_by_page: Dict[str, FrozenSet[str]] = {}
+        self.pages_by_anchor: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.pages_by_anchor)
+
+    def update_page(self, page: str, anchors: Iterable[str]) -> None:
+        anchors = frozenset(anchors)
+        with self._lock:
+            self._replace(page, anchors)
+            self.anchors_by_page[page] = anchors
+
+    def remove_page(self, page: str) -> None:
+        with self._lock:
+            self._replace(page, frozenset())
+            self.anchors_by_page.pop(page, None)
+
+    def _replace(self, page: str, anchors: FrozenSet[str]) -> None:
+        old = self.anchors_by_page.get(page, frozenset())
+        for anchor in old - anchors:
+            pages = self.pages_by_anchor[anchor]
+            pages.discard(page)
+            if not pages:
+                del self.pages_by_anchor[anchor]
+        for anchor in anchors - old:
+            self.pages_by_anchor.setdefault(anchor, set()).add(page)
+
+    def page_for(self, anchor: str) -> str:
+        with self._lock:
+            default_anchors = self.anchors_by_page.get(self.default_page)
+            if default_anchors is None or anchor in default_anchors:
+                return self.default_page
+            pages = self.pages_by_anchor.get(anchor)
+            return min(pages) if pages else self.default_page
+
+    def ambiguous(self) -> int:
+        """Anchors on more than one page"""
+        with self._lock:
+            return sum(len(pages) > 1 for pages in self.pages_by_anchor.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self.anchors_by_page.clear()
+            self.pages_by_anchor.clear()
+
+
+class PageSpellings:
+    """How requests wrote pages whose path isn't all lowercase, by RouteKey
+    page. The first spelling seen is kept until forget() (say, when the origin
+    doesn't have it). At most capacity pages; the oldest goes first."""
+
+    def __init__(self, capacity: int = MAX_PAGE_SPELLINGS):
+        self.capacity = capacity
+        self.pages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def record(self, page: str, written: str) -> None:
+        if written == page or page in self.pages:
+            return
+        with self._lock:
+            if len(self.pages) >= self.capacity:
+                # Evict the oldest entry (dicts keep insertion order)
+                self.pages.pop(next(iter(self.pages)), None)
+            self.pages.setdefault(page, written)
+
+    def spell(self, page: str) -> str:
+        """page as the origin should be asked for it"""
+        return self.pages.get(page, page)
+
+    def forget(self, page: str) -> None:
+        self.pages.pop(page, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.pages.clear()
+
+
+def key_for_request(
+    request,
+    full_path: str,
+    anchors: Optional[AnchorIndex] = None,
+    spellings: Optional[PageSpellings] = None,
+) -> RouteKey:
+    """canonical_key() for a FastAPI request routed with {full_path:path}; a
+    bare /anchor goes to the page anchors says has it. The request's spelling
+    of the page goes into spellings."""
+    path_param = request.query_params.get("path") or None
+    key = canonical_key(full_path, path_param)
+    if spellings is not None:
+        spellings.record(key.page, page_as_written(full_path, path_param))
+    if anchors is None or path_param or not key.anchor:
+        return key
+    if not _is_bare_anchor(full_path):
+        return key
+    return key._replace(page=anchors.page_for(key.anchor))
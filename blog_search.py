@@ -0,0 +1,157 @@
+#!python3
+"""Full-text search over the sections of indexed blog pages.
+
+An inverted index from term to the sections containing it, fed from the same
+PageIndex the preview helpers read. Sections are (re)indexed one at a time,
+so when a page is refetched only the sections whose content changed are
+touched (see blog_index.diff_indexes).
+
+Ranking is BM25, with heading terms counted HEADING_WEIGHT times; every query
+term has to match.
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from blog_index import PageIndex
+
+HEADING_WEIGHT = 3
+SNIPPET_CHARS = 200
+MAX_QUERY_TERMS = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+
+# (page, anchor)
+DocId = Tuple[str, str]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class SearchHit(NamedTuple):
+    page: str
+    anchor: str
+    heading: Optional[str]
+    snippet: str
+    score: float
+
+
+class _Doc(NamedTuple):
+    heading: Optional[str]
+    snippet: str
+    length: int
+    terms: Tuple[str, ...]
+
+
+class SearchIndex:
+    def __init__(self):
+        # term -> {doc: weighted term frequency}
+        self.postings: Dict[str, Dict[DocId, int]] = {}
+        self.docs: Dict[DocId, _Doc] = {}
+        self.anchors_by_page: Dict[str, Set[str]] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def update_page(
+        self, page: str, index: PageIndex, anchors: Optional[Iterable[str]] = None
+    ) -> None:
+        """(Re)index the given anchors of a page, all of them if None. Anchors
+        no longer on the page are removed."""
+        with self._lock:
+            if anchors is None:
+                anchors = set(index.sections) | self.anchors_by_page.get(page, set())
+            for anchor in anchors:
+                self._remove(page, anchor)
+                if anchor in index.sections:
+                    self._add(page, anchor, index)
+
+    def remove_page(self, page: str) -> None:
+        with self._lock:
+            for anchor in list(self.anchors_by_page.get(page, ())):
+                self._remove(page, anchor)
+
+    def _add(self, page: str, anchor: str, index: PageIndex) -> None:
+        section = index.sections[anchor]
+        text = " ".join(index.section_paragraphs(section))
+        counts = Counter(tokenize(text))
+        for term in tokenize(section.heading or ""):
+            counts[term] += HEADING_WEIGHT
+        if not counts:
+            return
+
+        doc = (page, anchor)
+        length = sum(counts.values())
+        snippet = text
+        if len(text) > SNIPPET_CHARS:
+            snippet = text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
+        self.docs[doc] = _Doc(section.heading, snippet, length, tuple(counts))
+        self.anchors_by_page.setdefault(page, set()).add(anchor)
+        self.total_length += length
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc] = count
+
+    def _remove(self, page: str, anchor: str) -> None:
+        doc = (page, anchor)
+        old = self.docs.pop(doc, None)
+        if old is None:
+            return
+        self.total_length -= old.length
+        self.anchors_by_page[page].discard(anchor)
+        for term in old.terms:
+            posting = self.postings[term]
+            del posting[doc]
+            if not posting:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int = 10) -> List[SearchHit]:
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        with self._lock:
+            postings = [self.postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            n = len(self.docs)
+            avg_length = self.total_length / n
+            # Smallest posting list first, intersect against the rest
+            postings.sort(key=len)
+            scores: Dict[DocId, float] = {}
+            for doc in postings[0]:
+                if not all(doc in p for p in postings[1:]):
+                    continue
+                length_norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * self.docs[doc].length / avg_length
+                )
+                score = 0.0
+                for posting in postings:
+                    tf = posting[doc]
+                    idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                    score += idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+                scores[doc] = score
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return [
+                SearchHit(
+                    page,
+                    anchor,
+                    self.docs[(page, anchor)].heading,
+                    self.docs[(page, anchor)].snippet,
+                    round(score, 4),
+                )
+                for (page, anchor), score in ranked[:limit]
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.postings.clear()
+            self.docs.clear()
+            self.anchors_by_page.clear()
+            self.total_length = 0
@@ -0,0 +1,155 @@
+#!python3
+"""Shadow comparison of a candidate extraction engine against the current one.
+
+An engine turns a page's HTML into what a preview is built from:
+
+    engine(html, url, anchor, max_chars) -> Extraction (or a tuple or dict
+                                            with the same fields)
+
+The current engine is modal_redirect.extract_from_html (BeautifulSoup plus
+the section index). A candidate is named "module:function" in SHADOW_ENGINE.
+On a sample of live requests both run on the page the request just used, off
+the request path, and ShadowStore keeps the counts, mismatch rates, latency
+of each engine and the most recent mismatching outputs.
+"""
+
+import importlib
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from blog_origin import LatencyWindow
+
+MAX_MISMATCHES = 200
+
+
+class Extraction(NamedTuple):
+    description: Optional[str]
+    heading: Optional[str]
+    section_image: Optional[str]
+    page_image: Optional[str]
+
+
+def as_extraction(result) -> Extraction:
+    if isinstance(result, dict):
+        return Extraction(**result)
+    return Extraction(*result)
+
+
+@lru_cache(maxsize=None)
+def load_engine(spec: str) -> Callable[..., object]:
+    """The engine function named by "module:function" """
+    module_name, _, function = spec.partition(":")
+    if not module_name or not function:
+        raise ValueError(f"engine should be module:function, not {spec!r}")
+    return getattr(importlib.import_module(module_name), function)
+
+
+class Mismatch(NamedTuple):
+    at: str
+    page: str
+    anchor: Optional[str]
+    # field -> [current, candidate], only for the fields that differ
+    fields: Dict[str, List[Optional[str]]]
+    current_ms: float
+    candidate_ms: float
+
+
+class ShadowStore:
+    """Comparison results; the mismatch list keeps the newest MAX_MISMATCHES"""
+
+    def __init__(self, capacity: int = MAX_MISMATCHES):
+        self.mismatches: deque = deque(maxlen=capacity)
+        self.counts: Counter = Counter()
+        # Comparisons where the field differed
+        self.field_mismatches: Counter = Counter()
+        self.current_latency = LatencyWindow()
+        self.candidate_latency = LatencyWindow()
+        # candidate - current, per comparison
+        self.latency_delta = LatencyWindow()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        page: str,
+        anchor: Optional[str],
+        current: Extraction,
+        candidate: Extraction,
+        current_seconds: float,
+        candidate_seconds: float,
+    ) -> Optional[Mismatch]:
+        fields = {
+            field: [ours, theirs]
+            for field, ours, theirs in zip(Extraction._fields, current, candidate)
+            if ours != theirs
+        }
+        with self._lock:
+            self.counts["comparisons"] += 1
+            self.current_latency.record(current_seconds)
+            self.candidate_latency.record(candidate_seconds)
+            self.latency_delta.record(candidate_seconds - current_seconds)
+            if not fields:
+                return None
+            self.counts["mismatches"] += 1
+            self.field_mismatches.update(fields.keys())
+            mismatch = Mismatch(
+                datetime.now().isoformat(),
+                page,
+                anchor,
+                fields,
+                round(current_seconds * 1000, 2),
+                round(candidate_seconds * 1000, 2),
+            )
+            self.mismatches.append(mismatch)
+        return mismatch
+
+    def record_error(self, page: str, anchor: Optional[str], error: Exception) -> None:
+        with self._lock:
+            self.counts["candidate_errors"] += 1
+            self.mismatches.append(
+                Mismatch(
+                    datetime.now().isoformat(),
+                    page,
+                    anchor,
+                    {"error": [None, repr(error)]},
+                    0.0,
+                    0.0,
+                )
+            )
+
+    def report(self, recent: int = 20) -> Dict[str, object]:
+        with self._lock:
+            comparisons = self.counts["comparisons"]
+
+            def rate(n):
+                return round(n / comparisons, 4) if comparisons else None
+
+            return {
+                "comparisons": comparisons,
+                "mismatches": self.counts["mismatches"],
+                "candidate_errors": self.counts["candidate_errors"],
+                "mismatch_rate": rate(self.counts["mismatches"]),
+                "field_mismatch_rates": {
+                    field: rate(self.field_mismatches[field])
+                    for field in Extraction._fields
+                },
+                "latency": {
+                    "current": self.current_latency.summary(),
+                    "candidate": self.candidate_latency.summary(),
+                    "delta": self.latency_delta.summary(),
+                },
+                "recent_mismatches": [
+                    m._asdict() for m in list(self.mismatches)[-recent:][::-1]
+                ],
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.mismatches.clear()
+            self.counts.clear()
+            self.field_mismatches.clear()
+            self.current_latency.clear()
+            self.candidate_latency.clear()
+            self.latency_delta.clear()
@@ -0,0 +1,189 @@
+#!python3
+"""Short share links served by this service, replacing the tinyurl.com hop.
+
+Each canonical (page, anchor) gets a short base62 code derived from a hash of
+its ?path= form, so a key gets the same code on every container and deploy.
+On the rare collision the code is lengthened one character at a time, and
+whichever key claimed the shorter code first keeps it.
+
+Code -> path mappings live in a backend that outlives the container (a
+modal.Dict in production, a plain dict locally and in tests). Every container
+keeps the table in memory: resolving a code it has seen costs a dict lookup,
+and a code minted by another container costs one backend read. Codes the
+backend doesn't have are remembered for a while, so scanners probing random
+codes don't cost a backend read each.
+"""
+
+import hashlib
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from blog_routing import RouteKey, canonical_key
+
+CODE_LENGTH = 6  # 62**6 is ~57 billion codes
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_MAX_CODE_LENGTH = 22  # every base62 digit of a 128 bit hash
+
+# Unknown codes: short enough that a code minted elsewhere resolves soon
+UNKNOWN_CODE_TTL_SECONDS = 60.0
+MAX_UNKNOWN_CODES = 10_000
+
+stats: Counter = Counter()
+
+
+def _full_code(key: RouteKey) -> str:
+    n = int.from_bytes(
+        hashlib.blake2b(key.path.encode(), digest_size=16).digest(), "big"
+    )
+    digits = []
+    while n:
+        n, digit = divmod(n, 62)
+        digits.append(_ALPHABET[digit])
+    return "".join(digits).ljust(_MAX_CODE_LENGTH, _ALPHABET[0])
+
+
+def _is_code(code: str) -> bool:
+    return CODE_LENGTH <= len(code) <= _MAX_CODE_LENGTH and all(
+        c in _ALPHABET for c in code
+    )
+
+
+class MemoryBackend:
+    """Mapping store for local runs and tests"""
+
+    def __init__(self):
+        self.data: Dict[str, str] = {}
+
+    def get(self, code: str) -> Optional[str]:
+        return self.data.get(code)
+
+    def put_if_absent(self, code: str, path: str) -> bool:
+        return self.data.setdefault(code, path) == path
+
+    def items(self) -> Iterable[Tuple[str, str]]:
+        return list(self.data.items())
+
+
+class ModalDictBackend:
+    """Mapping store in a modal.Dict, shared by every container"""
+
+    def __init__(self, name: str):
+        import modal
+
+        self.dict = modal.Dict.from_name(name, create_if_missing=True)
+
+    def get(self, code: str) -> Optional[str]:
+        return self.dict.get(code)
+
+    def put_if_absent(self, code: str, path: str) -> bool:
+        if self.dict.put(code, path, skip_if_exists=True):
+            return True
+        # Another container got there first; fine if it stored the same key
+        return self.dict.get(code) == path
+
+    def items(self) -> Iterable[Tuple[str, str]]:
+        return list(self.dict.items())
+
+
+class ShortLinks:
+    def __init__(self, backend, base_url: str):
+        self.backend = backend
+        self.base_url = base_url.rstrip("/")
+        self.keys: Dict[str, RouteKey] = {}
+        self.codes: Dict[RouteKey, str] = {}
+        # code -> time.monotonic() until which it's known not to exist
+        self.unknown: Dict[str, float] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _remember(self, code: str, path: str) -> RouteKey:
+        key = canonical_key("", path)
+        self.keys[code] = key
+        # Keep the shortest code if a key somehow has several
+        if len(code) < len(self.codes.get(key, code + "_")):
+            self.codes[key] = code
+        return key
+
+    def load(self) -> None:
+        """Read every mapping from the backend, once"""
+        with self._lock:
+            if self._loaded:
+                return
+            for code, path in self.backend.items():
+                self._remember(code, path)
+            self._loaded = True
+
+    def code_for(self, key: RouteKey) -> str:
+        """The key's code, minted and stored if it doesn't have one yet. The
+        backend is written outside the lock, so a slow store doesn't hold up
+        lookups of codes already in memory."""
+        code = self.codes.get(key)
+        if code is not None:
+            return code
+        self.load()
+        full_code = _full_code(key)
+        for length in range(CODE_LENGTH, _MAX_CODE_LENGTH + 1):
+            code = full_code[:length]
+            with self._lock:
+                if key in self.codes:
+                    return self.codes[key]
+                taken_by = self.keys.get(code)
+            if taken_by is None:
+                # put_if_absent is atomic in the backend: of two containers
+                # (or threads) minting the same code, the first key keeps it
+                if self.backend.put_if_absent(code, key.path):
+                    with self._lock:
+                        stats["created"] += 1
+                        self._remember(code, key.path)
+                        self.unknown.pop(code, None)
+                    return code
+                path = self.backend.get(code)
+                with self._lock:
+                    taken_by = self._remember(code, path)
+            if taken_by == key:
+                return code
+            stats["collisions"] += 1
+        raise RuntimeError(f"No free short code for {key.path}")
+
+    def url_for(self, key: RouteKey) -> str:
+        return f"{self.base_url}/{self.code_for(key)}"
+
+    def minted_url(self, key: RouteKey) -> Optional[str]:
+        """The key's short link if this container knows its code; never mints"""
+        code = self.codes.get(key)
+        return f"{self.base_url}/{code}" if code is not None else None
+
+    def resolve(self, code: str) -> Optional[RouteKey]:
+        """Key for a code; None for codes nobody minted"""
+        key = self.keys.get(code)
+        if key is None and _is_code(code) and not self._known_unknown(code):
+            # Possibly minted by another container since this one loaded
+            path = self.backend.get(code)
+            with self._lock:
+                if path is not None:
+                    key = self._remember(code, path)
+                else:
+                    self._remember_unknown(code)
+        stats["resolved" if key else "unknown"] += 1
+        return key
+
+    def _known_unknown(self, code: str) -> bool:
+        expires_at = self.unknown.get(code)
+        if expires_at is None:
+            return False
+        if time.monotonic() < expires_at:
+            stats["unknown_cached"] += 1
+            return True
+        self.unknown.pop(code, None)
+        return False
+
+    def _remember_unknown(self, code: str) -> None:
+        if len(self.unknown) >= MAX_UNKNOWN_CODES:
+            # Evict the oldest entry (dicts keep insertion order)
+            self.unknown.pop(next(iter(self.unknown)), None)
+        self.unknown[code] = time.monotonic() + UNKNOWN_CODE_TTL_SECONDS
@@ -0,0 +1,102 @@
+#!python3
+"""Versioned snapshots of the in-memory caches, so a new deploy starts warm.
+
+A snapshot file is
+
+    MAGIC, one JSON header line ({"schema": ..., "created": ..., counts}),
+    zlib-compressed pickle of the state dict
+
+The header can be checked without unpickling anything. A snapshot written
+with a different SCHEMA_VERSION is rejected as a whole; what survives a
+matching one (entries still inside their TTL, renders whose content digest
+still matches) is up to the caller.
+
+Snapshots are only ever read from storage this service writes itself.
+"""
+
+import json
+import os
+import pickle
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Bump when PageIndex/Section, page cache entries, the rendered HTML or the
+# state dict change shape, so a deploy doesn't load state the new code can't use
+SCHEMA_VERSION = 3
+MAGIC = b"IGORSNAP\n"
+FILE_NAME = "cache.snapshot"
+ZLIB_LEVEL = 6
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def encode(state: Dict[str, object], created: datetime, **counts) -> bytes:
+    header = {"schema": SCHEMA_VERSION, "created": created.isoformat(), **counts}
+    payload = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), ZLIB_LEVEL)
+    return MAGIC + json.dumps(header).encode() + b"\n" + payload
+
+
+def decode(data: bytes) -> Tuple[Dict[str, object], Dict[str, object]]:
+    """(header, state); SnapshotError if it isn't a snapshot of this schema"""
+    if not data.startswith(MAGIC):
+        raise SnapshotError("not a cache snapshot")
+    header_line, _, payload = data[len(MAGIC) :].partition(b"\n")
+    try:
+        header = json.loads(header_line)
+    except ValueError as e:
+        raise SnapshotError(f"bad header: {e}") from e
+    if header.get("schema") != SCHEMA_VERSION:
+        raise SnapshotError(f"schema {header.get('schema')}, expected {SCHEMA_VERSION}")
+    try:
+        state = pickle.loads(zlib.decompress(payload))
+    except Exception as e:
+        raise SnapshotError(f"bad payload: {e!r}") from e
+    return header, state
+
+
+class LocalDiskBackend:
+    """Snapshot file in a local directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, FILE_NAME)
+
+    def write(self, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so readers never see a half-written snapshot
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def read(self) -> Optional[bytes]:
+        try:
+            with open(self.path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class ModalVolumeBackend(LocalDiskBackend):
+    """Snapshot file on a mounted modal.Volume, shared across deploys"""
+
+    def __init__(self, directory: str, volume):
+        super().__init__(directory)
+        self.volume = volume
+
+    def write(self, data: bytes) -> None:
+        super().write(data)
+        self.volume.commit()
+
+    def read(self) -> Optional[bytes]:
+        # Pick up snapshots committed by other containers since mounting
+        self.volume.reload()
+        return super().read()
@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _reset_redirect_caches(monkeypatch, tmp_path):
+    """Start every test with empty caches so mocked pages don't leak between tests,
+    a fresh in-memory short link store and no shared render bundle"""
+    import modal_redirect
+    from blog_bundle import BundleReader
+    from blog_shortlinks import MemoryBackend, ShortLinks
+
+    modal_redirect.reset_caches()
+    monkeypatch.setattr(
+        modal_redirect,
+        "short_links",
+        ShortLinks(MemoryBackend(), f"{modal_redirect.SERVICE_URL}/s"),
+    )
+    bundle_path = str(tmp_path / "rendered.bundle")
+    monkeypatch.setattr(modal_redirect, "BUNDLE_PATH", bundle_path)
+    monkeypatch.setattr(modal_redirect, "render_bundle", BundleReader(bundle_path))
+    yield
@@ -0,0 +1,88 @@
+#!python3
+"""Cold-import profile of modal_redirect.
+
+A Modal container has already imported `modal` before it loads our module, so
+this measures what `import modal_redirect` costs on top of that: wall time, the
+set of newly loaded modules, and the slowest imports from `-X importtime`.
+
+    python import_profile.py        # or: just import-profile
+"""
+
+import json
+import subprocess
+import sys
+from typing import List, NamedTuple, Set, Tuple
+
+_MARKER = "--- modal_redirect import starts here ---"
+
+# Runs in a fresh interpreter so nothing is already cached in sys.modules
+_CHILD_SCRIPT = f"""
+import json, sys, time
+import modal
+print({_MARKER!r}, file=sys.stderr, flush=True)
+before = set(sys.modules)
+start = time.perf_counter()
+import modal_redirect
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+class ImportProfile(NamedTuple):
+    seconds: float
+    modules: Set[str]
+    # (cumulative microseconds, module name), slowest first
+    slowest: List[Tuple[int, str]]
+
+    @property
+    def top_level_packages(self) -> Set[str]:
+        return {m.split(".")[0] for m in self.modules}
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[int, str]]:
+    """Parse `-X importtime` lines logged after the marker"""
+    _, _, after = stderr.partition(_MARKER)
+    rows = []
+    for line in after.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            rows.append((int(cumulative), name.strip()))
+        except ValueError:
+            # Header row ("self [us] | cumulative | imported package")
+            continue
+    return sorted(rows, reverse=True)
+
+
+def measure() -> ImportProfile:
+    """Import modal_redirect in a fresh interpreter and profile it"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return ImportProfile(
+        seconds=result["seconds"],
+        modules=set(result["modules"]),
+        slowest=_parse_importtime(proc.stderr),
+    )
+
+
+def report(profile: ImportProfile, top: int = 15) -> str:
+    lines = [
+        f"import modal_redirect: {profile.seconds * 1000:.1f} ms, "
+        f"{len(profile.modules)} new modules",
+        f"packages: {', '.join(sorted(profile.top_level_packages))}",
+        "",
+        f"{'cumulative ms':>14}  module",
+    ]
+    for cumulative_us, name in profile.slowest[:top]:
+        lines.append(f"{cumulative_us / 1000:>14.1f}  {name}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(report(measure()))
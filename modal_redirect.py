@@ -1,26 +1,329 @@
 #!python3
+import asyncio
+import contextvars
+import importlib
+import itertools
+import logging
+import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
+import time
 import urllib.parse
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
+from modal import App, Image, Period, Secret, Volume, asgi_app, is_local
+
+import blog_log
+import blog_memory
+import blog_origin
+import blog_profile
+import blog_snapshot
+from blog_admission import AdmissionController, AdmissionMiddleware, classify
+from blog_bundle import INDEXES, BundleEntry, BundleReader, write_bundle
+from blog_hotkeys import HotKeys
+from blog_index import (
+    IndexDiff,
+    PageIndex,
+    Section,
+    build_page_index,
+    collect_text,
+    diff_indexes,
+)
+from blog_log import log_event
+from blog_memory import RssSampler, RssSamplingMiddleware, TraceSession, sizeof
+from blog_origin import (
+    LatencyWindow,
+    OriginScheduler,
+    SlotLease,
+    background_work,
+    breaker_for,
+    breaker_snapshots,
+    current_priority,
+    fetch_timeout,
+    hedged_call,
+    request_deadline,
+)
+from blog_origin import stats as origin_stats
+from blog_profile import ProfileRing, ProfilingMiddleware
+from blog_refresh import (
+    REFRESH_MINUTES,
+    REFRESH_TOP_N,
+    RefreshResult,
+    plan_refresh,
+    summarize,
+)
+from blog_routing import (
+    DEFAULT_PAGE,
+    AnchorIndex,
+    PageSpellings,
+    RouteKey,
+    key_for_request,
+)
+from blog_search import SearchIndex
+from blog_shortlinks import MemoryBackend, ModalDictBackend, ShortLinks
+from blog_snapshot import LocalDiskBackend, ModalVolumeBackend, SnapshotError
+
+
+# Lazy imports
+# requests and bs4 add ~190 modules to a cold import, and a cold container has
+# to pay that before it can answer its first request. They are only needed on
+# a cache miss (fetch + parse), so load them the first time they're used.
+# test_import_budget.py enforces this.
+class _LazyModule:
+    """Module stand-in that imports the real module on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
 
-# import asyncio
-from typing import Dict, Optional, Tuple
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+requests = _LazyModule("requests")
+
+
+def BeautifulSoup(markup, features):
+    from bs4 import BeautifulSoup as _BeautifulSoup
+
+    return _BeautifulSoup(markup, features)
 
-import requests
-from bs4 import BeautifulSoup
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse
-from icecream import ic
-from modal import App, Image, asgi_app
 
 # Constants
 DEFAULT_PREVIEW_MAX_CHARS = 400
 DEFAULT_PREVIEW_IMAGE = "https://github.com/idvorkin/blob/raw/master/idvorkin-bunny-ears-ar-2020-with-motto-1200-628.png"
 ALLOWED_DOMAINS = ["idvork.in", "www.idvork.in"]
 REQUEST_TIMEOUT = 5
+# Total time one request may spend waiting on the origin, across all its
+# fetches. Unfurl bots give up after a few seconds; past this budget we answer
+# with whatever we have (cached page or a title derived from the URL).
+REQUEST_DEADLINE_SECONDS = 3.0
 CACHE_TTL_MINUTES = 15  # Cache pages for 15 minutes
 
-# Cache for webpage HTML: key = url, value = (html_content, expiry_time)
-page_cache: Dict[str, Tuple[str, datetime]] = {}
+# How page_cache stores bodies: "none" (str), "zlib" or "zstd" (compressed
+# UTF-8, decompressed only to rebuild a page's section index). Blog pages
+# compress ~5x; zstd falls back to zlib if no zstd module is installed.
+PAGE_CACHE_COMPRESSION = os.environ.get("PAGE_CACHE_COMPRESSION", "none")
+ZLIB_LEVEL = 6
+
+# Public URL of this service; share links are {SERVICE_URL}/s/{code}
+SERVICE_URL = os.environ.get(
+    "REDIRECT_SERVICE_URL", "https://idvorkin--igor-blog-fastapi-app.modal.run"
+)
+# modal.Dict holding short code -> page#anchor, shared across containers
+SHORT_LINK_DICT = "igor-blog-short-links"
+
+# Cache snapshots (see blog_snapshot): written by /admin/snapshot after every
+# scheduled refresh, loaded when a container starts. On Modal the directory
+# is the igor-blog-snapshots volume.
+SNAPSHOT_DIR = os.environ.get("REDIRECT_SNAPSHOT_DIR", "/snapshots")
+SNAPSHOT_VOLUME = "igor-blog-snapshots"
+
+# Read-only bundle of current renders (see blog_bundle), memory-mapped by every
+# worker process in a container so they share one copy and skip each other's
+# fetch/parse/render work. Rewritten after every scheduled refresh. It also
+# carries each indexed page's (page cache entry, PageIndex), pickled, for
+# workers to load at startup, so blog_bundle only reads it from a directory
+# private to this user.
+BUNDLE_PATH = os.environ.get(
+    "REDIRECT_BUNDLE_PATH",
+    os.path.join(tempfile.gettempdir(), f"igor-blog-{os.getuid()}", "rendered.bundle"),
+)
+
+# /admin/* endpoints require this token in the X-Admin-Token header, and are
+# disabled when it isn't set. On Modal it comes from the igor-blog-admin secret.
+ADMIN_TOKEN = os.environ.get("REDIRECT_ADMIN_TOKEN")
+
+# Request profiling (see blog_profile): requests carrying the admin token in
+# an X-Profile header are always profiled, and this fraction of all others.
+# Profiles are listed at /admin/profiles.
+PROFILE_SAMPLE_RATE = float(os.environ.get("REDIRECT_PROFILE_SAMPLE_RATE", "0"))
+
+# Fraction of requests whose RSS is sampled before and after (see blog_memory),
+# reported at /admin/memory
+MEMORY_SAMPLE_RATE = float(os.environ.get("REDIRECT_MEMORY_SAMPLE_RATE", "0.01"))
+
+# Log sampling: rejected URLs are mostly crawlers probing junk paths, so keep
+# a sample. Fetch and parse errors are always logged, but rate limited.
+LOG_SAMPLE_RATE_REJECTED_URL = 0.05
+LOG_SAMPLE_RATE_EXTRACTION_MISS = 0.01
+
+MAX_RENDERED_ENTRIES = 2000
+MAX_INDEXED_PAGES = 500
+MAX_CACHED_PAGES = 500
+# When a cache is full, the least requested of its EVICTION_SAMPLE oldest
+# entries is evicted, so hot links survive a crawler sweeping cold ones
+EVICTION_SAMPLE = 8
+LOOKUP_WORKERS = 8
+
+# Negative cache: scanners and mistyped links would otherwise refetch a
+# missing page (or reparse for a missing anchor) on every hit
+NEGATIVE_CACHE_TTL = timedelta(minutes=5)  # upstream 404s and missing anchors
+FETCH_FAILURE_TTL = timedelta(seconds=30)  # timeouts, 5xx, connection errors
+MAX_NEGATIVE_ENTRIES = 10_000
+
+# Hedging: when an origin fetch hasn't answered within the HEDGE_PERCENTILE
+# latency of recent fetches, send the same request to the other host name and
+# take whichever answers first. Both names serve the same site.
+ORIGIN_HEDGING = os.environ.get("ORIGIN_HEDGING", "on") == "on"
+HEDGE_HOSTS = {"idvork.in": "www.idvork.in", "www.idvork.in": "idvork.in"}
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # below this, wait HEDGE_DEFAULT_DELAY
+HEDGE_DEFAULT_DELAY = 0.3
+HEDGE_MIN_DELAY = 0.05
+HEDGE_WORKERS = 16
+
+# Origin fetches in flight, in total and per host (see OriginScheduler).
+# Refresh work only gets a slot while no request is waiting for one.
+ORIGIN_MAX_CONCURRENCY = int(os.environ.get("ORIGIN_MAX_CONCURRENCY", "8"))
+ORIGIN_MAX_PER_HOST = int(os.environ.get("ORIGIN_MAX_PER_HOST", "4"))
+
+# Origin fixtures (see blog_fixtures): "record" saves every origin response,
+# "replay" serves them from ORIGIN_FIXTURE_DIR instead of the network
+ORIGIN_FIXTURES = os.environ.get("ORIGIN_FIXTURES", "off")
+ORIGIN_FIXTURE_DIR = os.environ.get("ORIGIN_FIXTURE_DIR", "fixtures/origin")
+
+# Shadow mode (see blog_shadow): a candidate extraction engine, as
+# "module:function", compared with the current one on this fraction of
+# requests. Off unless SHADOW_ENGINE is set.
+SHADOW_ENGINE = os.environ.get("SHADOW_ENGINE")
+SHADOW_SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0.05"))
+
+# Admission control (see blog_admission): requests worked on at once. Past
+# that, requests queue by client class, and shed ones get a degraded answer
+# built from memory.
+MAX_IN_FLIGHT = int(os.environ.get("REDIRECT_MAX_IN_FLIGHT", "16"))
+
+# Cache for webpage HTML: key = url, value = (html_content, expiry_time).
+# html_content is a str, or compressed UTF-8 bytes (see PAGE_CACHE_COMPRESSION).
+page_cache: Dict[str, Tuple[object, datetime]] = {}
+
+# Page cache hit path counters: hits/misses, how often a hit needed the body
+# decompressed (index rebuild) vs. served from a current index, the raw vs
+# stored size of everything cached, and rendered_cache hits/misses
+page_cache_stats: Counter = Counter()
+
+# Cache for rendered redirect pages: key = RouteKey, value = (html, content
+# digest of what it was rendered from, see PageIndex.content_digest). An entry
+# is valid while the current index of the page has the same digest for the
+# anchor, so a refetch only invalidates the sections that actually changed.
+rendered_cache: Dict[RouteKey, Tuple[str, bytes]] = {}
+
+# Cache for known misses: key = (url, anchor), anchor None for a page that
+# failed to fetch, value = expiry_time
+negative_cache: Dict[Tuple[str, Optional[str]], datetime] = {}
+
+# Section indexes shared by the lookups: key = url, value = (page_cache entry
+# it was built from, PageIndex). Valid while that entry is still the cached one.
+page_indexes: Dict[str, Tuple[Tuple[object, datetime], PageIndex]] = {}
+
+# Full-text index over the sections of every indexed page, for /search.
+# Updated per section as pages are (re)indexed; outlives page_indexes eviction.
+search_index = SearchIndex()
+MAX_SEARCH_RESULTS = 50
+
+# Which pages have each anchor, so a bare /anchor link to a page other than
+# the manager book resolves without a lookup. Also outlives eviction.
+anchor_index = AnchorIndex()
+# How requests wrote mixed-case pages, for fetches and redirects (GitHub Pages
+# paths are case-sensitive; every other table keys on the lowercased page)
+page_spellings = PageSpellings()
+
+# Short share links. Not a cache: codes are handed out to people, so the
+# mapping is persisted, in a modal.Dict when running on Modal.
+short_links = ShortLinks(
+    MemoryBackend() if is_local() else ModalDictBackend(SHORT_LINK_DICT),
+    f"{SERVICE_URL}/s",
+)
+
+snapshot_volume = Volume.from_name(SNAPSHOT_VOLUME, create_if_missing=True)
+snapshot_store = (
+    LocalDiskBackend(SNAPSHOT_DIR)
+    if is_local()
+    else ModalVolumeBackend(SNAPSHOT_DIR, snapshot_volume)
+)
+
+render_bundle = BundleReader(BUNDLE_PATH)
+
+# Striped locks so concurrent lookups for one page share a fetch and a parse.
+# A fixed table: per-URL locks would grow with every junk path a scanner
+# tries. Pages that share a stripe just take turns.
+LOCK_STRIPES = 64
+_fetch_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_index_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+# Pages a refresh is fetching right now. Refreshes don't take _fetch_locks:
+# a live miss shouldn't queue behind background work.
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+def _stripe(locks: List[threading.Lock], url: str) -> threading.Lock:
+    return locks[hash(url) % len(locks)]
+
+
+# How long each lookup in resolve_preview() takes
+lookup_timings: Dict[str, LatencyWindow] = defaultdict(LatencyWindow)
+
+# Request frequency per link (RouteKey) and per page URL, in fixed memory.
+# Updated by read_all and get_preview; drives cache eviction and which pages
+# the scheduled refresh keeps warm.
+hot_links = HotKeys()
+hot_pages = HotKeys()
+
+# Latency of every origin fetch attempt, hedges included
+origin_latency = LatencyWindow()
+
+# Every origin fetch goes through here, hedges included
+origin_scheduler = OriginScheduler(ORIGIN_MAX_CONCURRENCY, ORIGIN_MAX_PER_HOST)
+
+# HEAD requests and conditional GETs answered from cache metadata
+probe_stats: Counter = Counter()
+
+# The last few request profiles
+profiles = ProfileRing()
+
+# RSS around sampled requests, and tracemalloc when switched on
+rss_samples = RssSampler()
+memory_trace = TraceSession()
+
+# Bounds in-flight requests; shed requests are counted by how they were answered
+admission = AdmissionController(MAX_IN_FLIGHT)
+degraded_stats: Counter = Counter()
+
+
+def reset_caches():
+    """Drop every in-memory cache and origin health state"""
+    page_cache.clear()
+    rendered_cache.clear()
+    negative_cache.clear()
+    page_indexes.clear()
+    search_index.clear()
+    anchor_index.clear()
+    page_spellings.clear()
+    page_cache_stats.clear()
+    lookup_timings.clear()
+    probe_stats.clear()
+    hot_links.clear()
+    hot_pages.clear()
+    origin_latency.clear()
+    origin_scheduler.clear()
+    profiles.clear()
+    rss_samples.clear()
+    admission.reset()
+    degraded_stats.clear()
+    shadow_stats.clear()
+    if _shadow_store is not None:
+        _shadow_store.clear()
+    blog_origin.reset()
 
 
 # Helper functions
@@ -30,15 +333,34 @@ def validate_url(url: str) -> bool:
         parsed = urllib.parse.urlparse(url)
         # Only allow specific domains
         if parsed.netloc not in ALLOWED_DOMAINS:
-            ic(f"URL domain not allowed: {parsed.netloc}")
+            log_event(
+                "url_rejected",
+                logging.WARNING,
+                sample_rate=LOG_SAMPLE_RATE_REJECTED_URL,
+                reason="domain",
+                netloc=parsed.netloc,
+            )
             return False
         # Only allow HTTP/HTTPS
         if parsed.scheme not in ["http", "https"]:
-            ic(f"URL scheme not allowed: {parsed.scheme}")
+            log_event(
+                "url_rejected",
+                logging.WARNING,
+                sample_rate=LOG_SAMPLE_RATE_REJECTED_URL,
+                reason="scheme",
+                scheme=parsed.scheme,
+            )
             return False
         return True
     except Exception as e:
-        ic(f"Error validating URL {url}: {e}")
+        log_event(
+            "url_rejected",
+            logging.WARNING,
+            sample_rate=LOG_SAMPLE_RATE_REJECTED_URL,
+            reason="invalid",
+            url=url,
+            error=repr(e),
+        )
         return False
 
 
@@ -58,39 +380,536 @@ def truncate_text(text: str, max_chars: int) -> str:
     return truncated + "..."
 
 
+def record_request(key: RouteKey) -> None:
+    hot_links.record(key)
+    hot_pages.record(key.url)
+
+
+def _evict_coldest(cache: dict, heat) -> None:
+    """Evict the least requested of the cache's EVICTION_SAMPLE oldest entries.
+    The others are moved to the back, so hot entries don't crowd the sample."""
+    sample = list(itertools.islice(cache, EVICTION_SAMPLE))
+    victim = min(sample, key=heat)  # ties: the oldest
+    # pop(): another thread may have removed an entry since the sample
+    cache.pop(victim, None)
+    for key in sample:
+        entry = cache.pop(key, None) if key != victim else None
+        if entry is not None:
+            cache[key] = entry
+
+
+def remember_miss(url: str, anchor: Optional[str] = None, ttl=NEGATIVE_CACHE_TTL):
+    """Record that a page (anchor None) or an anchor on a page doesn't exist"""
+    if len(negative_cache) >= MAX_NEGATIVE_ENTRIES:
+        # Evict the oldest entry (dicts keep insertion order)
+        negative_cache.pop(next(iter(negative_cache), None), None)
+    negative_cache[(url, anchor)] = datetime.now() + ttl
+
+
+def is_known_miss(url: str, anchor: Optional[str] = None) -> bool:
+    """True if the page (anchor None) or anchor recently turned out to be missing"""
+    expiry_time = negative_cache.get((url, anchor))
+    if expiry_time is None:
+        return False
+    if datetime.now() < expiry_time:
+        return True
+    negative_cache.pop((url, anchor), None)
+    return False
+
+
+def _encode_body(html: str):
+    """Page body as stored in page_cache, per PAGE_CACHE_COMPRESSION"""
+    raw = html.encode("utf-8")
+    page_cache_stats["raw_bytes"] += len(raw)
+    if PAGE_CACHE_COMPRESSION == "zstd":
+        compressor = _zstd_compressor()
+        if compressor is not None:
+            body = compressor(raw)
+            page_cache_stats["stored_bytes"] += len(body)
+            return body
+    if PAGE_CACHE_COMPRESSION in ("zlib", "zstd"):
+        body = zlib.compress(raw, ZLIB_LEVEL)
+        page_cache_stats["stored_bytes"] += len(body)
+        return body
+    page_cache_stats["stored_bytes"] += sys.getsizeof(html)
+    return html
+
+
+def _decode_body(body) -> str:
+    """Inverse of _encode_body; decompresses if needed"""
+    if isinstance(body, str):
+        return body
+    start = time.perf_counter()
+    if body[:4] == _ZSTD_MAGIC:
+        raw = _zstd_decompressor()(body)
+    else:
+        raw = zlib.decompress(body)
+    page_cache_stats["decompressions"] += 1
+    page_cache_stats["decompress_us"] += int((time.perf_counter() - start) * 1e6)
+    return raw.decode("utf-8")
+
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _zstd_module():
+    """zstd from the stdlib (3.14+) or the zstandard package, None if neither"""
+    try:
+        from compression import zstd
+
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+
+        return zstandard
+    except ImportError:
+        return None
+
+
+def _zstd_compressor():
+    zstd = _zstd_module()
+    if zstd is None:
+        log_event("zstd_unavailable", logging.WARNING, fallback="zlib")
+        return None
+    return zstd.compress
+
+
+def _zstd_decompressor():
+    return _zstd_module().decompress
+
+
 def fetch_cached_html(url: str) -> Optional[str]:
-    """Fetch HTML from cache or from URL if not cached"""
+    """Fetch HTML from cache or from URL if not cached.
+
+    If the origin can't be asked (breaker open, request deadline spent) or the
+    fetch fails, an expired cached copy is better than nothing, so it's served
+    until a refetch succeeds."""
+    entry = fetch_cached_page(url)
+    return _decode_body(entry[0]) if entry else None
+
+
+def fetch_cached_page(url: str) -> Optional[Tuple[object, datetime]]:
+    """Like fetch_cached_html, but returns the page_cache entry (body, expiry)
+    without decompressing the body"""
     if not validate_url(url):
         return None
 
     # Check cache first
+    cached = page_cache.get(url)
+    if cached and datetime.now() < cached[1]:
+        # Cache hit - return cached HTML
+        page_cache_stats["hits"] += 1
+        return cached
+
+    # Single flight: concurrent misses for one URL wait for one fetch, but
+    # no longer than the request could wait for the fetch itself
+    wait = fetch_timeout(REQUEST_TIMEOUT)
+    lock = _stripe(_fetch_locks, url)
+    if wait is None:
+        origin_stats["deadline_exhausted"] += 1
+        return cached
+    if not lock.acquire(timeout=wait):
+        page_cache_stats["fetch_wait_timeouts"] += 1
+        return cached
+    try:
+        cached = page_cache.get(url)
+        if cached and datetime.now() < cached[1]:
+            page_cache_stats["hits"] += 1
+            return cached
+        page_cache_stats["misses"] += 1
+        return _fetch_page(url, stale=cached)
+    finally:
+        lock.release()
+
+
+def _fetch_page(url: str, stale) -> Optional[Tuple[object, datetime]]:
+    """Fetch url from the origin into page_cache; stale is the fallback entry"""
+    # Recently missing or failing - don't go upstream again until it expires
+    if is_known_miss(url):
+        return stale
+
+    # Waiting for an origin slot spends the request's budget like a fetch does
+    wait = fetch_timeout(REQUEST_TIMEOUT)
+    if wait is None:
+        origin_stats["deadline_exhausted"] += 1
+        return stale
+    host = urllib.parse.urlparse(url).netloc
+    lease = origin_scheduler.lease(host, current_priority(), wait)
+    if lease is None:
+        origin_stats["no_origin_slot"] += 1
+        return stale
+    try:
+        return _fetch_granted(url, host, stale, lease)
+    finally:
+        lease.release()
+
+
+def _fetch_granted(
+    url: str, host: str, stale, lease: SlotLease
+) -> Optional[Tuple[object, datetime]]:
     now = datetime.now()
-    if url in page_cache:
-        cached_html, expiry_time = page_cache[url]
-        if now < expiry_time:
-            # Cache hit - return cached HTML
-            return cached_html
-        else:
-            # Cache expired - remove it
-            del page_cache[url]
+    # Before the breaker: allow() may hand out a half-open breaker's single
+    # trial, which only a recorded success or failure gives back
+    timeout = fetch_timeout(REQUEST_TIMEOUT)
+    if timeout is None:
+        origin_stats["deadline_exhausted"] += 1
+        return stale
+    breaker = breaker_for(host)
+    if not breaker.allow():
+        origin_stats["breaker_open"] += 1
+        return stale
 
     # Cache miss or expired - fetch from URL
     try:
-        r = requests.get(url, timeout=REQUEST_TIMEOUT)
+        r = _origin_get(origin_url(url), timeout, lease)
         r.raise_for_status()
         html = r.text
+        breaker.record_success()
 
         # Cache the result for future use
         expiry_time = now + timedelta(minutes=CACHE_TTL_MINUTES)
-        page_cache[url] = (html, expiry_time)
+        if url not in page_cache and len(page_cache) >= MAX_CACHED_PAGES:
+            _evict_coldest(page_cache, hot_pages.estimate)
+        entry = page_cache[url] = (_encode_body(html), expiry_time)
+
+        return entry
+    except requests.RequestException as e:
+        status = getattr(e.response, "status_code", None)
+        if status in (404, 410):
+            # The origin is healthy, the page is just gone
+            breaker.record_success()
+            page_cache.pop(url, None)
+            page_indexes.pop(url, None)
+            page = urllib.parse.urlparse(url).path.strip("/")
+            anchor_index.remove_page(page)
+            search_index.remove_page(page)
+            # Maybe just this spelling is wrong; let the next one try
+            page_spellings.forget(page)
+            remember_miss(url)
+            stale = None
+        else:
+            breaker.record_failure()
+            remember_miss(url, ttl=FETCH_FAILURE_TTL)
+        log_event("fetch_failed", logging.ERROR, url=url, status=status, error=repr(e))
+        return stale
+    except Exception as e:
+        breaker.record_failure()
+        remember_miss(url, ttl=FETCH_FAILURE_TTL)
+        log_event("fetch_failed", logging.ERROR, url=url, error=repr(e))
+        return stale
+
+
+def origin_url(url: str) -> str:
+    """url with its page spelled the way requests wrote it"""
+    parsed = urllib.parse.urlparse(url)
+    page = parsed.path.strip("/")
+    spelled = page_spellings.spell(page)
+    return url if spelled == page else parsed._replace(path=f"/{spelled}").geturl()
+
+
+def _timed_get(url: str, timeout: float):
+    start = time.perf_counter()
+    try:
+        if ORIGIN_FIXTURES == "replay":
+            return fixture_store().get(url, timeout=timeout)
+        response = requests.get(url, timeout=timeout)
+        if ORIGIN_FIXTURES == "record":
+            fixture_store().save(url, response, time.perf_counter() - start)
+        return response
+    finally:
+        origin_latency.record(time.perf_counter() - start)
+
+
+def fixture_store():
+    """The blog_fixtures.FixtureStore at ORIGIN_FIXTURE_DIR; only imported when
+    fixtures are on"""
+    global _fixture_store
+    if _fixture_store is None or _fixture_store.directory != ORIGIN_FIXTURE_DIR:
+        from blog_fixtures import FixtureStore
+
+        _fixture_store = FixtureStore(ORIGIN_FIXTURE_DIR)
+    return _fixture_store
+
+
+_fixture_store = None
+
+
+def hedge_delay() -> float:
+    """How long to wait on the first attempt before hedging"""
+    if origin_latency.count < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, origin_latency.percentile(HEDGE_PERCENTILE))
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix="origin")
+    return _hedge_executor
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _origin_get(url: str, timeout: float, lease: SlotLease):
+    """requests.get(url) under lease's slot, hedged against the alternate host
+    name when slow"""
+    parsed = urllib.parse.urlparse(url)
+    alternate_host = HEDGE_HOSTS.get(parsed.netloc) if ORIGIN_HEDGING else None
+    delay = hedge_delay()
+    if alternate_host is None or delay >= timeout:
+        return _timed_get(url, timeout)
+    alternate = parsed._replace(netloc=alternate_host).geturl()
+
+    # If the hedge wins, the first attempt runs on after this returns; it
+    # keeps the slot until it's done
+    lease.hold()
+
+    def first_attempt():
+        try:
+            return _timed_get(url, timeout)
+        finally:
+            lease.release()
+
+    # The hedge pool doesn't carry the request context, so bind the profile
+    priority = current_priority()
+    return hedged_call(
+        blog_profile.bind(first_attempt),
+        blog_profile.bind(
+            lambda: _hedge_get(alternate, alternate_host, timeout - delay, priority)
+        ),
+        delay,
+        _hedge_pool(),
+    )
+
 
-        return html
-    except requests.RequestException:
-        # Return None on error
+def _hedge_get(url: str, host: str, timeout: float, priority: str):
+    """A hedge only goes out if there's an origin slot for it right away; a
+    hedge that raises leaves the race to the first attempt"""
+    with origin_scheduler.slot(host, priority) as granted:
+        if not granted:
+            origin_stats["hedges_skipped"] += 1
+            raise requests.ConnectionError(f"No origin slot to hedge {url}")
+        return _timed_get(url, timeout)
+
+
+def get_page_index(url: str) -> Optional[PageIndex]:
+    """Section index of the cached page, built once per fetched copy.
+
+    The page is decompressed (if stored compressed), parsed, indexed and the
+    BeautifulSoup tree dropped; the helpers below only read the compact index,
+    so a cache hit with a current index never touches the raw HTML."""
+    entry = fetch_cached_page(url)
+    if entry is None:
         return None
-    except Exception:
-        # Return None on any other error
+
+    with _stripe(_index_locks, url):
+        indexed = page_indexes.get(url)
+        if indexed and indexed[0] is entry:
+            page_cache_stats["index_hits"] += 1
+            return indexed[1]
+        try:
+            html = _decode_body(entry[0])
+            index = build_page_index(BeautifulSoup(html, "html.parser"), url)
+        except Exception as e:
+            log_event("index_failed", logging.ERROR, url=url, error=repr(e))
+            return None
+        if url not in page_indexes and len(page_indexes) >= MAX_INDEXED_PAGES:
+            _evict_coldest(page_indexes, hot_pages.estimate)
+        page_indexes[url] = (entry, index)
+        previous = indexed[1] if indexed else None
+        _on_reindex(url, index, diff_indexes(previous, index), full=previous is None)
+        return index
+
+
+def refresh_page(url: str) -> Optional[RefreshResult]:
+    """Refetch url now, even if its cache entry is fresh, and re-index it;
+    None if another refresh of url is already running"""
+    with _refreshing_lock:
+        if url in _refreshing:
+            return None
+        _refreshing.add(url)
+    start = time.perf_counter()
+    indexed = page_indexes.get(url)
+    try:
+        with background_work():
+            entry = _fetch_page(url, stale=None)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(url)
+    index = get_page_index(url) if entry is not None else None
+    seconds = time.perf_counter() - start
+    if index is None:
+        return RefreshResult(url, False, seconds, None, False)
+    diff = diff_indexes(indexed[1] if indexed else None, index)
+    return RefreshResult(url, True, seconds, len(diff.stale_anchors), diff.page_changed)
+
+
+def refresh_hottest(top_n: int = REFRESH_TOP_N) -> Dict[str, object]:
+    """Refresh the hottest pages whose cache entries won't outlast the next
+    scheduled refresh"""
+    start = time.perf_counter()
+    expiries = {url: expiry for url, (_, expiry) in list(page_cache.items())}
+    # Recently missing pages stay out until their negative entry expires
+    hits = {url: n for url, n in hot_pages.hottest(top_n) if not is_known_miss(url)}
+    urls = plan_refresh(hits, expiries, datetime.now(), top_n)
+    results = [r for r in map(refresh_page, urls) if r is not None]
+    summary = summarize(results, time.perf_counter() - start)
+    summary["bundled"] = write_render_bundle()
+    log_event("cache_refreshed", **summary)
+    return {**summary, "results": [r._asdict() for r in results]}
+
+
+def write_render_bundle() -> int:
+    """Publish every current render, and the page indexes they were rendered
+    from, to the shared bundle; returns the number of renders"""
+    renders = [
+        (key.path, digest, html.encode("utf-8"))
+        for key, (html, digest) in dict(rendered_cache).items()
+        if current_digest(key) == digest
+    ]
+    now = datetime.now()
+    indexes = [
+        (url, b"", pickle.dumps(indexed, pickle.HIGHEST_PROTOCOL))
+        for url, indexed in dict(page_indexes).items()
+        if page_cache.get(url) is indexed[0] and now < indexed[0][1]
+    ]
+    try:
+        write_bundle(BUNDLE_PATH, renders, time.time(), indexes=indexes)
+    except PermissionError as e:
+        log_event("bundle_write_refused", logging.ERROR, error=str(e))
+        return 0
+    render_bundle.reload()  # other processes notice within BUNDLE_CHECK_SECONDS
+    return len(renders)
+
+
+def load_bundled_indexes() -> int:
+    """Adopt the page indexes another worker published to the shared bundle,
+    so this one starts without refetching and reparsing those pages. Pages
+    already in memory are kept. Returns the number loaded."""
+    bundle = render_bundle.reload()
+    if bundle is None or time.time() - bundle.created >= CACHE_TTL_MINUTES * 60:
+        return 0
+    now = datetime.now()
+    loaded = 0
+    for url, bundled in bundle.items(INDEXES):
+        if url in page_cache:
+            continue
+        # Bundle only maps files in a directory private to this user
+        entry, index = pickle.loads(bundled.html)
+        if now < entry[1]:
+            page_cache[url] = entry
+            page_indexes[url] = (entry, index)
+            _on_reindex(url, index, diff_indexes(None, index), full=True)
+            loaded += 1
+    log_event("bundle_indexes_loaded", indexes=loaded)
+    return loaded
+
+
+def bundled_render(key: RouteKey) -> Optional[BundleEntry]:
+    """The key's render from the shared bundle, if this process has no
+    current index of the page (otherwise its own caches are as good)"""
+    if current_digest(key) is not None:
         return None
+    entry = render_bundle.get(key.path, max_age=CACHE_TTL_MINUTES * 60)
+    if entry is not None:
+        page_cache_stats["bundle_hits"] += 1
+    return entry
+
+
+def save_snapshot() -> Dict[str, object]:
+    """Write the page cache, section indexes and renders to snapshot_store"""
+    start = time.perf_counter()
+    state = {
+        "pages": dict(page_cache),
+        "indexes": {url: index for url, (_, index) in dict(page_indexes).items()},
+        "rendered": dict(rendered_cache),
+        "spellings": dict(page_spellings.pages),
+    }
+    data = blog_snapshot.encode(
+        state,
+        datetime.now(),
+        pages=len(state["pages"]),
+        indexes=len(state["indexes"]),
+        rendered=len(state["rendered"]),
+    )
+    snapshot_store.write(data)
+    summary = {
+        "bytes": len(data),
+        "seconds": round(time.perf_counter() - start, 3),
+        **{name: len(entries) for name, entries in state.items()},
+    }
+    log_event("snapshot_saved", **summary)
+    return summary
+
+
+def load_snapshot() -> Dict[str, object]:
+    """Restore caches from snapshot_store, keeping only what's still valid:
+    pages inside their TTL, their indexes, and renders whose content digest
+    matches the restored index. Entries already in memory are kept."""
+    data = snapshot_store.read()
+    if data is None:
+        return {"loaded": False, "reason": "no snapshot"}
+    try:
+        header, state = blog_snapshot.decode(data)
+    except SnapshotError as e:
+        log_event("snapshot_rejected", logging.WARNING, error=str(e))
+        return {"loaded": False, "reason": str(e)}
+
+    now = datetime.now()
+    restored = Counter()
+    for url, entry in state["pages"].items():
+        if now < entry[1] and url not in page_cache:
+            page_cache[url] = entry
+            restored["pages"] += 1
+    for url, index in state["indexes"].items():
+        if page_cache.get(url) is state["pages"].get(url) and url not in page_indexes:
+            page_indexes[url] = (page_cache[url], index)
+            _on_reindex(url, index, diff_indexes(None, index), full=True)
+            restored["indexes"] += 1
+    for key, (html, digest) in state["rendered"].items():
+        indexed = page_indexes.get(key.url)
+        if indexed and indexed[1].content_digest(key.anchor) == digest:
+            rendered_cache.setdefault(key, (html, digest))
+            restored["rendered"] += 1
+    for page, written in state["spellings"].items():
+        # Refreshes refetch restored pages, which needs their spelling
+        page_spellings.record(page, written)
+
+    summary = {"loaded": True, "created": header["created"], **restored}
+    log_event("snapshot_loaded", **summary)
+    return summary
+
+
+def _on_reindex(url: str, index: PageIndex, diff: IndexDiff, full: bool) -> None:
+    """Drop or rebuild what was derived from sections that changed; the rest is
+    kept. full: no previous index to diff against (first fetch, or evicted)."""
+    page = urllib.parse.urlparse(url).path.strip("/")
+    search_index.update_page(page, index, None if full else diff.stale_anchors)
+    anchor_index.update_page(page, index.sections)
+    page_cache_stats["sections_changed"] += len(diff.stale_anchors)
+    page_cache_stats["sections_unchanged"] += len(diff.unchanged)
+    stale = set(diff.stale_anchors)
+    if diff.page_changed:
+        stale.add(None)
+    # list(): lookup threads add renders while this runs
+    for key in [k for k in list(rendered_cache) if k.url == url and k.anchor in stale]:
+        rendered_cache.pop(key, None)
+    # New sections mustn't keep getting the fallback until their miss expires
+    for anchor in diff.added:
+        negative_cache.pop((url, anchor), None)
+    log_event(
+        "page_reindexed",
+        logging.DEBUG,
+        url=url,
+        added=len(diff.added),
+        removed=len(diff.removed),
+        changed=len(diff.changed),
+        unchanged=len(diff.unchanged),
+        page_changed=diff.page_changed,
+    )
 
 
 # Embedded shared functions (from Redirect/shared.py)
@@ -131,24 +950,39 @@ def param_remap_legacy(param1, param2):
 
 def get_preview_image_from_url(url: str) -> str:
     """Fetch the preview image from a URL"""
-    if not validate_url(url):
+    # Shares the page cache (and negative cache) with the other helpers
+    index = get_page_index(url)
+    if index is None or not index.og_image:
         return DEFAULT_PREVIEW_IMAGE
+    return index.og_image
+
+
+def _find_section(index: PageIndex, url: str, anchor: str) -> Optional[Section]:
+    """The anchor's section, remembering a miss if the page doesn't have it"""
+    section = index.section(anchor)
+    if section is None:
+        remember_miss(url, anchor)
+        log_event(
+            "anchor_not_found",
+            sample_rate=LOG_SAMPLE_RATE_EXTRACTION_MISS,
+            url=url,
+            anchor=anchor,
+        )
+    return section
 
-    try:
-        r = requests.get(url, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        html = r.text
-        soup = BeautifulSoup(html, "html.parser")
 
-        image = soup.find("meta", property="og:image")
-        if image and image.get("content"):
-            return _resolve_image_url(image["content"], url)
-    except requests.RequestException as e:
-        ic(f"Request error getting preview image from {url}: {e}")
-    except Exception as e:
-        ic(f"Unexpected error getting preview image from {url}: {e}")
+def _preview_text(
+    index: PageIndex, section: Optional[Section], max_chars: int
+) -> Optional[str]:
+    # The section's paragraphs if it has any
+    if section:
+        text = collect_text(index.section_paragraphs(section), max_chars)
+        if text:
+            return truncate_text(text, max_chars)
 
-    return DEFAULT_PREVIEW_IMAGE
+    # Fallback: paragraphs in the main content area
+    text = collect_text(index.fallback_paragraphs(), max_chars)
+    return truncate_text(text, max_chars) if text else None
 
 
 def get_preview_text_from_url(
@@ -156,201 +990,238 @@ def get_preview_text_from_url(
 ) -> Optional[str]:
     """Fetch paragraphs after the title/anchor from the blog post until we reach max_chars."""
     # Get cached or fresh HTML
-    html = fetch_cached_html(url)
-    if not html:
+    index = get_page_index(url)
+    if index is None:
         return None
 
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-
-        collected_text = []
-        total_chars = 0
-
-        # If we have an anchor, try to find the content after that specific section
-        if anchor:
-            # Try to find the heading with this ID
-            heading = soup.find(id=anchor)
-            if heading:
-                # Get the next sibling paragraphs after the heading
-                current = heading.find_next_sibling()
-                while current and total_chars < max_chars:
-                    if current.name == "p" and current.get_text(strip=True):
-                        text = current.get_text(separator=" ", strip=True)
-                        collected_text.append(text)
-                        total_chars += len(text) + 1  # +1 for space between paragraphs
-                    # Stop if we hit another heading
-                    elif current.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-                        break
-                    current = current.find_next_sibling()
-
-                if collected_text:
-                    combined_text = " ".join(collected_text)
-                    return truncate_text(combined_text, max_chars)
-
-        # Fallback: find paragraphs in the main content
-        # Look for article or main content area
-        article = (
-            soup.find("article")
-            or soup.find("main")
-            or soup.find("div", class_="content")
-        )
-
-        if article:
-            paragraphs = article.find_all("p")
-        else:
-            # Last resort: find any paragraphs
-            paragraphs = soup.find_all("p")
-
-        # Collect paragraphs until we reach max_chars
-        for para in paragraphs:
-            if total_chars >= max_chars:
-                break
-            text = para.get_text(separator=" ", strip=True)
-            if text:  # Only add non-empty paragraphs
-                collected_text.append(text)
-                total_chars += len(text) + 1  # +1 for space between paragraphs
-
-        if collected_text:
-            combined_text = " ".join(collected_text)
-            return truncate_text(combined_text, max_chars)
-
-    except Exception as e:
-        ic(f"Error parsing HTML for preview text from {url}: {e}")
-
-    return None
+    # If we have an anchor, try to find the content after that specific section
+    section = None
+    if anchor and not is_known_miss(url, anchor):
+        section = _find_section(index, url, anchor)
+    return _preview_text(index, section, max_chars)
 
 
 def get_heading_text_from_url(url: str, anchor: Optional[str] = None) -> Optional[str]:
     """Fetch the actual heading text from the document"""
-    if not anchor:
+    if not anchor or is_known_miss(url, anchor):
         return None
 
     # Get cached or fresh HTML
-    html = fetch_cached_html(url)
-    if not html:
+    index = get_page_index(url)
+    if index is None:
         return None
 
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-
-        # Try to find the heading with this ID
-        heading = soup.find(id=anchor)
-        if heading and heading.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            text = heading.get_text(strip=True)
-            # Return text if non-empty
-            if text:
-                return text
-
-    except Exception:
-        # Silent error - fallback will be used
-        pass
-
-    return None
-
-
-def _resolve_image_url(src: str, page_url: str) -> str:
-    """Resolve a potentially relative image URL to an absolute URL."""
-    if src.startswith(("http://", "https://")):
-        return src
-    parsed = urllib.parse.urlparse(page_url)
-    base = f"{parsed.scheme}://{parsed.netloc}"
-    if src.startswith("/"):
-        return base + src
-    return base + "/" + src
+    section = _find_section(index, url, anchor)
+    return section.heading if section else None
 
 
 def get_section_image_from_url(url: str, anchor: Optional[str] = None) -> Optional[str]:
     """Find the first image in the section after the anchor heading."""
-    if not anchor:
+    if not anchor or is_known_miss(url, anchor):
         return None
 
-    html = fetch_cached_html(url)
-    if not html:
+    index = get_page_index(url)
+    if index is None:
         return None
 
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-        heading = soup.find(id=anchor)
-        if not heading:
-            return None
+    section = _find_section(index, url, anchor)
+    return section.image if section else None
+
+
+def extract_from_html(
+    html: str,
+    url: str,
+    anchor: Optional[str],
+    max_chars: int = DEFAULT_PREVIEW_MAX_CHARS,
+):
+    """The current extraction engine end to end, from the page's HTML to what
+    the helpers above return, without touching any cache. Shadow mode's
+    baseline (see blog_shadow)."""
+    from blog_shadow import Extraction
+
+    index = build_page_index(BeautifulSoup(html, "html.parser"), url)
+    section = index.section(anchor) if anchor else None
+    return Extraction(
+        description=_preview_text(index, section, max_chars),
+        heading=section.heading if section else None,
+        section_image=section.image if section else None,
+        page_image=index.og_image or DEFAULT_PREVIEW_IMAGE,
+    )
 
-        heading_level = (
-            int(heading.name[1])
-            if heading.name in ["h1", "h2", "h3", "h4", "h5", "h6"]
-            else None
-        )
-        if heading_level is None:
-            return None
 
-        current = heading.find_next_sibling()
-        while current:
-            # Stop at a heading of same or higher level
-            if current.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-                current_level = int(current.name[1])
-                if current_level <= heading_level:
-                    break
+def shadow_store():
+    """Shadow comparison results (a blog_shadow.ShadowStore), created on first
+    use so blog_shadow stays out of cold imports"""
+    global _shadow_store
+    if _shadow_store is None:
+        from blog_shadow import ShadowStore
 
-            # Check for img directly or inside this element
-            if current.name == "img" and current.get("src"):
-                return _resolve_image_url(current["src"], url)
-            img = current.find("img")
-            if img and img.get("src"):
-                return _resolve_image_url(img["src"], url)
+        _shadow_store = ShadowStore()
+    return _shadow_store
 
-            current = current.find_next_sibling()
 
-    except Exception:
-        pass
+_shadow_store = None
+# One comparison at a time: when the shadow falls behind, samples are skipped
+_shadow_slot = threading.Semaphore(1)
+shadow_stats: Counter = Counter()
 
-    return None
+
+def maybe_shadow(key: RouteKey) -> bool:
+    """On SHADOW_SAMPLE_RATE of requests, start comparing the candidate engine
+    with the current one on key's page, in the background. True if started."""
+    if not SHADOW_ENGINE or random.random() >= SHADOW_SAMPLE_RATE:
+        return False
+    if not _shadow_slot.acquire(blocking=False):
+        shadow_stats["busy"] += 1
+        return False
+    threading.Thread(
+        target=_run_shadow, args=(key,), name="shadow", daemon=True
+    ).start()
+    return True
+
+
+def _run_shadow(key: RouteKey) -> None:
+    try:
+        # Only pages the request already has; the shadow never fetches
+        entry = page_cache.get(key.url)
+        if entry is None:
+            shadow_stats["no_page"] += 1
+            return
+        html = _decode_body(entry[0])
+        import blog_shadow
+
+        start = time.perf_counter()
+        current = extract_from_html(html, key.url, key.anchor)
+        current_seconds = time.perf_counter() - start
+        store = shadow_store()
+        try:
+            engine = blog_shadow.load_engine(SHADOW_ENGINE)
+            start = time.perf_counter()
+            candidate = blog_shadow.as_extraction(
+                engine(html, key.url, key.anchor, DEFAULT_PREVIEW_MAX_CHARS)
+            )
+            candidate_seconds = time.perf_counter() - start
+        except Exception as e:
+            store.record_error(key.page, key.anchor, e)
+            return
+        mismatch = store.record(
+            key.page, key.anchor, current, candidate, current_seconds, candidate_seconds
+        )
+        if mismatch:
+            log_event(
+                "shadow_mismatch",
+                sample_rate=LOG_SAMPLE_RATE_EXTRACTION_MISS,
+                page=key.page,
+                anchor=key.anchor,
+                fields=sorted(mismatch.fields),
+            )
+    finally:
+        _shadow_slot.release()
 
 
 def generate_title(page, anchor):
     """Generate a title from page and anchor"""
+    # Try to get actual heading text from the document
+    heading = None
+    if anchor:
+        heading = get_heading_text_from_url(f"https://idvork.in/{page}", anchor)
+    return _format_title(page, anchor, heading)
+
+
+def _format_title(page, anchor, heading: Optional[str]) -> str:
+    """Title for a page/anchor; without a heading, one made from the URL"""
     if page == "manager-book" and not anchor:
         return "Igor's book of management"
-    elif page == "manager-book" and anchor:
-        # Try to get actual heading text from the document
-        actual_heading = get_heading_text_from_url(f"https://idvork.in/{page}", anchor)
-        if actual_heading:
-            return f"{actual_heading} (Igor's Manager Book)"
-        # Fallback to URL-based generation
-        anchor_text = hup(anchor)
-        return f"{anchor_text} (Igor's Manager Book)"
+    elif page == "manager-book":
+        return f"{heading or hup(anchor)} (Igor's Manager Book)"
     elif anchor:
-        # Try to get actual heading text from the document
-        actual_heading = get_heading_text_from_url(f"https://idvork.in/{page}", anchor)
-        if actual_heading:
-            page_text = hup(page)
-            return f"{actual_heading} ({page_text})"
-        # Fallback to URL-based generation
-        anchor_text = hup(anchor)
-        page_text = hup(page)
-        return f"{anchor_text} ({page_text})"
+        return f"{heading or hup(anchor)} ({hup(page)})"
     else:
         # Just the page - keep existing logic
         return hup(page)
 
 
+class PreviewParts(NamedTuple):
+    title: Optional[str]
+    description: str
+    image: str
+    section_image: Optional[str]
+    # The anchor as the page writes its id, for the redirect fragment
+    anchor: Optional[str]
+
+
+def _lookup_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(LOOKUP_WORKERS, thread_name_prefix="lookup")
+    return _pool
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = blog_profile.call(fn, *args)
+    return result, time.perf_counter() - start
+
+
+def _anchor_as_written(index: Optional[PageIndex], anchor: Optional[str]):
+    """The page's own spelling of anchor (ids are case-sensitive in the
+    browser, RouteKey anchors are lowercased); anchor if it isn't there"""
+    section = index.section(anchor) if index and anchor else None
+    return section.anchor if section else anchor
+
+
+def resolve_preview(page, anchor, with_title=True) -> PreviewParts:
+    """Title, description and image for a page/anchor, looked up concurrently.
+
+    The lookups are independent except that they all read the same page, so
+    they run in parallel and join on the page's single-flight fetch and shared
+    index: a miss costs one fetch plus one parse, not one per lookup. The
+    section and page images are both looked up, and the page image is only
+    used when the section has none."""
+    url = f"https://idvork.in/{page}"
+    lookups = {
+        "page": (get_page_index, url),
+        "description": (get_preview_text_from_url, url, anchor),
+        "section_image": (get_section_image_from_url, url, anchor),
+        "page_image": (get_preview_image_from_url, url),
+    }
+    if with_title:
+        lookups["title"] = (generate_title, page, anchor)
+
+    # copy_context() carries the request deadline into the worker threads
+    futures = {
+        name: _lookup_pool().submit(contextvars.copy_context().run, _timed, *lookup)
+        for name, lookup in lookups.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        results[name], seconds = future.result()
+        lookup_timings[name].record(seconds)
+
+    return PreviewParts(
+        title=results.get("title"),
+        description=results["description"] or "Description Ignored",
+        image=results["section_image"] or results["page_image"],
+        section_image=results["section_image"],
+        anchor=_anchor_as_written(results["page"], anchor),
+    )
+
+
 def get_html_for_redirect_simple(title, page, anchor):
     """Simplified HTML generation without legacy remapping"""
-    # Always fetch preview text for description
-    description = "Description Ignored"
-    preview_text = get_preview_text_from_url(f"https://idvork.in/{page}", anchor)
-    if preview_text:
-        description = preview_text
-
-    # Use section-specific image if available, otherwise page-level og:image
-    section_image = get_section_image_from_url(f"https://idvork.in/{page}", anchor)
-    preview_image = (
-        section_image
-        if section_image
-        else get_preview_image_from_url(f"https://idvork.in/{page}")
+    parts = resolve_preview(page, anchor, with_title=False)
+    return _redirect_page_html(
+        title, parts.description, parts.image, page, parts.anchor
     )
 
+
+def _redirect_page_html(title, description, preview_image, page, anchor):
     # Build the redirect URL
     # Always include # for backwards compatibility
-    redirect_url = f"https://idvork.in/{page}#{anchor if anchor else ''}"
+    redirect_url = f"https://idvork.in/{page_spellings.spell(page)}#{anchor or ''}"
 
     html = f"""
 <!DOCTYPE html>
@@ -382,6 +1253,78 @@ def get_html_for_redirect_simple(title, page, anchor):
     return html
 
 
+def render_redirect(key: RouteKey) -> str:
+    """Redirect page for a canonical key, served from rendered_cache when current"""
+    index = get_page_index(key.url)
+    digest = index.content_digest(key.anchor) if index else None
+    cached = rendered_cache.get(key)
+    if cached:
+        html, rendered_from = cached
+        if digest is not None and rendered_from == digest:
+            page_cache_stats["rendered_hits"] += 1
+            return html
+        rendered_cache.pop(key, None)
+
+    page_cache_stats["rendered_misses"] += 1
+    parts = resolve_preview(key.page, key.anchor)
+    html = _redirect_page_html(
+        parts.title, parts.description, parts.image, key.page, parts.anchor
+    )
+
+    # Only cache renders backed by a fetched page and a real anchor. Fallbacks
+    # for missing pages/anchors are cheap to rebuild from the negative cache,
+    # and junk links shouldn't push real entries out.
+    if digest is not None and not is_known_miss(key.url, key.anchor):
+        if key not in rendered_cache and len(rendered_cache) >= MAX_RENDERED_ENTRIES:
+            _evict_coldest(rendered_cache, hot_links.estimate)
+        rendered_cache[key] = (html, digest)
+    return html
+
+
+def current_digest(key: RouteKey) -> Optional[bytes]:
+    """The key's content digest from a current index, without fetching or
+    parsing; None if the page isn't indexed from a fresh page cache entry"""
+    indexed = page_indexes.get(key.url)
+    entry = page_cache.get(key.url)
+    if not indexed or indexed[0] is not entry or datetime.now() >= entry[1]:
+        return None
+    return indexed[1].content_digest(key.anchor)
+
+
+def probe_headers(key: RouteKey) -> Dict[str, str]:
+    """Headers a GET of key would return, from cache metadata only. ETag needs
+    a current index of the page, Content-Length a current render; either may
+    come from the shared bundle instead."""
+    headers = {"content-type": "text/html; charset=utf-8"}
+    digest = current_digest(key)
+    if digest is None:
+        bundled = render_bundle.get(key.path, max_age=CACHE_TTL_MINUTES * 60)
+        if bundled is not None:
+            headers["etag"] = f'W/"{bundled.digest.hex()}"'
+            headers["content-length"] = str(len(bundled.html))
+        return headers
+    headers["etag"] = f'W/"{digest.hex()}"'
+    cached = rendered_cache.get(key)
+    if cached and cached[1] == digest:
+        headers["content-length"] = str(len(cached[0].encode("utf-8")))
+    return headers
+
+
+def share_url_for(key: RouteKey) -> str:
+    """Link to share for a key: a short link if its section is in a current
+    index, else the long ?path= form. Only verified keys mint codes, so junk
+    paths and lookups that ran out of time don't write to the store."""
+    if current_digest(key) is None:
+        return long_share_url(key)
+    return short_links.url_for(key)
+
+
+def long_share_url(key: RouteKey) -> str:
+    if key.anchor or key.page != DEFAULT_PAGE:
+        return f"{SERVICE_URL}/?path={urllib.parse.quote(key.path)}"
+    return SERVICE_URL
+
+
 # Keep the old function for backwards compatibility but simplified
 def get_html_for_redirect(param1, param2):
     title, page, anchor = param_remap_legacy(param1, param2)
@@ -434,60 +1377,452 @@ def get_html_for_redirect(param1, param2):
 
 
 web_app = FastAPI()
+
+
+def profile_reason(scope) -> Optional[str]:
+    """Why to profile a request, if at all: "header" when it carries the admin
+    token in X-Profile, "sampled" for PROFILE_SAMPLE_RATE of the rest"""
+    if ADMIN_TOKEN:
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                if value.decode("latin-1") == ADMIN_TOKEN:
+                    return "header"
+                break
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+web_app.add_middleware(ProfilingMiddleware, choose=profile_reason, ring=profiles)
+
+
+def sample_memory(scope) -> bool:
+    return bool(MEMORY_SAMPLE_RATE) and random.random() < MEMORY_SAMPLE_RATE
+
+
+web_app.add_middleware(RssSamplingMiddleware, sample=sample_memory, sampler=rss_samples)
+
+# Routes that look pages up; /admin and HEAD only read memory
+_TOOL_ROUTES = ("/preview_text/", "/preview/")
+
+
+def admission_class(scope) -> Optional[str]:
+    """Client class of a GET that may do page work, None for the rest"""
+    if scope["method"] != "GET" or scope["path"].startswith("/admin/"):
+        return None
+    for name, value in scope["headers"]:
+        if name == b"user-agent":
+            return classify(value.decode("latin-1"))
+    return classify(None)
+
+
+def degraded_page(key: RouteKey) -> Tuple[str, str]:
+    """Redirect page for a shed request and where it came from, without
+    fetching or parsing: a cached render even if stale, the bundled one, or a
+    page built from whatever of the index is in memory, down to the URL alone"""
+    cached = rendered_cache.get(key)
+    if cached:
+        return cached[0], "rendered"
+    bundled = render_bundle.get(key.path, max_age=CACHE_TTL_MINUTES * 60)
+    if bundled is not None:
+        return bytes(bundled.html).decode("utf-8"), "bundle"
+
+    indexed = page_indexes.get(key.url)
+    if indexed is None:
+        title = _format_title(key.page, key.anchor, None)
+        html = _redirect_page_html(
+            title, "Description Ignored", DEFAULT_PREVIEW_IMAGE, key.page, key.anchor
+        )
+        return html, "url"
+    index = indexed[1]
+    section = index.section(key.anchor) if key.anchor else None
+    title = _format_title(key.page, key.anchor, section.heading if section else None)
+    description = _preview_text(index, section, DEFAULT_PREVIEW_MAX_CHARS)
+    image = (section and section.image) or index.og_image or DEFAULT_PREVIEW_IMAGE
+    anchor = section.anchor if section else key.anchor
+    html = _redirect_page_html(
+        title, description or "Description Ignored", image, key.page, anchor
+    )
+    return html, "index"
+
+
+async def degraded_response(scope, receive, send, cls: str) -> None:
+    """Answer a shed request: redirect pages from memory (degraded_page),
+    503 for the tool routes and unknown short links"""
+    path = scope["path"]
+    if path == "/search" or path.startswith(_TOOL_ROUTES):
+        key = None
+    elif path.startswith("/s/") and "/" not in path[3:]:
+        # Only codes already in memory: reading the store is work too
+        key = short_links.keys.get(path[3:])
+    else:
+        key = key_for_request(Request(scope), path[1:], anchor_index, page_spellings)
+
+    if key is None:
+        degraded_stats["unavailable"] += 1
+        response = PlainTextResponse(
+            "Busy, try again shortly", status_code=503, headers={"retry-after": "1"}
+        )
+    else:
+        html, source = degraded_page(key)
+        degraded_stats[source] += 1
+        response = HTMLResponse(
+            html, headers={"cache-control": "no-store", "x-degraded": source}
+        )
+    await response(scope, receive, send)
+
+
+# Outermost, so queued requests hold nothing but their place in the queue
+web_app.add_middleware(
+    AdmissionMiddleware,
+    choose=admission_class,
+    degraded=degraded_response,
+    controller=lambda: admission,
+)
+
+
+async def run_in_thread(fn, *args):
+    """asyncio.to_thread for request work, profiled when the request is"""
+    return await asyncio.to_thread(blog_profile.call, fn, *args)
+
+
 app = App("igor-blog")  # Note: prior to April 2024, "app" was called "stub"
 
-default_image = Image.debian_slim(python_version="3.10").pip_install(
-    ["icecream", "httpx", "requests", "beautifulsoup4", "fastapi"]
+# Sibling modules imported by this file, shipped into the container image
+LOCAL_MODULES = [
+    "blog_admission",
+    "blog_bundle",
+    "blog_fixtures",
+    "blog_hotkeys",
+    "blog_index",
+    "blog_log",
+    "blog_memory",
+    "blog_origin",
+    "blog_profile",
+    "blog_refresh",
+    "blog_routing",
+    "blog_search",
+    "blog_shadow",
+    "blog_shortlinks",
+    "blog_snapshot",
+]
+
+default_image = (
+    Image.debian_slim(python_version="3.10")
+    .pip_install(["httpx", "requests", "beautifulsoup4", "fastapi"])
+    .add_local_python_source(*LOCAL_MODULES)
 )
 
 
 # https://modal.com/docs/guide/webhooks
-@app.function(image=default_image)
+@app.function(
+    image=default_image,
+    secrets=[Secret.from_name("igor-blog-admin")],
+    volumes={SNAPSHOT_DIR: snapshot_volume},
+)
 @asgi_app()
 def fastapi_app():
+    try:
+        # The bundle is at most a refresh old, so it goes first; the snapshot
+        # only fills in pages it doesn't have
+        load_bundled_indexes()
+    except Exception as e:
+        # Starting cold is fine; failing to start isn't
+        log_event("bundle_load_failed", logging.ERROR, error=repr(e))
+    try:
+        load_snapshot()
+    except Exception as e:
+        log_event("snapshot_load_failed", logging.ERROR, error=repr(e))
     return web_app
 
 
+@app.function(
+    image=default_image,
+    schedule=Period(minutes=REFRESH_MINUTES),
+    secrets=[Secret.from_name("igor-blog-admin")],
+)
+def refresh_cache():
+    """Scheduled: have the web function refresh its hottest pages. The request
+    also keeps a web container warm (this replaces keepwarm.sh)."""
+    start = time.perf_counter()
+    response = requests.post(
+        f"{SERVICE_URL}/admin/refresh",
+        params={"top_n": REFRESH_TOP_N},
+        headers={"x-admin-token": ADMIN_TOKEN or ""},
+        timeout=120,
+    )
+    response.raise_for_status()
+    summary = {k: v for k, v in response.json().items() if k != "results"}
+    log_event("refresh_ping", seconds=round(time.perf_counter() - start, 3), **summary)
+
+    # Keep a recent snapshot around for the next deploy to start from
+    response = requests.post(
+        f"{SERVICE_URL}/admin/snapshot",
+        headers={"x-admin-token": ADMIN_TOKEN or ""},
+        timeout=120,
+    )
+    response.raise_for_status()
+    blog_log.flush()
+
+
+def require_admin(request: Request):
+    """Dependency for /admin/* routes: check the X-Admin-Token header"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Bad admin token")
+
+
+def _page_cache_report():
+    stored = page_cache_stats["stored_bytes"]
+    return {
+        "compression": PAGE_CACHE_COMPRESSION,
+        "resident_bytes": sum(
+            len(body) if isinstance(body, bytes) else sys.getsizeof(body)
+            for body, _ in list(page_cache.values())
+        ),
+        "compression_ratio": round(page_cache_stats["raw_bytes"] / stored, 2)
+        if stored
+        else None,
+        **page_cache_stats,
+    }
+
+
+# Admin routes have to be registered before the catch-all redirect route
+@web_app.get("/admin/metrics", dependencies=[Depends(require_admin)])
+async def admin_metrics():
+    """Cache sizes, origin health and logging counters"""
+    return {
+        "caches": {
+            "pages": len(page_cache),
+            "rendered": len(rendered_cache),
+            "negative": len(negative_cache),
+            "indexed_pages": len(page_indexes),
+            "search_sections": len(search_index),
+            "anchors": len(anchor_index),
+            "page_spellings": len(page_spellings),
+            "ambiguous_anchors": anchor_index.ambiguous(),
+            "short_links": len(short_links),
+        },
+        "page_cache": _page_cache_report(),
+        "origin": {
+            "breakers": breaker_snapshots(),
+            "latency": origin_latency.summary(),
+            "hedge_delay_ms": round(hedge_delay() * 1000, 2)
+            if ORIGIN_HEDGING
+            else None,
+            "scheduler": origin_scheduler.report(),
+            **origin_stats,
+        },
+        "lookups": {name: w.summary() for name, w in lookup_timings.items()},
+        "logging": dict(blog_log.stats),
+        "probes": dict(probe_stats),
+        "profiles": {"stored": len(profiles), **blog_profile.stats},
+        "admission": {**admission.report(), "degraded": dict(degraded_stats)},
+    }
+
+
+@web_app.get("/admin/hotkeys", dependencies=[Depends(require_admin)])
+async def admin_hotkeys(n: int = 50):
+    """Most requested links and pages (estimated counts, decayed over time)"""
+    return {
+        "links": [
+            {"page": key.page, "anchor": key.anchor, "count": count}
+            for key, count in hot_links.hottest(n)
+        ],
+        "pages": [{"url": url, "count": count} for url, count in hot_pages.hottest(n)],
+        "updates": hot_links.updates,
+        "bytes": hot_links.nbytes() + hot_pages.nbytes(),
+    }
+
+
+@web_app.post("/admin/refresh", dependencies=[Depends(require_admin)])
+async def admin_refresh(top_n: int = REFRESH_TOP_N):
+    """Refetch and re-index the hottest pages (called by refresh_cache)"""
+    return await asyncio.to_thread(refresh_hottest, top_n)
+
+
+@web_app.post("/admin/snapshot", dependencies=[Depends(require_admin)])
+async def admin_snapshot():
+    """Save the caches for the next deploy to start warm from"""
+    return await asyncio.to_thread(save_snapshot)
+
+
+@web_app.post("/admin/snapshot/restore", dependencies=[Depends(require_admin)])
+async def admin_snapshot_restore():
+    """Load the last saved snapshot into this container's caches"""
+    return await asyncio.to_thread(load_snapshot)
+
+
+@web_app.post("/admin/bundle", dependencies=[Depends(require_admin)])
+async def admin_bundle():
+    """Rewrite the shared render bundle from this process's current renders"""
+    return {"entries": await asyncio.to_thread(write_render_bundle)}
+
+
+def cache_sizes() -> Dict[str, Dict[str, int]]:
+    """Entry count and estimated bytes held by each in-memory cache"""
+    bundle = render_bundle.bundle
+    return {
+        "pages": {"entries": len(page_cache), "bytes": sizeof(page_cache)},
+        "rendered": {"entries": len(rendered_cache), "bytes": sizeof(rendered_cache)},
+        "negative": {"entries": len(negative_cache), "bytes": sizeof(negative_cache)},
+        "indexed_pages": {
+            "entries": len(page_indexes),
+            # The indexes only; their page_cache entries are counted above
+            "bytes": sum(index.nbytes() for _, index in list(page_indexes.values())),
+        },
+        "search": {"entries": len(search_index), "bytes": sizeof(search_index)},
+        "anchors": {"entries": len(anchor_index), "bytes": sizeof(anchor_index)},
+        "short_links": {
+            "entries": len(short_links),
+            "bytes": sizeof((short_links.keys, short_links.codes)),
+        },
+        "hotkeys": {
+            "entries": len(hot_links.top) + len(hot_pages.top),
+            "bytes": hot_links.nbytes() + hot_pages.nbytes(),
+        },
+        # Mapped, shared by every worker process, and only resident as read
+        "bundle": {
+            "entries": bundle.entries if bundle else 0,
+            "bytes": len(bundle.map) if bundle else 0,
+        },
+    }
+
+
+@web_app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def admin_memory():
+    """Bytes held by each cache and by the section indexes per page and per
+    section, process RSS, and RSS around sampled requests"""
+    pages = {
+        url: index.memory_report() for url, (_, index) in list(page_indexes.items())
+    }
+    sections = sum(p["sections"] for p in pages.values())
+    total = sum(p["bytes"] for p in pages.values())
+    caches = await asyncio.to_thread(cache_sizes)
+    return {
+        "process": {
+            "rss_bytes": blog_memory.current_rss(),
+            "peak_rss_bytes": blog_memory.peak_rss(),
+            "cache_bytes": sum(c["bytes"] for c in caches.values()),
+        },
+        "caches": caches,
+        "requests": {"sample_rate": MEMORY_SAMPLE_RATE, **rss_samples.summary()},
+        "tracemalloc": memory_trace.status(),
+        "index": {
+            "pages": len(pages),
+            "sections": sections,
+            "bytes": total,
+            "bytes_per_page": total // len(pages) if pages else 0,
+            "bytes_per_section": total // sections if sections else 0,
+        },
+        "pages": pages,
+    }
+
+
+@web_app.post("/admin/memory/trace", dependencies=[Depends(require_admin)])
+async def admin_memory_trace(frames: int = blog_memory.TRACE_FRAMES):
+    """Start tracemalloc (it slows every allocation down until stopped)"""
+    return memory_trace.start(max(1, frames))
+
+
+@web_app.post("/admin/memory/trace/stop", dependencies=[Depends(require_admin)])
+async def admin_memory_trace_stop():
+    return memory_trace.stop()
+
+
+@web_app.post("/admin/memory/snapshot", dependencies=[Depends(require_admin)])
+async def admin_memory_snapshot(
+    group_by: str = "lineno", limit: int = blog_memory.MAX_TRACE_STATS
+):
+    """Largest allocation sites by line (or by module with group_by=filename),
+    and what changed since the previous snapshot"""
+    if group_by not in blog_memory.GROUP_BY:
+        raise HTTPException(
+            status_code=400, detail=f"group_by is one of {blog_memory.GROUP_BY}"
+        )
+    return await asyncio.to_thread(memory_trace.snapshot, group_by, max(1, limit))
+
+
+@web_app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def admin_profiles():
+    """The stored request profiles, newest first (reports not included)"""
+    return {"profiles": profiles.summaries(), **blog_profile.stats}
+
+
+@web_app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def admin_profile(profile_id: int, sort: str = "cumulative"):
+    """One request's profile as pstats text, sorted by cumulative or tottime"""
+    record = profiles.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="No such profile")
+    if sort not in blog_profile.SORT_KEYS:
+        raise HTTPException(
+            status_code=400, detail=f"sort is one of {list(blog_profile.SORT_KEYS)}"
+        )
+    report = await asyncio.to_thread(record.profile.report, sort)
+    summary = " ".join(f"{k}={v}" for k, v in record.summary().items())
+    return PlainTextResponse(content=f"{summary}\n\n{report}")
+
+
+@web_app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+async def admin_shadow(recent: int = 20):
+    """How often the candidate extraction engine disagrees with the current
+    one, each engine's latency, and the latest disagreements"""
+    return {
+        "engine": SHADOW_ENGINE,
+        "sample_rate": SHADOW_SAMPLE_RATE,
+        **shadow_stats,
+        **shadow_store().report(recent),
+    }
+
+
+@web_app.get("/search")
+async def search(q: str = "", limit: int = 10):
+    """Sections matching every word of q, best first, with their share links"""
+    # Make sure there's at least the default page to search
+    default_url = RouteKey(DEFAULT_PAGE, None).url
+    if default_url not in page_indexes:
+        with request_deadline(REQUEST_DEADLINE_SECONDS):
+            await run_in_thread(get_page_index, default_url)
+
+    start = time.perf_counter()
+    hits = search_index.search(q, limit=max(1, min(limit, MAX_SEARCH_RESULTS)))
+    took_ms = round((time.perf_counter() - start) * 1000, 3)
+    # Search doesn't mint: a section gets a code once someone previews it
+    keys = [RouteKey(hit.page, hit.anchor) for hit in hits]
+    urls = [short_links.minted_url(key) or long_share_url(key) for key in keys]
+    return {
+        "query": q,
+        "took_ms": took_ms,
+        "results": [
+            {
+                "page": hit.page,
+                "anchor": hit.anchor,
+                "heading": hit.heading,
+                "snippet": hit.snippet,
+                "url": url,
+                "score": hit.score,
+            }
+            for hit, url in zip(hits, urls)
+        ],
+    }
+
+
 @web_app.get("/preview_text/{full_path:path}")
 async def get_preview(request: Request, full_path: str):
     """API endpoint to get just the preview text for a given page/anchor"""
-    # Check for path query parameter first
-    path_param = request.query_params.get("path")
-
-    if path_param:
-        # Parse the path parameter (e.g., "manager-book#leadership")
-        if "#" in path_param:
-            page, anchor = path_param.split("#", 1)
-        else:
-            # No anchor, just a page
-            page = path_param
-            anchor = None
-    else:
-        # Use the URL path segments as before
-        parts = full_path.split("/", 2)
-        if len(parts) >= 2:
-            page = parts[0]
-            anchor = parts[1]
-        elif len(parts) == 1 and parts[0]:
-            # Single param - for backwards compatibility, treat as manager-book anchor
-            page = "manager-book"
-            anchor = parts[0]
-        else:
-            # Default to manager-book if nothing provided
-            page = "manager-book"
-            anchor = None
+    key = key_for_request(request, full_path, anchor_index, page_spellings)
+    record_request(key)
 
     # Fetch the preview text
-    preview_text = get_preview_text_from_url(f"https://idvork.in/{page}", anchor)
+    with request_deadline(REQUEST_DEADLINE_SECONDS):
+        preview_text = await run_in_thread(
+            get_preview_text_from_url, key.url, key.anchor
+        )
 
-    # Build tinyurl with query parameter for the path
-    if anchor:
-        path_param = f"{page}#{anchor}"
-        url = f"https://tinyurl.com/igor-blog?path={urllib.parse.quote(path_param)}"
-    elif page != "manager-book":
-        url = f"https://tinyurl.com/igor-blog?path={urllib.parse.quote(page)}"
-    else:
-        url = "https://tinyurl.com/igor-blog"
+    maybe_shadow(key)
+    url = await run_in_thread(share_url_for, key)
 
     # Check for text_only parameter
     if request.query_params.get("text_only") == "true":
@@ -507,54 +1842,14 @@ async def get_preview(request: Request, full_path: str):
 @web_app.get("/preview/{full_path:path}")
 async def preview_og(request: Request, full_path: str):
     """Show a visual preview of how the link will appear across different platforms."""
-    # Parse path the same way as the redirect endpoint
-    path_param = request.query_params.get("path")
-
-    if path_param:
-        if "#" in path_param:
-            page, anchor = path_param.split("#", 1)
-        else:
-            page = path_param
-            anchor = None
-    else:
-        parts = full_path.split("/", 2)
-        if not full_path:
-            page = "manager-book"
-            anchor = None
-        elif len(parts) >= 2:
-            page = parts[0]
-            anchor = parts[1]
-        elif len(parts) == 1:
-            page = "manager-book"
-            anchor = parts[0]
-        else:
-            page = "manager-book"
-            anchor = None
+    key = key_for_request(request, full_path, anchor_index, page_spellings)
+    page, anchor = key
 
-    title = generate_title(page, anchor)
-    description = "Description Ignored"
-    preview_text = get_preview_text_from_url(f"https://idvork.in/{page}", anchor)
-    if preview_text:
-        description = preview_text
-
-    section_image = get_section_image_from_url(f"https://idvork.in/{page}", anchor)
-    preview_image = (
-        section_image
-        if section_image
-        else get_preview_image_from_url(f"https://idvork.in/{page}")
-    )
-    redirect_url = f"https://idvork.in/{page}#{anchor if anchor else ''}"
-
-    # Build tinyurl for sharing
-    if anchor:
-        tinyurl_path = f"{page}#{anchor}"
-        tinyurl = (
-            f"https://tinyurl.com/igor-blog?path={urllib.parse.quote(tinyurl_path)}"
-        )
-    elif page != "manager-book":
-        tinyurl = f"https://tinyurl.com/igor-blog?path={urllib.parse.quote(page)}"
-    else:
-        tinyurl = "https://tinyurl.com/igor-blog"
+    with request_deadline(REQUEST_DEADLINE_SECONDS):
+        parts = await run_in_thread(resolve_preview, page, anchor)
+    title, description, preview_image, section_image, _ = parts
+    redirect_url = f"{origin_url(key.url)}#{parts.anchor or ''}"
+    share_url = await run_in_thread(share_url_for, key)
 
     html = f"""
 <!DOCTYPE html>
@@ -631,7 +1926,7 @@ async def preview_og(request: Request, full_path: str):
     <h1>Link Preview for: {title}</h1>
     <p class="subtitle">{redirect_url}</p>
     <div class="share-url">
-        Share: <a href="{tinyurl}" id="share-link">{tinyurl}</a>
+        Share: <a href="{share_url}" id="share-link">{share_url}</a>
         <button class="copy-btn" onclick="navigator.clipboard.writeText(document.getElementById('share-link').href)">Copy</button>
     </div>
 
@@ -642,7 +1937,7 @@ async def preview_og(request: Request, full_path: str):
             <dt>og:image</dt><dd>{preview_image}</dd>
             <dt>og:url</dt><dd>{redirect_url}</dd>
             <dt>Image source</dt><dd>{"Section image" if section_image else "Page-level og:image"}</dd>
-            <dt>Share URL (tinyurl)</dt><dd><a href="{tinyurl}">{tinyurl}</a></dd>
+            <dt>Share URL</dt><dd><a href="{share_url}">{share_url}</a></dd>
         </dl>
     </div>
 
@@ -755,42 +2050,78 @@ async def preview_og(request: Request, full_path: str):
     return HTMLResponse(content=html, status_code=200)
 
 
-@web_app.get("/{full_path:path}")
-async def read_all(request: Request, full_path: str):
-    # Check for path query parameter first
-    path_param = request.query_params.get("path")
+def _probe_response(key: RouteKey) -> Response:
+    """HEAD: GET's headers, from the canonical key and cache metadata only"""
+    probe_stats["head"] += 1
+    headers = probe_headers(key)
+    response = Response(status_code=200, headers=headers)
+    if "content-length" not in headers:
+        # Not rendered yet, so the length isn't known; don't claim 0
+        probe_stats["head_without_length"] += 1
+        del response.headers["content-length"]
+    return response
+
+
+async def _redirect_response(request: Request, key: RouteKey) -> Response:
+    """The redirect page, or 304 if the client's ETag is still current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = probe_headers(key).get("etag")
+        if etag and etag in (tag.strip() for tag in if_none_match.split(",")):
+            probe_stats["not_modified"] += 1
+            return Response(status_code=304, headers={"etag": etag})
+
+    bundled = bundled_render(key)
+    if bundled is not None:
+        return Response(
+            content=bytes(bundled.html),
+            media_type="text/html",
+            headers={"etag": f'W/"{bundled.digest.hex()}"'},
+        )
 
-    if path_param:
-        # Parse the path parameter (e.g., "manager-book#leadership")
-        if "#" in path_param:
-            page, anchor = path_param.split("#", 1)
-        else:
-            # No anchor, just a page
-            page = path_param
-            anchor = None
-    else:
-        # Use the URL path segments as before
-        parts = full_path.split("/", 2)
-
-        if not full_path or full_path == "favicon.ico":
-            # Default to manager-book
-            page = "manager-book"
-            anchor = None
-        elif len(parts) >= 2:
-            page = parts[0]
-            anchor = parts[1]
-        elif len(parts) == 1:
-            # Single param could be either a page or an anchor for manager-book
-            # For backwards compatibility, treat it as an anchor for manager-book
-            page = "manager-book"
-            anchor = parts[0]
-        else:
-            page = "manager-book"
-            anchor = None
+    with request_deadline(REQUEST_DEADLINE_SECONDS):
+        html_content = await run_in_thread(render_redirect, key)
+    maybe_shadow(key)
+    etag = probe_headers(key).get("etag")
+    headers = {"etag": etag} if etag else None
+    return HTMLResponse(content=html_content, status_code=200, headers=headers)
+
+
+@web_app.head("/s/{code}")
+async def short_link_head(code: str):
+    # Same lookup as GET, so HEAD and GET agree on which codes exist
+    key = await run_in_thread(short_links.resolve, code)
+    if key is None:
+        raise HTTPException(status_code=404, detail="Unknown link")
+    return _probe_response(key)
+
+
+@web_app.get("/s/{code}")
+async def short_link(request: Request, code: str):
+    """Share link: the redirect page for the code's key, in one hop"""
+    key = await run_in_thread(short_links.resolve, code)
+    if key is None:
+        raise HTTPException(status_code=404, detail="Unknown link")
+    record_request(key)
+    return await _redirect_response(request, key)
+
+
+@web_app.head("/{full_path:path}")
+async def probe_all(request: Request, full_path: str):
+    # Only redirect paths: the other GET routes have no HEAD handler, and
+    # aren't redirect pages
+    path = request.url.path
+    if path.startswith("/admin/"):
+        return Response(status_code=405, headers={"allow": "GET, POST"})
+    if path == "/search" or path.startswith(_TOOL_ROUTES):
+        return Response(status_code=405, headers={"allow": "GET"})
+    return _probe_response(
+        key_for_request(request, full_path, anchor_index, page_spellings)
+    )
 
-    # Generate title from page and anchor
-    title = generate_title(page, anchor)
 
-    # Generate the HTML with the simplified parameters
-    html_content = get_html_for_redirect_simple(title, page, anchor)
-    return HTMLResponse(content=html_content, status_code=200)
+@web_app.get("/{full_path:path}")
+async def read_all(request: Request, full_path: str):
+    key = key_for_request(request, full_path, anchor_index, page_spellings)
+    record_request(key)
+    return await _redirect_response(request, key)
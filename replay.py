@@ -0,0 +1,396 @@
+#!python3
+"""Replay a recorded access log against web_app, offline.
+
+    python replay.py access.jsonl              # as fast as possible
+    python replay.py access.jsonl --speed 1    # in real time
+    python replay.py access.jsonl --speed 60   # an hour of traffic in a minute
+
+The log is JSON lines, one request each; query and user_agent are optional,
+ts is unix seconds or ISO 8601:
+
+    {"ts": 1760000000.5, "path": "/manager-book/1-1s", "query": "",
+     "user_agent": "Slackbot-LinkExpanding 1.0"}
+
+Requests go in-process through httpx's ASGI transport, so the latency measured
+is the service's own (routing, caches, parsing, rendering) plus the stand-in
+origin's. The stand-in answers every origin fetch locally: a page of --page-kb
+with a section for each anchor the log asks for, after --origin-ms. Paths that
+don't look like blog pages get a 404, as scanners' paths do in production.
+With --fixtures, recorded origin responses (see blog_fixtures) are served
+instead, with their recorded latencies.
+Hedging is off during a replay, so every origin fetch is charged to the
+request that made it.
+
+The report has, per route, request count, status codes, latency percentiles
+and the share of requests served without an origin fetch, plus the cache
+counters for the run. Caches start empty like a fresh container; --warm
+replays the log once, unmeasured, first.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from unittest import mock
+
+import blog_log
+from blog_origin import LatencyWindow
+from blog_routing import RouteKey, canonical_key
+
+ORIGIN_MS = 50.0
+PAGE_KB = 300
+CONCURRENCY = 32
+
+_SLUG = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+# Scanner paths: a file name with an extension the blog doesn't serve
+_JUNK = re.compile(r"\.(?!html?(/|$))[a-z0-9]+(/|$)", re.IGNORECASE)
+_ROUTE_PREFIXES = ("preview_text/", "preview/")
+
+# Origin fetches made on behalf of the request being replayed
+_fetches: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "replay_fetches", default=None
+)
+
+
+class LoggedRequest(NamedTuple):
+    ts: float
+    path: str
+    query: str
+    user_agent: Optional[str]
+
+    @property
+    def target(self) -> str:
+        return f"{self.path}?{self.query}" if self.query else self.path
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def load_log(lines: Iterable[str]) -> List[LoggedRequest]:
+    """Requests from JSON lines, oldest first"""
+    logged = []
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        logged.append(
+            LoggedRequest(
+                _timestamp(entry["ts"]),
+                entry["path"],
+                entry.get("query", "").lstrip("?"),
+                entry.get("user_agent"),
+            )
+        )
+    return sorted(logged, key=lambda r: r.ts)
+
+
+def key_for(request: LoggedRequest) -> RouteKey:
+    """The canonical key the service will look up for a logged request"""
+    full_path = request.path.lstrip("/")
+    for prefix in _ROUTE_PREFIXES:
+        if full_path.startswith(prefix):
+            full_path = full_path[len(prefix) :]
+    path_param = urllib.parse.parse_qs(request.query).get("path", [None])[0]
+    return canonical_key(full_path, path_param)
+
+
+class StandInOrigin:
+    """Serves blog pages locally, in place of requests.get"""
+
+    def __init__(
+        self,
+        anchors: Dict[str, Set[str]],
+        latency: float = ORIGIN_MS / 1000,
+        page_bytes: int = PAGE_KB * 1024,
+    ):
+        self.anchors = anchors
+        self.latency = latency
+        self.page_bytes = page_bytes
+        self.fetches = 0
+        self._pages: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_log(cls, logged: Iterable[LoggedRequest], **kwargs) -> "StandInOrigin":
+        """An origin with every page and anchor the log refers to, except
+        those only scanners ask for"""
+        anchors: Dict[str, Set[str]] = defaultdict(set)
+        for request in logged:
+            if _JUNK.search(request.path):
+                continue
+            key = key_for(request)
+            if _SLUG.match(key.page):
+                anchors[key.page].update([key.anchor] if key.anchor else [])
+        return cls(dict(anchors), **kwargs)
+
+    def page_html(self, page: str) -> Optional[str]:
+        if page not in self.anchors:
+            return None
+        with self._lock:
+            if page not in self._pages:
+                self._pages[page] = self._build(page)
+            return self._pages[page]
+
+    def _build(self, page: str) -> str:
+        anchors = sorted(self.anchors[page]) or ["introduction"]
+        # Spread the page size over the sections, a few paragraphs each
+        paragraph = (
+            "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do "
+            "eiusmod tempor incididunt ut labore et dolore magna aliqua. "
+        ) * 3
+        per_section = max(1, self.page_bytes // len(anchors) // len(paragraph))
+        sections = []
+        for i, anchor in enumerate(anchors):
+            image = (
+                f'<img src="https://idvork.in/images/{anchor}.png">' if i % 3 else ""
+            )
+            body = "".join(f"<p>{paragraph}</p>" for _ in range(per_section))
+            title = anchor.replace("-", " ").title()
+            sections.append(f'<h2 id="{anchor}">{title}</h2>{image}{body}')
+        return (
+            f"<html><head><title>{page}</title>"
+            f'<meta property="og:image" content="https://idvork.in/images/{page}.png">'
+            f"</head><body>{''.join(sections)}</body></html>"
+        )
+
+    def get(self, url: str, timeout=None, **kwargs):
+        import requests
+
+        time.sleep(self.latency)
+        with self._lock:
+            self.fetches += 1
+
+        page = urllib.parse.urlparse(url).path.strip("/")
+        html = self.page_html(page)
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200 if html is not None else 404
+        response.encoding = "utf-8"
+        response.headers["content-type"] = "text/html; charset=utf-8"
+        response._content = (html or "Not Found").encode("utf-8")
+        return response
+
+
+def _counted(get):
+    """get, charging each call to the request being replayed"""
+
+    def counted_get(url: str, *args, **kwargs):
+        fetches = _fetches.get()
+        if fetches is not None:
+            fetches.append(url)
+        return get(url, *args, **kwargs)
+
+    return counted_get
+
+
+class ReplayResult(NamedTuple):
+    request: LoggedRequest
+    route: str
+    status: int
+    seconds: float
+    origin_fetches: int
+
+
+def route_for(app, path: str) -> str:
+    """The route template a path is served by, e.g. /s/{code}"""
+    from starlette.routing import Match
+
+    scope = {"type": "http", "path": path, "method": "GET", "root_path": ""}
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def replay(
+    logged: List[LoggedRequest], speed: float = 0, concurrency: int = CONCURRENCY
+) -> List[ReplayResult]:
+    """Send the logged requests to web_app, spaced by their timestamps divided
+    by speed (0: no spacing), at most concurrency at a time"""
+    import httpx
+
+    from modal_redirect import web_app
+
+    if not logged:
+        return []
+    semaphore = asyncio.Semaphore(concurrency)
+    first_ts = logged[0].ts
+    start = time.perf_counter()
+
+    async def one(client, request: LoggedRequest) -> ReplayResult:
+        if speed:
+            due = start + (request.ts - first_ts) / speed
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        async with semaphore:
+            fetches: List[str] = []
+            _fetches.set(fetches)
+            headers = {"user-agent": request.user_agent} if request.user_agent else {}
+            sent = time.perf_counter()
+            response = await client.get(request.target, headers=headers)
+            seconds = time.perf_counter() - sent
+        return ReplayResult(
+            request,
+            route_for(web_app, request.path),
+            response.status_code,
+            seconds,
+            len(fetches),
+        )
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://replay"
+    ) as client:
+        return await asyncio.gather(*(one(client, r) for r in logged))
+
+
+def summarize(
+    results: List[ReplayResult], counters: Dict[str, int], seconds: float
+) -> Dict[str, object]:
+    """Per-route latency and origin-free share, and cache hit ratios"""
+    by_route: Dict[str, List[ReplayResult]] = defaultdict(list)
+    for result in results:
+        by_route[result.route].append(result)
+
+    routes = {}
+    for route, route_results in sorted(by_route.items()):
+        window = LatencyWindow(size=len(route_results))
+        for result in route_results:
+            window.record(result.seconds)
+        routes[route] = {
+            **window.summary(),
+            "max_ms": round(max(r.seconds for r in route_results) * 1000, 2),
+            "statuses": dict(Counter(r.status for r in route_results)),
+            "served_without_fetch": round(
+                sum(r.origin_fetches == 0 for r in route_results) / len(route_results),
+                3,
+            ),
+        }
+
+    def ratio(hits, misses):
+        total = counters.get(hits, 0) + counters.get(misses, 0)
+        return round(counters.get(hits, 0) / total, 3) if total else None
+
+    return {
+        "requests": len(results),
+        "seconds": round(seconds, 3),
+        "origin_fetches": sum(r.origin_fetches for r in results),
+        "page_cache_hit_ratio": ratio("hits", "misses"),
+        "rendered_cache_hit_ratio": ratio("rendered_hits", "rendered_misses"),
+        "routes": routes,
+    }
+
+
+def run(
+    logged: List[LoggedRequest],
+    speed: float = 0,
+    concurrency: int = CONCURRENCY,
+    origin_ms: float = ORIGIN_MS,
+    page_kb: int = PAGE_KB,
+    warm: bool = False,
+    fixtures: Optional[str] = None,
+    fixture_latency_scale: float = 1.0,
+) -> Dict[str, object]:
+    """Replay logged against a fresh web_app and a stand-in origin, or the
+    origin responses recorded in the fixtures directory"""
+    import modal_redirect
+    from blog_fixtures import FixtureStore
+
+    if fixtures:
+        origin = FixtureStore(fixtures, latency_scale=fixture_latency_scale)
+    else:
+        origin = StandInOrigin.for_log(
+            logged, latency=origin_ms / 1000, page_bytes=page_kb * 1024
+        )
+    modal_redirect.reset_caches()
+    with (
+        mock.patch.object(modal_redirect, "ORIGIN_HEDGING", False),
+        mock.patch.object(modal_redirect, "ORIGIN_FIXTURES", "off"),
+        mock.patch.object(modal_redirect.requests, "get", _counted(origin.get)),
+    ):
+        if warm:
+            asyncio.run(replay(logged, 0, concurrency))
+            modal_redirect.page_cache_stats.clear()
+        start = time.perf_counter()
+        results = asyncio.run(replay(logged, speed, concurrency))
+        seconds = time.perf_counter() - start
+    return summarize(results, dict(modal_redirect.page_cache_stats), seconds)
+
+
+def report(summary: Dict[str, object]) -> str:
+    def pct(value):
+        return "-" if value is None else f"{value:.1%}"
+
+    lines = [
+        f"{summary['requests']} requests in {summary['seconds']}s, "
+        f"{summary['origin_fetches']} origin fetches",
+        f"page cache hit ratio {pct(summary['page_cache_hit_ratio'])}, "
+        f"rendered cache hit ratio {pct(summary['rendered_cache_hit_ratio'])}",
+        "",
+        f"{'route':<32}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'max ms':>9}{'no fetch':>10}  statuses",
+    ]
+    for route, r in summary["routes"].items():
+        statuses = " ".join(f"{s}:{n}" for s, n in sorted(r["statuses"].items()))
+        lines.append(
+            f"{route:<32}{r['count']:>7}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+            f"{r['p99_ms']:>9}{r['max_ms']:>9}{pct(r['served_without_fetch']):>10}"
+            f"  {statuses}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSON lines access log")
+    parser.add_argument(
+        "--speed", type=float, default=0, help="1 = real time, 0 = no spacing"
+    )
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--origin-ms", type=float, default=ORIGIN_MS)
+    parser.add_argument("--page-kb", type=int, default=PAGE_KB)
+    parser.add_argument(
+        "--fixtures",
+        help="serve origin responses recorded with ORIGIN_FIXTURES=record from "
+        "this directory instead of the stand-in origin",
+    )
+    parser.add_argument(
+        "--fixture-latency-scale",
+        type=float,
+        default=1.0,
+        help="multiply recorded latencies by this (0: don't wait)",
+    )
+    parser.add_argument("--warm", action="store_true", help="replay once first")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Per-request debug events would drown the report
+    blog_log.configure().setLevel(logging.WARNING)
+    with open(args.log) as f:
+        logged = load_log(f)
+    summary = run(
+        logged,
+        speed=args.speed,
+        concurrency=args.concurrency,
+        origin_ms=args.origin_ms,
+        page_kb=args.page_kb,
+        warm=args.warm,
+        fixtures=args.fixtures,
+        fixture_latency_scale=args.fixture_latency_scale,
+    )
+    print(json.dumps(summary, indent=2) if args.json else report(summary))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
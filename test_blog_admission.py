@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from blog_admission import (
+    CRAWLER,
+    HUMAN,
+    UNFURL,
+    AdmissionController,
+    AdmissionMiddleware,
+    classify,
+)
+
+CHROME = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+)
+
+
+@pytest.mark.parametrize(
+    "user_agent,cls",
+    [
+        ("Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)", UNFURL),
+        ("facebookexternalhit/1.1 Facebot Twitterbot/1.0", UNFURL),  # iMessage
+        ("WhatsApp/2.23.20.0", UNFURL),
+        (CHROME, HUMAN),
+        (
+            "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+            CRAWLER,
+        ),
+        ("python-requests/2.31.0", CRAWLER),
+        (None, CRAWLER),
+    ],
+)
+def test_classify(user_agent, cls):
+    assert classify(user_agent) == cls
+
+
+@pytest.mark.asyncio
+async def test_freed_slots_go_to_the_highest_class_first():
+    controller = AdmissionController(max_in_flight=1)
+    assert await controller.admit(CRAWLER)
+
+    order = []
+
+    async def wait(cls):
+        assert await controller.admit(cls)
+        order.append(cls)
+        controller.release()
+
+    waiters = [asyncio.create_task(wait(c)) for c in (CRAWLER, HUMAN, UNFURL)]
+    await asyncio.sleep(0)
+    assert controller.waiting() == 3
+    controller.release()
+    await asyncio.gather(*waiters)
+
+    assert order == [UNFURL, HUMAN, CRAWLER]
+    assert controller.in_flight == 0
+    assert controller.report()["classes"][UNFURL]["queued"] == 1
+
+
+@pytest.mark.asyncio
+async def test_requests_are_shed_when_the_queue_is_full_or_the_wait_too_long():
+    controller = AdmissionController(
+        max_in_flight=1,
+        queue_limits={UNFURL: 1, HUMAN: 1, CRAWLER: 0},
+        max_wait={UNFURL: 1.0, HUMAN: 0.01, CRAWLER: 1.0},
+    )
+    assert await controller.admit(UNFURL)
+
+    assert not await controller.admit(CRAWLER)  # no queue at all
+    assert not await controller.admit(HUMAN)  # waited too long
+    assert controller.waiting() == 0
+
+    report = controller.report()
+    assert report["shed"] == 2
+    assert report["classes"][CRAWLER]["shed_full"] == 1
+    assert report["classes"][HUMAN]["shed_timeout"] == 1
+    assert report["in_flight"] == 1
+
+
+@pytest.mark.asyncio
+async def test_a_slot_handed_over_as_the_wait_times_out_is_passed_on(monkeypatch):
+    controller = AdmissionController(max_in_flight=1)
+    assert await controller.admit(UNFURL)
+
+    async def wait_for(slot, timeout):
+        # The running request finishes and hands its slot to the waiter just
+        # as the waiter's time runs out
+        controller.release()
+        assert slot.done()
+        raise asyncio.TimeoutError
+
+    monkeypatch.setattr(asyncio, "wait_for", wait_for)
+    assert not await controller.admit(HUMAN)
+    monkeypatch.undo()
+
+    assert controller.in_flight == 0
+    assert controller.report()["classes"][HUMAN]["shed_timeout"] == 1
+    assert await controller.admit(HUMAN)
+
+
+@pytest.mark.asyncio
+async def test_middleware_releases_the_slot_and_routes_shed_requests():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(("app", controller.in_flight))
+
+    async def degraded(scope, receive, send, cls):
+        calls.append(("degraded", cls))
+
+    controller = AdmissionController(max_in_flight=1)
+    middleware = AdmissionMiddleware(
+        app,
+        choose=lambda scope: None if scope["path"] == "/free" else HUMAN,
+        degraded=degraded,
+        controller=lambda: controller,
+    )
+    await middleware({"type": "http", "path": "/page"}, None, None)
+    await middleware({"type": "http", "path": "/free"}, None, None)
+    controller.max_in_flight = 0
+    await middleware({"type": "http", "path": "/page"}, None, None)
+
+    assert calls == [("app", 1), ("app", 0), ("degraded", HUMAN)]
+    assert controller.in_flight == 0
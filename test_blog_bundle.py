@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from blog_bundle import INDEXES, RENDERS, Bundle, BundleReader, write_bundle
+
+
+def _entries(n, version="v1"):
+    return [
+        (
+            f"page#anchor-{i}",
+            bytes([i % 256]) * 8,
+            f"<html>{version} {i}</html>".encode(),
+        )
+        for i in range(n)
+    ]
+
+
+def test_lookup_by_key_without_deserializing(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    assert write_bundle(path, _entries(500), created=123.0) == 500
+    bundle = Bundle(path)
+
+    assert (bundle.entries, bundle.created) == (500, 123.0)
+    entry = bundle.get("page#anchor-321")
+    assert entry.digest == bytes([321 % 256]) * 8
+    assert isinstance(entry.html, memoryview)
+    assert bytes(entry.html) == b"<html>v1 321</html>"
+    assert bundle.get("page#missing") is None
+
+
+def test_indexes_are_a_separate_table(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    indexes = [("page#anchor-1", b"", b"state")]
+    write_bundle(path, _entries(3), created=0.0, indexes=indexes)
+    bundle = Bundle(path)
+
+    assert bytes(bundle.get("page#anchor-1").html) == b"<html>v1 1</html>"
+    assert bytes(bundle.get("page#anchor-1", INDEXES).html) == b"state"
+    assert bundle.get("page#anchor-2", INDEXES) is None
+    assert [(k, bytes(e.html)) for k, e in bundle.items(INDEXES)] == [
+        ("page#anchor-1", b"state")
+    ]
+    assert sorted(k for k, _ in bundle.items(RENDERS)) == [
+        "page#anchor-0",
+        "page#anchor-1",
+        "page#anchor-2",
+    ]
+
+
+def test_bundles_outside_a_private_directory_are_refused(tmp_path):
+    shared = tmp_path / "shared"
+    path = str(shared / "b.bundle")
+    write_bundle(path, _entries(3), created=time.time())
+    assert (os.stat(shared).st_mode & 0o777) == 0o700
+
+    os.chmod(shared, 0o777)
+    reader = BundleReader(path, check_seconds=0)
+    assert reader.get("page#anchor-1", max_age=60) is None
+    with pytest.raises(PermissionError):
+        write_bundle(path, _entries(3), created=time.time())
+
+    os.chmod(shared, 0o700)
+    os.chmod(path, 0o666)
+    assert reader.get("page#anchor-1", max_age=60) is None
+
+
+def test_empty_bundle(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    write_bundle(path, [], created=time.time())
+    assert Bundle(path).get("anything") is None
+
+
+def test_reader_swaps_to_a_renamed_in_bundle(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    write_bundle(path, _entries(3), created=time.time())
+    reader = BundleReader(path, check_seconds=0)
+    old = reader.get("page#anchor-1", max_age=60)
+
+    write_bundle(path, _entries(3, version="v2"), created=time.time())
+    assert bytes(reader.get("page#anchor-1", max_age=60).html) == b"<html>v2 1</html>"
+    # Entries handed out earlier still read from the old mapping
+    assert bytes(old.html) == b"<html>v1 1</html>"
+    assert [p for p in os.listdir(tmp_path)] == ["b.bundle"]
+
+
+def test_reader_ignores_old_or_missing_bundles(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    reader = BundleReader(path, check_seconds=0)
+    assert reader.get("page#anchor-1", max_age=60) is None
+    write_bundle(path, _entries(3), created=time.time() - 120)
+    assert reader.get("page#anchor-1", max_age=60) is None
+
+
+def test_other_processes_read_the_same_bundle(tmp_path):
+    path = str(tmp_path / "b.bundle")
+    write_bundle(path, _entries(10), created=time.time())
+    script = (
+        "import sys; from blog_bundle import Bundle;"
+        "print(bytes(Bundle(sys.argv[1]).get('page#anchor-7').html).decode())"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", script, path],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    assert out.stdout.strip() == "<html>v1 7</html>"
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+import requests
+
+import blog_fixtures
+from blog_fixtures import FixtureStore
+
+
+def _response(url, body=b"<html>caf\xc3\xa9</html>", status=200):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers["content-type"] = "text/html; charset=utf-8"
+    response.headers["etag"] = '"abc"'
+    response.encoding = "utf-8"
+    response._content = body
+    return response
+
+
+def test_recorded_response_replays_identically(tmp_path):
+    url = "https://idvork.in/manager-book"
+    FixtureStore(str(tmp_path)).save(url, _response(url), seconds=0.25)
+
+    # A fresh store reads it back from disk
+    replayed = FixtureStore(str(tmp_path), latency_scale=0).get(url, timeout=5)
+    assert replayed.status_code == 200
+    assert replayed.text == "<html>café</html>"
+    assert replayed.headers["ETag"] == '"abc"'
+    assert replayed.elapsed.total_seconds() == 0.25
+    replayed.raise_for_status()
+
+
+def test_replay_waits_the_recorded_latency(tmp_path):
+    url = "https://idvork.in/slow"
+    store = FixtureStore(str(tmp_path))
+    store.save(url, _response(url), seconds=0.05)
+    start = time.perf_counter()
+    store.get(url)
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_replay_fails_like_the_origin_would(tmp_path):
+    store = FixtureStore(str(tmp_path))
+    store.save("https://idvork.in/gone", _response("", b"nope", 404), seconds=0)
+    store.save("https://idvork.in/slow", _response(""), seconds=0.2)
+
+    with pytest.raises(requests.HTTPError):
+        store.get("https://idvork.in/gone").raise_for_status()
+    with pytest.raises(requests.Timeout):
+        store.get("https://idvork.in/slow", timeout=0.01)
+    with pytest.raises(requests.ConnectionError):
+        store.get("https://idvork.in/never-recorded")
+    assert blog_fixtures.stats["missing"] >= 1
@@ -0,0 +1,41 @@
+from blog_hotkeys import HotKeys
+
+
+def test_estimates_never_undercount():
+    hot = HotKeys(k=5, width=64, depth=3)
+    for i in range(200):
+        for _ in range(i % 7):
+            hot.record(f"key-{i}")
+    assert all(hot.estimate(f"key-{i}") >= i % 7 for i in range(200))
+
+
+def test_hot_keys_survive_a_sweep_of_cold_ones():
+    hot = HotKeys(k=3)
+    for _ in range(20):
+        hot.record("popular")
+        hot.record("shared")
+    for i in range(5000):
+        hot.record(f"crawler-{i}")
+    top = dict(hot.hottest(2))
+    assert set(top) == {"popular", "shared"}
+    assert all(count >= 20 for count in top.values())
+    assert len(hot.top) == 3
+
+
+def test_memory_is_fixed():
+    hot = HotKeys(k=10)
+    hot.record("warmup")
+    before = hot.nbytes()
+    for i in range(20_000):
+        hot.record(("page", f"anchor-{i}"))
+    assert hot.nbytes() <= before * 1.1
+
+
+def test_counts_decay():
+    hot = HotKeys(k=5, decay_every=10)
+    for _ in range(9):
+        hot.record("a")
+    assert hot.estimate("a") == 9
+    hot.record("b")  # 10th update halves everything
+    assert hot.estimate("a") == 4
+    assert dict(hot.hottest(5)) == {"a": 4}
@@ -0,0 +1,140 @@
+from bs4 import BeautifulSoup
+
+from blog_index import build_page_index, collect_text, diff_indexes
+
+PAGE_URL = "https://idvork.in/test-page"
+
+HTML = """
+<html>
+<head><meta property="og:image" content="/images/page.png"></head>
+<body>
+<article>
+    <h2 id="first">First <em>Section</em></h2>
+    <p>Intro to the first<a href="#">link</a>section.</p>
+    <p></p>
+    <div><img src="/images/first.png"></div>
+    <h3 id="nested">Nested</h3>
+    <p>Nested text ✓ with unicode.</p>
+    <img src="https://example.com/nested.png">
+    <h2 id="second">Second</h2>
+    <p>Only text in the second section.</p>
+    <h2 id="first">Duplicate id</h2>
+    <p id="para-anchor">A paragraph with an id.</p>
+    <p>After the paragraph anchor.</p>
+</article>
+<p>Outside the article.</p>
+</body>
+</html>
+"""
+
+
+def _index():
+    return build_page_index(BeautifulSoup(HTML, "html.parser"), PAGE_URL)
+
+
+def test_sections_capture_heading_level_and_image():
+    index = _index()
+
+    first = index.sections["first"]
+    assert (first.heading, first.level) == ("FirstSection", 2)
+    # The nested h3 is inside the h2's section, so its image counts too; the
+    # first image found wins
+    assert first.image == "https://idvork.in/images/first.png"
+
+    nested = index.sections["nested"]
+    assert (nested.heading, nested.level) == ("Nested", 3)
+    assert nested.image == "https://example.com/nested.png"
+
+    # Section image search stops at the next same-level heading
+    assert index.sections["second"].image is None
+    assert index.og_image == "https://idvork.in/images/page.png"
+
+
+def test_section_paragraphs_stop_at_any_heading():
+    index = _index()
+
+    assert list(index.section_paragraphs(index.sections["first"])) == [
+        "Intro to the first link section."
+    ]
+    assert list(index.section_paragraphs(index.sections["nested"])) == [
+        "Nested text ✓ with unicode."
+    ]
+
+
+def test_first_element_with_an_id_wins():
+    index = _index()
+    assert index.sections["first"].heading == "FirstSection"
+
+
+def test_sections_match_ids_ignoring_case_and_keep_the_id_as_written():
+    html = "<h2 id='Key-Ideas'>Key ideas</h2><p>Text.</p>"
+    index = build_page_index(BeautifulSoup(html, "html.parser"), PAGE_URL)
+    for anchor in ("key-ideas", "Key-Ideas", "KEY-IDEAS"):
+        assert index.section(anchor).anchor == "Key-Ideas"
+    assert index.content_digest("key-ideas") == index.content_digest("Key-Ideas")
+
+
+def test_non_heading_ids_are_indexed_without_heading_or_image():
+    section = _index().sections["para-anchor"]
+    assert (section.heading, section.level, section.image) == (None, 0, None)
+    assert list(_index().section_paragraphs(section)) == ["After the paragraph anchor."]
+
+
+def test_paragraphs_are_stored_once_and_shared_with_fallback():
+    index = _index()
+
+    fallback = list(index.fallback_paragraphs())
+    assert "Outside the article." not in fallback
+    assert fallback[0] == "Intro to the first link section."
+    # Every distinct non-empty <p> is in the buffer exactly once
+    assert len(index.offsets) - 1 == len(fallback)
+    assert index.text.decode("utf-8").count("Nested text ✓") == 1
+
+
+def test_collect_text_stops_once_max_chars_reached():
+    assert collect_text(iter([]), 10) is None
+    assert collect_text(iter(["abcdef", "ghijkl", "mnop"]), 8) == "abcdef ghijkl"
+
+
+def test_memory_report():
+    report = _index().memory_report()
+    assert report["sections"] == 4
+    assert report["paragraphs"] == 5
+    assert report["bytes"] > report["text_bytes"] > 0
+    assert report["bytes_per_section"] == report["bytes"] // 4
+
+
+def test_diff_only_reports_sections_whose_content_changed():
+    old = _index()
+    edited = HTML.replace("Only text in the second section.", "Edited.").replace(
+        '<h3 id="nested">', '<h3 id="renamed">'
+    )
+    new = build_page_index(BeautifulSoup(edited, "html.parser"), PAGE_URL)
+
+    diff = diff_indexes(old, new)
+    assert diff.changed == {"second"}
+    assert diff.added == {"renamed"} and diff.removed == {"nested"}
+    assert diff.unchanged == {"first", "para-anchor"}
+    # "Edited." is also a fallback paragraph
+    assert diff.page_changed
+    assert new.content_digest("first") == old.content_digest("first")
+    assert new.content_digest("second") != old.content_digest("second")
+    assert new.content_digest("missing") is None
+
+
+def test_content_digest_is_a_fixed_size_hash():
+    old = _index()
+    digests = [old.content_digest(a) for a in (None, "first", "second")]
+    assert all(len(d) == 16 and b"page.png" not in d for d in digests)
+
+    # "second" has no image of its own, so it depends on the page's og:image
+    moved = HTML.replace("/images/page.png", "/images/other.png")
+    new = build_page_index(BeautifulSoup(moved, "html.parser"), PAGE_URL)
+    assert new.content_digest("second") != old.content_digest("second")
+    assert new.content_digest("first") == old.content_digest("first")
+
+
+def test_diff_against_identical_page_is_empty():
+    diff = diff_indexes(_index(), _index())
+    assert not diff.stale_anchors and not diff.page_changed
+    assert diff_indexes(None, _index()).added == set(_index().sections)
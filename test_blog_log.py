@@ -0,0 +1,82 @@
+import json
+import logging
+import threading
+
+import pytest
+
+import blog_log
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.threads = set()
+        self.setFormatter(blog_log.JsonFormatter())
+
+    def emit(self, record):
+        self.threads.add(threading.current_thread().name)
+        self.lines.append(json.loads(self.format(record)))
+
+
+@pytest.fixture
+def sink():
+    handler = _ListHandler()
+    blog_log.reset()
+    blog_log.configure([handler])
+    yield handler
+    blog_log.configure()
+    blog_log.reset()
+
+
+def test_events_are_structured_and_written_off_thread(sink):
+    blog_log.log_event("fetch_failed", logging.ERROR, url="https://idvork.in/x")
+    blog_log.flush()
+
+    assert sink.lines == [
+        {
+            "ts": sink.lines[0]["ts"],
+            "level": "ERROR",
+            "event": "fetch_failed",
+            "url": "https://idvork.in/x",
+        }
+    ]
+    assert threading.current_thread().name not in sink.threads
+
+
+def test_sampling_drops_most_noisy_events(sink, monkeypatch):
+    rolls = iter([0.5, 0.01, 0.9])
+    monkeypatch.setattr(blog_log.random, "random", lambda: next(rolls))
+
+    for _ in range(3):
+        blog_log.log_event("url_rejected", sample_rate=0.05, netloc="evil.com")
+    blog_log.flush()
+
+    assert len(sink.lines) == 1
+    assert sink.lines[0]["sample_rate"] == 0.05
+    assert blog_log.stats["sampled_out"] == 2
+
+
+def test_error_events_are_rate_limited_per_event(sink):
+    for _ in range(blog_log.ERROR_BURST + 20):
+        blog_log.log_event("fetch_failed", logging.ERROR)
+    blog_log.log_event("preview_image_failed", logging.ERROR)
+    blog_log.flush()
+
+    events = [line["event"] for line in sink.lines]
+    assert events.count("fetch_failed") == blog_log.ERROR_BURST
+    assert events.count("preview_image_failed") == 1
+    assert blog_log.stats["rate_limited"] == 20
+
+
+def test_full_queue_drops_instead_of_blocking(monkeypatch):
+    import queue
+
+    full = queue.Queue(maxsize=1)
+    full.put_nowait(None)
+    handler = blog_log._DroppingQueueHandler(full)
+    blog_log.reset()
+
+    handler.emit(logging.makeLogRecord({"msg": "fetch_failed"}))
+
+    assert blog_log.stats["dropped"] == 1
@@ -0,0 +1,88 @@
+import sys
+
+import pytest
+
+from blog_memory import (
+    RssSample,
+    RssSampler,
+    RssSamplingMiddleware,
+    TraceSession,
+    current_rss,
+    peak_rss,
+    sizeof,
+)
+
+
+def test_sizeof_counts_shared_objects_once_and_uses_nbytes():
+    body = "x" * 10_000
+    once = sizeof({"a": (body, 1)})
+    twice = sizeof({"a": (body, 1), "b": (body, 1)})
+    assert once > len(body)
+    assert twice - once < 1000  # the second reference adds a key and a tuple
+
+    class Index:
+        def nbytes(self):
+            return 12345
+
+    assert (
+        sizeof({"page": Index()})
+        == sizeof({"page": None}) - sys.getsizeof(None) + 12345
+    )
+
+
+def test_sizeof_follows_plain_objects():
+    class Holder:
+        def __init__(self):
+            self.data = [b"y" * 5000]
+
+    assert sizeof(Holder()) > 5000
+
+
+def test_rss_is_reported():
+    assert peak_rss() > 0
+    rss = current_rss()
+    assert rss is None or 0 < rss <= peak_rss() * 2
+
+
+def test_sampler_summary():
+    sampler = RssSampler(size=3)
+    for path, growth in [("/a", 10), ("/b", 0), ("/c", 300), ("/d", 20)]:
+        sampler.record(RssSample(path, 1000, 1000 + growth, 5000, 5000 + growth // 100))
+    summary = sampler.summary(top=2)
+    assert summary["count"] == 4
+    assert summary["growth_max_bytes"] == 300
+    assert summary["raised_peak"] == 1
+    assert [r["path"] for r in summary["largest"]] == ["/c", "/d"]
+
+
+@pytest.mark.asyncio
+async def test_middleware_samples_only_chosen_requests():
+    async def app(scope, receive, send):
+        pass
+
+    sampler = RssSampler()
+    middleware = RssSamplingMiddleware(
+        app, sample=lambda scope: scope["path"] == "/big", sampler=sampler
+    )
+    for path in ("/small", "/big"):
+        await middleware({"type": "http", "path": path}, None, None)
+    if current_rss() is not None:
+        assert [s.path for s in sampler.samples] == ["/big"]
+
+
+def test_trace_session_diffs_against_the_previous_snapshot():
+    session = TraceSession()
+    assert session.snapshot() == {"tracing": False}
+    session.start()
+    try:
+        session.snapshot()
+        leak = [bytearray(1000) for _ in range(200)]  # noqa: F841
+        report = session.snapshot()
+    finally:
+        assert session.stop() == {"tracing": False}
+
+    assert report["tracing"] and report["group_by"] == "lineno"
+    [grown] = [d for d in report["diff"] if "test_blog_memory.py" in d["where"]]
+    assert grown["bytes_diff"] >= 200 * 1000
+    with pytest.raises(ValueError):
+        session.snapshot(group_by="traceback")
@@ -0,0 +1,221 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import blog_origin
+from blog_origin import (
+    BACKGROUND,
+    FOREGROUND,
+    CircuitBreaker,
+    Deadline,
+    OriginScheduler,
+    background_work,
+    current_priority,
+    fetch_timeout,
+    hedged_call,
+    request_deadline,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_recovers_through_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=clock)
+
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    # After the cool-down exactly one trial request goes out
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_fetch_timeout_is_capped_by_request_deadline():
+    assert fetch_timeout(5) == 5
+
+    with request_deadline(1.0):
+        assert 0 < fetch_timeout(5) <= 1.0
+
+    with request_deadline(0):
+        assert fetch_timeout(5) is None
+
+    # The budget only applies inside the block
+    assert fetch_timeout(5) == 5
+
+
+def test_deadline_remaining_never_negative():
+    clock = FakeClock()
+    deadline = Deadline(2, clock=clock)
+    clock.now += 5
+    assert deadline.remaining() == 0
+    assert deadline.expired
+
+
+def test_breaker_for_reuses_per_host_breakers():
+    blog_origin.reset()
+    assert blog_origin.breaker_for("idvork.in") is blog_origin.breaker_for("idvork.in")
+    assert blog_origin.breaker_for("idvork.in") is not blog_origin.breaker_for(
+        "www.idvork.in"
+    )
+    assert set(blog_origin.breaker_snapshots()) == {"idvork.in", "www.idvork.in"}
+
+
+def test_latency_window_percentiles():
+    window = blog_origin.LatencyWindow(size=100)
+    assert window.percentile(50) is None
+
+    for ms in range(1, 101):
+        window.record(ms / 1000)
+
+    assert window.percentile(50) == 0.051
+    assert window.percentile(99) == 0.1
+    assert window.summary()["count"] == 100
+    assert window.summary()["p95_ms"] == 96.0
+
+
+def _blocked(result, release: threading.Event):
+    def attempt():
+        release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return attempt
+
+
+def test_hedge_not_fired_when_primary_is_fast():
+    blog_origin.reset()
+    with ThreadPoolExecutor(2) as pool:
+        assert hedged_call(lambda: "primary", lambda: "hedge", 1.0, pool) == "primary"
+    assert blog_origin.stats["hedges_fired"] == 0
+
+
+def test_slow_primary_loses_to_hedge():
+    blog_origin.reset()
+    release = threading.Event()
+    with ThreadPoolExecutor(2) as pool:
+        result = hedged_call(_blocked("primary", release), lambda: "hedge", 0.01, pool)
+        release.set()
+    assert result == "hedge"
+    assert blog_origin.stats["hedges_fired"] == 1
+    assert blog_origin.stats["hedges_won"] == 1
+
+
+def test_failed_hedge_waits_for_primary():
+    blog_origin.reset()
+    release = threading.Event()
+
+    def failing_hedge():
+        release.set()
+        raise ConnectionError("alternate down")
+
+    with ThreadPoolExecutor(2) as pool:
+        result = hedged_call(_blocked("primary", release), failing_hedge, 0.01, pool)
+    assert result == "primary"
+    assert blog_origin.stats["hedges_won"] == 0
+
+
+def test_primary_error_raised_when_both_fail():
+    release = threading.Event()
+
+    def failing_hedge():
+        release.set()
+        raise ConnectionError("alternate down")
+
+    with ThreadPoolExecutor(2) as pool, pytest.raises(TimeoutError):
+        hedged_call(_blocked(TimeoutError("slow"), release), failing_hedge, 0.01, pool)
+
+
+def test_scheduler_caps_fetches_globally_and_per_host():
+    scheduler = OriginScheduler(max_concurrency=3, max_per_host=2)
+    with scheduler.slot("a") as first, scheduler.slot("a") as second:
+        assert first and second
+        with scheduler.slot("a") as third:
+            assert not third  # per-host cap
+        with scheduler.slot("b") as other_host, scheduler.slot("c") as over:
+            assert other_host and not over  # global cap
+    assert scheduler.active == 0 and not scheduler.per_host
+
+    report = scheduler.report()["priorities"][FOREGROUND]
+    assert report["granted"] == 3 and report["rejected"] == 2
+
+
+def test_lease_is_given_back_by_its_last_holder():
+    scheduler = OriginScheduler(max_concurrency=1, max_per_host=1)
+    lease = scheduler.lease("a")
+    lease.hold()  # e.g. handed to a request that outlives the caller
+    lease.release()
+    assert scheduler.lease("a") is None
+    lease.release()
+    assert scheduler.active == 0 and not scheduler.per_host
+    assert scheduler.lease("a") is not None
+
+
+def test_background_waits_while_a_request_is_waiting():
+    scheduler = OriginScheduler(max_concurrency=1, max_per_host=1)
+    order = []
+
+    def fetch(priority):
+        with scheduler.slot("a", priority, timeout=5) as granted:
+            assert granted
+            order.append(priority)
+
+    with scheduler.slot("a"):
+        background = threading.Thread(target=fetch, args=(BACKGROUND,))
+        background.start()
+        while not scheduler.waiting[BACKGROUND]:
+            pass
+        foreground = threading.Thread(target=fetch, args=(FOREGROUND,))
+        foreground.start()
+        while not scheduler.waiting[FOREGROUND]:
+            pass
+    background.join()
+    foreground.join()
+
+    assert order == [FOREGROUND, BACKGROUND]
+    assert scheduler.report()["priorities"][BACKGROUND]["peak_waiting"] == 1
+
+
+def test_background_work_sets_the_priority_for_the_block():
+    assert current_priority() == FOREGROUND
+    with background_work():
+        assert current_priority() == BACKGROUND
+    assert current_priority() == FOREGROUND
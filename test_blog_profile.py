@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+import blog_profile
+from blog_profile import ProfileRing, ProfilingMiddleware, RequestProfile
+
+
+def _parse_the_page():
+    return sum(range(1000))
+
+
+def test_request_profile_merges_every_thread():
+    profile = RequestProfile()
+    threads = [
+        threading.Thread(target=profile.run, args=(_parse_the_page,)) for _ in range(3)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert profile.run(_parse_the_page) == 499500
+
+    assert len(profile.profilers) == 4
+    reports = profile.reports()
+    assert set(reports) == set(blog_profile.SORT_KEYS)
+    lines = reports["cumulative"].splitlines()
+    [line] = [line for line in lines if "_parse_the_page" in line]
+    assert line.split()[0] == "4"  # calls, across all four threads
+
+
+def test_nested_runs_keep_the_outer_profiler():
+    profile = RequestProfile()
+    assert profile.run(profile.run, _parse_the_page) == 499500
+    assert len(profile.profilers) == 1
+    assert "_parse_the_page" in profile.reports()["tottime"]
+
+
+def test_call_and_bind_do_nothing_outside_a_profiled_request():
+    assert blog_profile.call(_parse_the_page) == 499500
+    assert blog_profile.bind(_parse_the_page) is _parse_the_page
+
+
+def test_ring_keeps_the_newest():
+    ring = ProfileRing(capacity=2)
+    for path in ("/a", "/b", "/c"):
+        ring.add(
+            method="GET",
+            path=path,
+            reason="sampled",
+            status=200,
+            started="",
+            seconds=0.0,
+            profile=RequestProfile(),
+        )
+    assert [s["path"] for s in ring.summaries()] == ["/c", "/b"]
+    assert ring.get(1) is None
+    assert ring.get(3).path == "/c"
+
+
+@pytest.mark.asyncio
+async def test_middleware_profiles_only_chosen_requests():
+    async def app(scope, receive, send):
+        blog_profile.call(_parse_the_page)
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    ring = ProfileRing()
+    middleware = ProfilingMiddleware(
+        app,
+        choose=lambda scope: "header" if scope["path"] == "/slow" else None,
+        ring=ring,
+    )
+    for path in ("/fast", "/slow"):
+        await middleware({"type": "http", "method": "GET", "path": path}, None, send)
+
+    [record] = ring.records
+    assert (record.path, record.reason, record.status) == ("/slow", "header", 204)
+    # Nothing is formatted until the report is read
+    assert record.profile._reports == {}
+    assert "_parse_the_page" in record.profile.report("cumulative")
+    assert list(record.profile._reports) == ["cumulative"]
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from blog_refresh import RefreshResult, plan_refresh, summarize
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+def test_plan_picks_hottest_pages_that_expire_before_next_run():
+    hits = {"a": 50, "b": 40, "c": 30, "d": 20, "e": 1}
+    expiries = {
+        "a": NOW + timedelta(minutes=2),  # expires before the next run
+        "b": NOW + timedelta(minutes=14),  # still fresh at the next run
+        "c": NOW - timedelta(minutes=1),  # already expired
+        # d was evicted or never fetched
+        "e": NOW,
+    }
+    plan = plan_refresh(hits, expiries, NOW, top_n=4, interval=timedelta(minutes=5))
+    assert plan == ["a", "c", "d"]
+
+
+def test_plan_ties_are_deterministic():
+    hits = {"b": 1, "a": 1}
+    assert plan_refresh(hits, {}, NOW, top_n=1) == ["a"]
+
+
+def test_summary_counts_changes_and_failures():
+    results = [
+        RefreshResult("a", True, 0.1, 2, False),
+        RefreshResult("b", True, 0.1, 0, False),
+        RefreshResult("c", True, 0.1, 0, True),
+        RefreshResult("d", False, 0.1, None, False),
+    ]
+    assert summarize(results, 0.4567) == {
+        "seconds": 0.457,
+        "pages": 4,
+        "failed": 1,
+        "pages_changed": 2,
+        "sections_changed": 2,
+    }
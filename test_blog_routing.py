@@ -0,0 +1,131 @@
+import pytest
+from starlette.requests import Request
+
+from blog_routing import (
+    AnchorIndex,
+    PageSpellings,
+    RouteKey,
+    canonical_key,
+    key_for_request,
+    page_as_written,
+)
+
+LEADERSHIP = RouteKey("manager-book", "leadership")
+
+
+@pytest.mark.parametrize(
+    "full_path, path_param",
+    [
+        ("manager-book/leadership", None),
+        ("manager-book/leadership/", None),
+        ("/manager-book//leadership", None),
+        ("Manager-Book/Leadership", None),
+        ("manager-book.html/leadership", None),
+        ("manager-book/leadership/extra-part", None),
+        ("manager-book%23leadership", None),
+        ("manager-book#leadership", None),
+        ("leadership", None),
+        ("", "manager-book#leadership"),
+        ("", "manager-book%23leadership"),
+        ("", "manager-book/leadership"),
+        ("ignored/path", "Manager-Book#Leadership"),
+    ],
+)
+def test_equivalent_forms_share_a_key(full_path, path_param):
+    assert canonical_key(full_path, path_param) == LEADERSHIP
+
+
+@pytest.mark.parametrize(
+    "full_path, path_param, expected",
+    [
+        ("", None, RouteKey("manager-book", None)),
+        ("/", None, RouteKey("manager-book", None)),
+        ("favicon.ico", None, RouteKey("manager-book", None)),
+        ("", "timeoff", RouteKey("timeoff", None)),
+        ("", "timeoff.html", RouteKey("timeoff", None)),
+        ("", "timeoff#", RouteKey("timeoff", None)),
+        ("my-page/my-topic", None, RouteKey("my-page", "my-topic")),
+    ],
+)
+def test_defaults_and_pages_without_anchors(full_path, path_param, expected):
+    assert canonical_key(full_path, path_param) == expected
+
+
+def test_route_key_urls():
+    assert LEADERSHIP.url == "https://idvork.in/manager-book"
+    assert LEADERSHIP.redirect_url == "https://idvork.in/manager-book#leadership"
+    assert RouteKey("timeoff", None).redirect_url == "https://idvork.in/timeoff#"
+
+
+def test_anchor_index_prefers_the_manager_book_then_the_first_page():
+    anchors = AnchorIndex()
+    anchors.update_page("travel", ["packing", "leadership"])
+    # Until the manager book is indexed, a bare anchor stays on it
+    assert anchors.page_for("packing") == "manager-book"
+
+    anchors.update_page("manager-book", ["leadership"])
+    anchors.update_page("camping", ["packing"])
+    assert anchors.page_for("leadership") == "manager-book"
+    assert anchors.page_for("packing") == "camping"
+    assert anchors.page_for("unknown") == "manager-book"
+    assert anchors.ambiguous() == 2
+
+    anchors.update_page("camping", ["tents"])
+    assert anchors.page_for("packing") == "travel"
+    anchors.remove_page("travel")
+    assert anchors.page_for("packing") == "manager-book"
+    assert len(anchors) == 2
+
+
+def _request(query_string=b""):
+    return Request({"type": "http", "query_string": query_string, "headers": []})
+
+
+def test_only_bare_anchors_are_resolved():
+    anchors = AnchorIndex()
+    anchors.update_page("manager-book", [])
+    anchors.update_page("travel", ["packing"])
+
+    assert key_for_request(_request(), "packing", anchors) == ("travel", "packing")
+    assert key_for_request(_request(), "Packing/", anchors) == ("travel", "packing")
+    assert key_for_request(_request(), "manager-book/packing", anchors) == (
+        "manager-book",
+        "packing",
+    )
+    assert key_for_request(_request(b"path=manager-book%23packing"), "", anchors) == (
+        "manager-book",
+        "packing",
+    )
+    assert key_for_request(_request(), "packing") == ("manager-book", "packing")
+
+
+@pytest.mark.parametrize(
+    "full_path, path_param, written",
+    [
+        ("Some-Page/Leadership", None, "Some-Page"),
+        ("/Some-Page.HTML/leadership/", None, "Some-Page"),
+        ("Some-Page%23Leadership", None, "Some-Page"),
+        ("ignored", "Some-Page#Leadership", "Some-Page"),
+        ("Leadership", None, "manager-book"),
+    ],
+)
+def test_page_as_written_keeps_its_case(full_path, path_param, written):
+    assert page_as_written(full_path, path_param) == written
+    assert canonical_key(full_path, path_param).page == written.lower()
+
+
+def test_requests_record_mixed_case_spellings():
+    spellings = PageSpellings(capacity=2)
+    key = key_for_request(_request(), "Some-Page/leadership", spellings=spellings)
+    assert key == ("some-page", "leadership")
+    key_for_request(_request(), "SOME-PAGE/leadership", spellings=spellings)
+    key_for_request(_request(), "lower-page/leadership", spellings=spellings)
+    # The first spelling is kept; all-lowercase pages need no entry
+    assert spellings.pages == {"some-page": "Some-Page"}
+    assert spellings.spell("lower-page") == "lower-page"
+
+    spellings.forget("some-page")
+    key_for_request(_request(b"path=Other%23x"), "", spellings=spellings)
+    key_for_request(_request(), "SOME-PAGE/leadership", spellings=spellings)
+    key_for_request(_request(), "Third/leadership", spellings=spellings)
+    assert spellings.pages == {"some-page": "SOME-PAGE", "third": "Third"}
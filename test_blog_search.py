@@ -0,0 +1,69 @@
+from bs4 import BeautifulSoup
+
+from blog_index import build_page_index
+from blog_search import SearchIndex, tokenize
+
+PAGE_URL = "https://idvork.in/manager-book"
+
+HTML = """
+<html><body>
+    <h2 id="feedback">Giving feedback</h2>
+    <p>Feedback should be timely and specific.</p>
+    <h2 id="one-on-ones">One on ones</h2>
+    <p>Use one on ones for career growth and feedback.</p>
+    <p>Keep a shared doc of topics.</p>
+    <h2 id="hiring">Hiring</h2>
+    <p>Hire for slope, not intercept.</p>
+</body></html>
+"""
+
+
+def _index(html=HTML):
+    return build_page_index(BeautifulSoup(html, "html.parser"), PAGE_URL)
+
+
+def _search_index():
+    search = SearchIndex()
+    search.update_page("manager-book", _index())
+    return search
+
+
+def test_tokenize_lowercases_and_splits_on_punctuation():
+    assert tokenize("Slope, not Intercept!") == ["slope", "not", "intercept"]
+
+
+def test_heading_matches_rank_first():
+    hits = _search_index().search("feedback")
+    assert [h.anchor for h in hits] == ["feedback", "one-on-ones"]
+    assert hits[0].heading == "Giving feedback"
+    assert hits[0].snippet == "Feedback should be timely and specific."
+
+
+def test_every_query_term_has_to_match():
+    search = _search_index()
+    assert [h.anchor for h in search.search("feedback career")] == ["one-on-ones"]
+    assert search.search("feedback nonexistent") == []
+    assert search.search("  ") == []
+
+
+def test_updating_changed_anchors_only():
+    search = _search_index()
+    edited = HTML.replace("Hire for slope", "Hire for curiosity").replace(
+        '<h2 id="feedback">', '<h2 id="giving-feedback">'
+    )
+    search.update_page(
+        "manager-book", _index(edited), ["hiring", "feedback", "giving-feedback"]
+    )
+
+    assert search.search("slope") == []
+    assert [h.anchor for h in search.search("curiosity")] == ["hiring"]
+    assert [h.anchor for h in search.search("timely")] == ["giving-feedback"]
+    assert len(search) == 3
+
+
+def test_remove_page_drops_its_postings():
+    search = _search_index()
+    search.remove_page("manager-book")
+    assert len(search) == 0
+    assert search.postings == {}
+    assert search.total_length == 0
@@ -0,0 +1,44 @@
+import pytest
+
+from blog_shadow import Extraction, ShadowStore, as_extraction, load_engine
+
+CURRENT = Extraction("Some text.", "Heading", None, "https://idvork.in/og.png")
+
+
+def test_report_counts_mismatches_per_field():
+    store = ShadowStore(capacity=2)
+    store.record("p", "a", CURRENT, CURRENT, 0.010, 0.002)
+    store.record("p", "a", CURRENT, CURRENT._replace(heading="Other"), 0.010, 0.004)
+    changed = CURRENT._replace(description="Some", section_image="x.png")
+    mismatch = store.record("p", "b", CURRENT, changed, 0.010, 0.003)
+
+    assert mismatch.fields == {
+        "description": ["Some text.", "Some"],
+        "section_image": [None, "x.png"],
+    }
+    report = store.report()
+    assert report["comparisons"] == 3 and report["mismatches"] == 2
+    assert report["mismatch_rate"] == round(2 / 3, 4)
+    assert report["field_mismatch_rates"]["heading"] == round(1 / 3, 4)
+    assert report["field_mismatch_rates"]["page_image"] == 0
+    assert report["latency"]["delta"]["p50_ms"] < 0  # the candidate is faster
+    assert [m["anchor"] for m in report["recent_mismatches"]] == ["b", "a"]
+
+
+def test_candidate_errors_are_kept():
+    store = ShadowStore()
+    store.record_error("p", None, ValueError("boom"))
+    report = store.report()
+    assert report["candidate_errors"] == 1
+    assert report["recent_mismatches"][0]["fields"]["error"][1] == "ValueError('boom')"
+
+
+def test_engines_may_return_tuples_or_dicts():
+    assert as_extraction(tuple(CURRENT)) == CURRENT
+    assert as_extraction(CURRENT._asdict()) == CURRENT
+
+
+def test_load_engine():
+    assert load_engine("blog_shadow:as_extraction") is as_extraction
+    with pytest.raises(ValueError):
+        load_engine("blog_shadow")
@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import blog_shortlinks
+from blog_routing import RouteKey
+from blog_shortlinks import CODE_LENGTH, MemoryBackend, ShortLinks
+
+BASE = "https://example.test/s"
+
+
+def test_codes_are_short_stable_and_resolve():
+    key = RouteKey("manager-book", "leadership")
+    links = ShortLinks(MemoryBackend(), BASE)
+    code = links.code_for(key)
+
+    assert len(code) == CODE_LENGTH and code.isalnum()
+    assert links.code_for(key) == code
+    assert links.url_for(key) == f"{BASE}/{code}"
+    assert links.resolve(code) == key
+    # Same code from an unrelated store: it's derived from the key
+    assert ShortLinks(MemoryBackend(), BASE).code_for(key) == code
+
+
+def test_codes_minted_elsewhere_resolve_through_the_backend():
+    backend = MemoryBackend()
+    key = RouteKey("my-page", "my-topic")
+    code = ShortLinks(backend, BASE).code_for(key)
+
+    other_container = ShortLinks(backend, BASE)
+    assert other_container.resolve(code) == key
+    assert other_container.resolve("nope") is None
+    assert other_container.resolve("unknown1") is None
+
+
+def test_unknown_codes_are_remembered_for_a_while():
+    backend = MemoryBackend()
+    links = ShortLinks(backend, BASE)
+    key = RouteKey("my-page", "my-topic")
+    code = ShortLinks(MemoryBackend(), BASE).code_for(key)
+
+    with patch.object(backend, "get", wraps=backend.get) as get:
+        assert links.resolve(code) is None
+        assert links.resolve(code) is None
+        assert get.call_count == 1
+
+        # Minted by another container: found once the entry expires
+        ShortLinks(backend, BASE).code_for(key)
+        later = (
+            blog_shortlinks.time.monotonic() + blog_shortlinks.UNKNOWN_CODE_TTL_SECONDS
+        )
+        with patch("blog_shortlinks.time.monotonic", return_value=later):
+            assert links.resolve(code) == key
+        assert get.call_count == 2
+
+
+def test_unknown_code_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(blog_shortlinks, "MAX_UNKNOWN_CODES", 2)
+    links = ShortLinks(MemoryBackend(), BASE)
+    for code in ("unknown1", "unknown2", "unknown3"):
+        links.resolve(code)
+    assert list(links.unknown) == ["unknown2", "unknown3"]
+
+
+def test_collisions_get_a_longer_code():
+    first, second = RouteKey("a", "one"), RouteKey("b", "two")
+    codes = {first: "x" * 22, second: "x" * 10 + "y" * 12}
+    with patch.object(blog_shortlinks, "_full_code", lambda key: codes[key]):
+        links = ShortLinks(MemoryBackend(), BASE)
+        assert links.code_for(first) == "x" * CODE_LENGTH
+        # The next longer prefix of the second key's code is still free
+        assert links.code_for(second) == "x" * (CODE_LENGTH + 1)
+
+        # A fresh container loads both mappings and agrees
+        reloaded = ShortLinks(links.backend, BASE)
+        assert reloaded.code_for(second) == "x" * (CODE_LENGTH + 1)
+        assert reloaded.resolve("x" * CODE_LENGTH) == first
+
+
+def test_a_slow_store_write_doesnt_hold_up_other_keys():
+    import threading
+
+    known, slow, other = (
+        RouteKey("a", "known"),
+        RouteKey("b", "slow"),
+        RouteKey("c", "x"),
+    )
+    links = ShortLinks(MemoryBackend(), BASE)
+    known_code = links.code_for(known)
+
+    entered, release = threading.Event(), threading.Event()
+    put = links.backend.put_if_absent
+
+    def slow_put(code, path):
+        if path == slow.path:
+            entered.set()
+            release.wait(5)
+        return put(code, path)
+
+    links.backend.put_if_absent = slow_put
+    minting = threading.Thread(target=links.code_for, args=(slow,))
+    minting.start()
+    try:
+        assert entered.wait(5)
+        # None of these wait on the pending write
+        other_minting = threading.Thread(target=links.code_for, args=(other,))
+        other_minting.start()
+        other_minting.join(1)
+        assert not other_minting.is_alive()
+        assert links.resolve(known_code) == known
+        assert links.minted_url(slow) is None
+    finally:
+        release.set()
+        minting.join()
+    assert links.minted_url(slow) == links.url_for(slow)
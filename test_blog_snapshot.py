@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+
+import blog_snapshot
+from blog_snapshot import LocalDiskBackend, SnapshotError, decode, encode
+
+
+def test_round_trip_keeps_header_and_state():
+    created = datetime(2026, 1, 1, 12, 0)
+    data = encode({"pages": {"u": ("body", created)}}, created, pages=1)
+    header, state = decode(data)
+    assert header == {
+        "schema": blog_snapshot.SCHEMA_VERSION,
+        "created": "2026-01-01T12:00:00",
+        "pages": 1,
+    }
+    assert state == {"pages": {"u": ("body", created)}}
+
+
+def test_rejects_other_schemas_and_corrupt_files(monkeypatch):
+    data = encode({}, datetime(2026, 1, 1))
+    with pytest.raises(SnapshotError, match="not a cache snapshot"):
+        decode(b"hello")
+    with pytest.raises(SnapshotError, match="bad payload"):
+        decode(data[:-4])
+    monkeypatch.setattr(blog_snapshot, "SCHEMA_VERSION", 99)
+    with pytest.raises(SnapshotError, match="expected 99"):
+        decode(data)
+
+
+def test_local_disk_backend_replaces_atomically(tmp_path):
+    store = LocalDiskBackend(str(tmp_path / "snapshots"))
+    assert store.read() is None
+    store.write(b"one")
+    store.write(b"two")
+    assert store.read() == b"two"
+    # Only the snapshot itself is left behind, no temp files
+    assert [p.name for p in (tmp_path / "snapshots").iterdir()] == ["cache.snapshot"]
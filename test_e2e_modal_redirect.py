@@ -117,7 +117,7 @@ async def test_e2e_preview_text_api_no_params():
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-says"
+    assert data["url"].startswith(f"{DEPLOYED_URL}/s/")
 
 
 @pytest.mark.asyncio
@@ -130,7 +130,8 @@ async def test_e2e_preview_text_api_one_param():
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-says?path=manager-book%23my-topic"
+    # No such section on the page, so no short code is minted for it
+    assert data["url"] == f"{DEPLOYED_URL}/?path=manager-book%23my-topic"
 
 
 @pytest.mark.asyncio
@@ -143,7 +144,7 @@ async def test_e2e_preview_text_api_two_params():
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-says?path=my-page%23my-topic"
+    assert data["url"] == f"{DEPLOYED_URL}/?path=my-page%23my-topic"
 
 
 @pytest.mark.asyncio
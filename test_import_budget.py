@@ -0,0 +1,37 @@
+"""Cold-start import budget for modal_redirect.
+
+Re-record the numbers below with `just import-profile` when a change
+legitimately needs more modules at import time.
+"""
+
+from import_profile import measure
+
+# Recorded budget (on top of `import modal`, which the Modal runtime preloads)
+MAX_COLD_IMPORT_MODULES = 216
+MAX_COLD_IMPORT_SECONDS = 1.5
+
+# Only needed on a cache miss or when logging, so they must load lazily
+LAZY_PACKAGES = {"bs4", "soupsieve", "requests", "urllib3"}
+
+
+def test_cold_import_within_budget():
+    profile = measure()
+
+    eager = LAZY_PACKAGES & profile.top_level_packages
+    assert not eager, f"Imported at cold start, should be lazy: {sorted(eager)}"
+    assert len(profile.modules) <= MAX_COLD_IMPORT_MODULES, (
+        f"Cold import loads {len(profile.modules)} modules "
+        f"(budget {MAX_COLD_IMPORT_MODULES})"
+    )
+    assert profile.seconds <= MAX_COLD_IMPORT_SECONDS, (
+        f"Cold import took {profile.seconds:.2f}s (budget {MAX_COLD_IMPORT_SECONDS}s)"
+    )
+
+
+def test_lazy_modules_load_on_first_use():
+    import modal_redirect
+
+    # Attribute access goes through to the real module
+    assert modal_redirect.requests.RequestException.__name__ == "RequestException"
+    soup = modal_redirect.BeautifulSoup("<p id='x'>hi</p>", "html.parser")
+    assert soup.find(id="x").get_text() == "hi"
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 import httpx
 import pytest
 from bs4 import BeautifulSoup  # For parsing HTML and checking tags
@@ -99,61 +101,142 @@ async def test_redirect_three_params_ignored():
     assert get_redirect_url(html) == "https://idvork.in/my-page#my-topic"
 
 
+def _page_with_topic():
+    """Mocked upstream response with a my-topic section"""
+    from unittest.mock import Mock
+
+    response = Mock()
+    response.text = (
+        "<html><body><h2 id='my-topic'>My Topic</h2><p>Text.</p></body></html>"
+    )
+    response.raise_for_status = Mock()
+    return response
+
+
+def _short_url(page, anchor):
+    import modal_redirect
+    from blog_routing import RouteKey
+
+    return modal_redirect.short_links.url_for(RouteKey(page, anchor))
+
+
 @pytest.mark.asyncio
 async def test_preview_text_api_no_params():
     """Test the /preview_text endpoint with no parameters"""
-    async with httpx.AsyncClient(
-        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
-    ) as client:
-        response = await client.get("/preview_text/")
+    from unittest.mock import patch
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/preview_text/")
     assert response.status_code == 200
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-blog"
+    assert data["url"] == _short_url("manager-book", None)
 
 
 @pytest.mark.asyncio
 async def test_preview_text_api_one_param():
     """Test the /preview_text endpoint with one parameter (topic)"""
-    async with httpx.AsyncClient(
-        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
-    ) as client:
-        response = await client.get("/preview_text/my-topic")
+    from unittest.mock import patch
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/preview_text/my-topic")
     assert response.status_code == 200
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-blog?path=manager-book%23my-topic"
+    assert data["url"] == _short_url("manager-book", "my-topic")
 
 
 @pytest.mark.asyncio
 async def test_preview_text_api_two_params():
     """Test the /preview_text endpoint with two parameters (page and topic)"""
-    async with httpx.AsyncClient(
-        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
-    ) as client:
-        response = await client.get("/preview_text/my-page/my-topic")
+    from unittest.mock import patch
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/preview_text/my-page/my-topic")
     assert response.status_code == 200
     data = response.json()
     assert "preview" in data
     assert "url" in data
-    assert data["url"] == "https://tinyurl.com/igor-blog?path=my-page%23my-topic"
+    assert data["url"] == _short_url("my-page", "my-topic")
 
 
 @pytest.mark.asyncio
 async def test_preview_text_api_text_only():
     """Test the /preview_text endpoint with text_only parameter"""
+    from unittest.mock import patch
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/preview_text/my-page/my-topic?text_only=true")
+    assert response.status_code == 200
+    text = response.text
+    url = _short_url("my-page", "my-topic")
+    assert text.startswith(f"From: {url}\n\n")
+    assert "My Topic" not in text and "Text." in text
+
+
+@pytest.mark.asyncio
+async def test_short_link_redirects_in_one_hop():
+    """Share links are /s/{code} on this service and render the redirect page"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    url = _short_url("my-page", "my-topic")
+    assert url.startswith(f"{modal_redirect.SERVICE_URL}/s/")
+    code = url.rsplit("/", 1)[1]
+    assert len(code) == 6 and code.isalnum()
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get(f"/s/{code}")
+            unknown = await client.get("/s/zzzzzz")
+    assert response.status_code == 200
+    assert get_redirect_url(response.text) == "https://idvork.in/my-page#my-topic"
+    assert unknown.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_missing_anchors_get_long_share_links():
+    """Junk paths, and anything the lookup couldn't verify, get the ?path=
+    form instead of minting a short code"""
+    from unittest.mock import patch
+
+    import requests
+
+    import modal_redirect
+
     async with httpx.AsyncClient(
         transport=httpx.ASGITransport(app=web_app), base_url="http://test"
     ) as client:
-        response = await client.get("/preview_text/my-page/my-topic?text_only=true")
-    assert response.status_code == 200
-    text = response.text
-    assert "From: https://tinyurl.com/igor-blog?path=my-page%23my-topic" in text
-    assert text.startswith(
-        "From: https://tinyurl.com/igor-blog?path=my-page%23my-topic\n\n"
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            response = await client.get("/preview_text/my-page/no-such-anchor")
+        with patch(
+            "modal_redirect.requests.get", side_effect=requests.ConnectionError()
+        ):
+            unverified = await client.get("/preview_text/other-page/my-topic")
+    assert response.json()["url"] == (
+        f"{modal_redirect.SERVICE_URL}/?path=my-page%23no-such-anchor"
     )
+    assert unverified.json()["url"] == (
+        f"{modal_redirect.SERVICE_URL}/?path=other-page%23my-topic"
+    )
+    assert len(modal_redirect.short_links) == 0
 
 
 @pytest.mark.asyncio
@@ -583,3 +666,1321 @@ async def test_page_cache():
         assert (
             modal_redirect.page_cache["https://idvork.in/manager-book"][0] == mock_html
         )
+
+
+@pytest.mark.asyncio
+async def test_equivalent_links_share_rendered_cache():
+    """Variants of the same share link are served from one cached render"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    modal_redirect.page_cache.clear()
+    modal_redirect.rendered_cache.clear()
+
+    mock_html = """
+    <html>
+    <body>
+        <h2 id="leadership">Leadership</h2>
+        <p>Leading people.</p>
+        <img src="https://example.com/lead.png">
+    </body>
+    </html>
+    """
+
+    with patch("modal_redirect.requests.get") as mock_get:
+        mock_response = Mock()
+        mock_response.text = mock_html
+        mock_response.raise_for_status = Mock()
+        mock_get.return_value = mock_response
+
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            first = await client.get("/manager-book/leadership")
+            calls_after_first = mock_get.call_count
+            variants = [
+                await client.get("/Manager-Book/Leadership/"),
+                await client.get("/leadership"),
+                await client.get("/?path=manager-book%23leadership"),
+                await client.get("/manager-book%23leadership"),
+            ]
+
+    assert calls_after_first == 1
+    assert mock_get.call_count == 1
+    assert all(v.text == first.text for v in variants)
+    assert list(modal_redirect.rendered_cache) == [("manager-book", "leadership")]
+
+
+@pytest.mark.asyncio
+async def test_missing_page_is_negative_cached():
+    """Repeat hits on a 404 page render the fallback with no upstream fetch"""
+    from unittest.mock import Mock, patch
+
+    import requests
+
+    import modal_redirect
+
+    not_found = Mock(status_code=404)
+    mock_response = Mock()
+    mock_response.raise_for_status = Mock(
+        side_effect=requests.HTTPError("404", response=not_found)
+    )
+
+    with patch("modal_redirect.requests.get", return_value=mock_response) as mock_get:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            first = await client.get("/wp-admin/setup.php")
+            second = await client.get("/wp-admin/setup.php")
+
+    assert mock_get.call_count == 1
+    assert first.text == second.text
+    assert get_meta_og_content(second.text, "og:title") == "Setup.php (Wp admin)"
+    expiry = modal_redirect.negative_cache[("https://idvork.in/wp-admin", None)]
+    assert expiry - datetime.now() > modal_redirect.FETCH_FAILURE_TTL
+
+
+@pytest.mark.asyncio
+async def test_fetch_failure_is_negative_cached_briefly():
+    """Network failures are remembered, but for a shorter TTL than 404s"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    with patch("modal_redirect.requests.get") as mock_get:
+        mock_get.side_effect = Exception("Network error")
+        for _ in range(3):
+            assert modal_redirect.fetch_cached_html("https://idvork.in/timeoff") is None
+
+    assert mock_get.call_count == 1
+    expiry = modal_redirect.negative_cache[("https://idvork.in/timeoff", None)]
+    assert expiry - datetime.now() <= modal_redirect.FETCH_FAILURE_TTL
+
+
+def test_missing_anchor_is_negative_cached():
+    """A missing anchor is only searched for once per negative-cache TTL"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    mock_response = Mock()
+    mock_response.text = "<html><body><h2 id='real'>Real</h2><p>Text.</p></body></html>"
+    mock_response.raise_for_status = Mock()
+    url = "https://idvork.in/manager-book"
+
+    with patch("modal_redirect.requests.get", return_value=mock_response):
+        assert modal_redirect.get_heading_text_from_url(url, "junk") is None
+        assert modal_redirect.is_known_miss(url, "junk")
+
+        with patch("modal_redirect.BeautifulSoup") as mock_soup:
+            assert modal_redirect.get_heading_text_from_url(url, "junk") is None
+            assert modal_redirect.get_section_image_from_url(url, "junk") is None
+        mock_soup.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_skips_origin_and_uses_url_title():
+    """With the origin's breaker open, requests answer from the URL alone"""
+    from unittest.mock import patch
+
+    import blog_origin
+
+    breaker = blog_origin.breaker_for("idvork.in")
+    for _ in range(blog_origin.BREAKER_FAILURE_THRESHOLD):
+        breaker.record_failure()
+
+    with patch("modal_redirect.requests.get") as mock_get:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            response = await client.get("/manager-book/time-off-3-ps")
+
+    mock_get.assert_not_called()
+    assert (
+        get_meta_og_content(response.text, "og:title")
+        == "Time off 3 ps (Igor's Manager Book)"
+    )
+    assert blog_origin.stats["breaker_open"] >= 1
+
+
+def test_deadline_exhausted_while_half_open_keeps_the_trial():
+    """A request whose budget runs out before it fetches mustn't take the
+    breaker's single half-open trial with it"""
+    from unittest.mock import patch
+
+    import blog_origin
+    import modal_redirect
+
+    breaker = blog_origin.breaker_for("idvork.in")
+    for _ in range(blog_origin.BREAKER_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    breaker.opened_at -= blog_origin.BREAKER_RESET_SECONDS  # cool-down over
+
+    url = "https://idvork.in/manager-book"
+    # Budget left to wait for an origin slot, none once it's granted
+    with patch("modal_redirect.fetch_timeout", side_effect=[1.0, None]):
+        assert modal_redirect.fetch_cached_page(url) is None
+    assert modal_redirect.origin_stats["deadline_exhausted"] == 1
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        modal_redirect.negative_cache.clear()
+        assert modal_redirect.fetch_cached_page(url) is not None
+    assert breaker.state == blog_origin.CircuitBreaker.CLOSED
+
+
+def test_spent_deadline_serves_stale_page():
+    """Once the request budget is spent an expired cached page is still used"""
+    from datetime import timedelta
+    from unittest.mock import patch
+
+    import blog_origin
+    import modal_redirect
+
+    url = "https://idvork.in/manager-book"
+    stale = "<html><body><h2 id='a'>Stale Heading</h2></body></html>"
+    modal_redirect.page_cache[url] = (stale, datetime.now() - timedelta(minutes=1))
+
+    with patch("modal_redirect.requests.get") as mock_get:
+        with blog_origin.request_deadline(0):
+            assert modal_redirect.get_heading_text_from_url(url, "a") == "Stale Heading"
+
+    mock_get.assert_not_called()
+    assert blog_origin.stats["deadline_exhausted"] >= 1
+
+
+def test_fetch_failure_serves_stale_page():
+    from datetime import timedelta
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    url = "https://idvork.in/manager-book"
+    stale = "<html><body><p>Old text</p></body></html>"
+    modal_redirect.page_cache[url] = (stale, datetime.now() - timedelta(minutes=1))
+
+    with patch("modal_redirect.requests.get", side_effect=Exception("timeout")):
+        assert modal_redirect.fetch_cached_html(url) == stale
+
+
+@pytest.mark.asyncio
+async def test_admin_metrics_requires_token(monkeypatch):
+    import modal_redirect
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", None)
+        disabled = await client.get("/admin/metrics")
+
+        monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+        wrong = await client.get("/admin/metrics", headers={"X-Admin-Token": "nope"})
+        ok = await client.get("/admin/metrics", headers={"X-Admin-Token": "s3cret"})
+
+    assert disabled.status_code == 404
+    assert wrong.status_code == 403
+    assert ok.status_code == 200
+    assert set(ok.json()) == {
+        "caches",
+        "page_cache",
+        "origin",
+        "lookups",
+        "logging",
+        "probes",
+        "profiles",
+        "admission",
+    }
+
+
+def test_resolve_preview_costs_one_fetch_and_one_parse():
+    """Concurrent lookups join on a single fetch and a single shared parse"""
+    import time
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    mock_response = Mock()
+    mock_response.text = """
+    <html>
+    <head><meta property="og:image" content="https://example.com/page.png"></head>
+    <body>
+        <h2 id="my-section">My Section</h2>
+        <p>Section text.</p>
+        <img src="https://example.com/section.png">
+    </body>
+    </html>
+    """
+    mock_response.raise_for_status = Mock()
+
+    def slow_get(url, timeout):
+        time.sleep(0.05)
+        return mock_response
+
+    real_soup = modal_redirect.BeautifulSoup
+    with (
+        patch("modal_redirect.requests.get", side_effect=slow_get) as mock_get,
+        patch("modal_redirect.BeautifulSoup", side_effect=real_soup) as mock_soup,
+    ):
+        parts = modal_redirect.resolve_preview("test-page", "my-section")
+
+    assert mock_get.call_count == 1
+    assert mock_soup.call_count == 1
+    assert parts == modal_redirect.PreviewParts(
+        title="My Section (Test page)",
+        description="Section text.",
+        image="https://example.com/section.png",
+        section_image="https://example.com/section.png",
+        anchor="my-section",
+    )
+    assert set(modal_redirect.lookup_timings) == {
+        "page",
+        "title",
+        "description",
+        "section_image",
+        "page_image",
+    }
+    assert modal_redirect.lookup_timings["page"].percentile(50) >= 0.05
+
+
+def test_resolve_preview_carries_request_deadline_into_lookups():
+    from unittest.mock import patch
+
+    import blog_origin
+    import modal_redirect
+
+    with patch("modal_redirect.requests.get") as mock_get:
+        with blog_origin.request_deadline(0):
+            parts = modal_redirect.resolve_preview("manager-book", "some-anchor")
+
+    mock_get.assert_not_called()
+    assert parts.title == "Some anchor (Igor's Manager Book)"
+    assert parts.image == modal_redirect.DEFAULT_PREVIEW_IMAGE
+
+
+@pytest.mark.asyncio
+async def test_admin_memory_reports_index_bytes(monkeypatch):
+    """The section index replaces retained soup trees and reports its size"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    mock_response = Mock()
+    mock_response.text = (
+        "<html><body><h2 id='a'>A</h2><p>One.</p><h2 id='b'>B</h2><p>Two.</p>"
+        "</body></html>"
+    )
+    mock_response.raise_for_status = Mock()
+
+    with patch("modal_redirect.requests.get", return_value=mock_response):
+        assert (
+            modal_redirect.get_heading_text_from_url(
+                "https://idvork.in/manager-book", "b"
+            )
+            == "B"
+        )
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        response = await client.get(
+            "/admin/memory", headers={"X-Admin-Token": "s3cret"}
+        )
+
+    report = response.json()
+    assert report["index"]["pages"] == 1
+    assert report["index"]["sections"] == 2
+    page = report["pages"]["https://idvork.in/manager-book"]
+    assert page["paragraphs"] == 2
+    assert report["index"]["bytes_per_section"] == page["bytes"] // 2
+    assert report["caches"]["pages"]["entries"] == 1
+    assert report["caches"]["pages"]["bytes"] > len(mock_response.text)
+    assert report["caches"]["indexed_pages"]["bytes"] == page["bytes"]
+    assert report["process"]["peak_rss_bytes"] > 0
+    assert report["tracemalloc"] == {"tracing": False}
+
+
+@pytest.mark.asyncio
+async def test_admin_memory_trace_and_request_sampling(monkeypatch):
+    """tracemalloc snapshots diff against the previous one; sampled requests
+    record RSS"""
+    import modal_redirect
+    from blog_memory import current_rss
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(modal_redirect, "MEMORY_SAMPLE_RATE", 1.0)
+    headers = {"X-Admin-Token": "s3cret"}
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        started = await client.post("/admin/memory/trace", headers=headers)
+        try:
+            first = await client.post("/admin/memory/snapshot", headers=headers)
+            second = await client.post(
+                "/admin/memory/snapshot?group_by=filename", headers=headers
+            )
+            bad = await client.post(
+                "/admin/memory/snapshot?group_by=nope", headers=headers
+            )
+        finally:
+            stopped = await client.post("/admin/memory/trace/stop", headers=headers)
+        report = (await client.get("/admin/memory", headers=headers)).json()
+
+    assert started.json()["tracing"] and not stopped.json()["tracing"]
+    assert first.json()["top"] and "diff" not in first.json()
+    assert "diff" in second.json()
+    assert bad.status_code == 400
+    if current_rss() is not None:
+        assert report["requests"]["count"] >= 4
+
+
+def test_compressed_page_cache_decompresses_only_to_reindex(monkeypatch):
+    """With compression on, bodies are stored as bytes and only decompressed
+    when the section index has to be (re)built"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "PAGE_CACHE_COMPRESSION", "zlib")
+    mock_html = (
+        "<html><body><h2 id='cached-heading'>Café Heading</h2>"
+        + "<p>Some repeated content for compression.</p>" * 200
+        + "</body></html>"
+    )
+    mock_response = Mock()
+    mock_response.text = mock_html
+    mock_response.raise_for_status = Mock()
+    url = "https://idvork.in/manager-book"
+
+    with patch("modal_redirect.requests.get", return_value=mock_response) as mock_get:
+        for _ in range(3):
+            assert (
+                modal_redirect.get_heading_text_from_url(url, "cached-heading")
+                == "Café Heading"
+            )
+
+    assert mock_get.call_count == 1
+    body = modal_redirect.page_cache[url][0]
+    assert isinstance(body, bytes)
+    assert len(body) * 5 < len(mock_html)
+    assert modal_redirect.fetch_cached_html(url) == mock_html
+
+    stats = modal_redirect.page_cache_stats
+    # One decompression to build the index, one for fetch_cached_html above
+    assert stats["decompressions"] == 2
+    assert stats["index_hits"] == 2
+    assert modal_redirect._page_cache_report()["compression_ratio"] > 5
+
+
+@pytest.mark.asyncio
+async def test_refetch_keeps_renders_of_unchanged_sections():
+    """After a page is refetched only the sections that changed are re-rendered"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    def page(second_text):
+        response = Mock()
+        response.text = f"""
+        <html><body>
+            <h2 id="first">First</h2><p>Unchanged text.</p>
+            <h2 id="second">Second</h2><p>{second_text}</p>
+        </body></html>
+        """
+        response.raise_for_status = Mock()
+        return response
+
+    url = "https://idvork.in/manager-book"
+    with patch("modal_redirect.requests.get", return_value=page("Old text.")):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            await client.get("/first")
+            await client.get("/second")
+    first_render = modal_redirect.rendered_cache[("manager-book", "first")]
+
+    # Expire the page so the next request refetches an edited copy
+    body, _ = modal_redirect.page_cache[url]
+    modal_redirect.page_cache[url] = (body, datetime.now())
+    with patch("modal_redirect.requests.get", return_value=page("New text.")):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+        ) as client:
+            first = await client.get("/first")
+            second = await client.get("/second")
+
+    assert modal_redirect.rendered_cache[("manager-book", "first")] is first_render
+    assert first.text == first_render[0]
+    assert "New text." in second.text
+    assert modal_redirect.page_cache_stats["sections_changed"] == 2 + 1
+    assert modal_redirect.page_cache_stats["sections_unchanged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_search_finds_sections_and_follows_refetches():
+    """/search returns share links for matching sections and sees page edits"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    def page(text):
+        response = Mock()
+        response.text = f"""
+        <html><body>
+            <h2 id="hiring">Hiring</h2><p>{text}</p>
+            <h2 id="feedback">Feedback</h2><p>Be timely.</p>
+        </body></html>
+        """
+        response.raise_for_status = Mock()
+        return response
+
+    url = "https://idvork.in/manager-book"
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=page("Hire slope.")):
+            response = await client.get("/search?q=slope")
+        assert response.status_code == 200
+        assert response.json()["results"] == [
+            {
+                "page": "manager-book",
+                "anchor": "hiring",
+                "heading": "Hiring",
+                "snippet": "Hire slope.",
+                # Search doesn't mint codes; a previewed section has one
+                "url": f"{modal_redirect.SERVICE_URL}/?path=manager-book%23hiring",
+                "score": response.json()["results"][0]["score"],
+            }
+        ]
+        assert len(modal_redirect.short_links) == 0
+        shared = (await client.get("/preview_text/hiring")).json()["url"]
+        response = await client.get("/search?q=slope")
+        assert response.json()["results"][0]["url"] == shared
+
+        body, _ = modal_redirect.page_cache[url]
+        modal_redirect.page_cache[url] = (body, datetime.now())
+        with patch("modal_redirect.requests.get", return_value=page("Curiosity.")):
+            await client.get("/hiring")
+            assert (await client.get("/search?q=slope")).json()["results"] == []
+            results = (await client.get("/search?q=curiosity")).json()["results"]
+            assert [r["anchor"] for r in results] == ["hiring"]
+
+
+@pytest.mark.asyncio
+async def test_deleted_page_drops_out_of_search():
+    """Once a page 404s, /search stops returning (and sharing) its sections"""
+    from unittest.mock import Mock, patch
+
+    import requests
+
+    import modal_redirect
+    from blog_routing import DEFAULT_PAGE, RouteKey
+
+    url = "https://idvork.in/old-post"
+    page = Mock(
+        text="<html><body><h2 id='hiring'>Hiring</h2><p>Slope.</p></body></html>"
+    )
+    with patch("modal_redirect.requests.get", return_value=page):
+        modal_redirect.get_page_index(RouteKey(DEFAULT_PAGE, None).url)
+        modal_redirect.get_page_index(url)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        results = (await client.get("/search?q=slope")).json()["results"]
+        assert "old-post" in [r["page"] for r in results]
+
+        body, _ = modal_redirect.page_cache[url]
+        modal_redirect.page_cache[url] = (body, datetime.now())
+        gone = Mock(status_code=404)
+        deleted = Mock(
+            raise_for_status=Mock(side_effect=requests.HTTPError(response=gone))
+        )
+        with patch("modal_redirect.requests.get", return_value=deleted):
+            assert modal_redirect.get_page_index(url) is None
+        results = (await client.get("/search?q=slope")).json()["results"]
+
+    assert "old-post" not in [r["page"] for r in results]
+    assert url not in modal_redirect.page_indexes
+
+
+@pytest.mark.asyncio
+async def test_head_is_answered_from_cache_metadata_only():
+    """HEAD never fetches; once rendered it reports the GET's length and ETag"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get") as mock_get:
+            cold = await client.head("/my-topic")
+        assert mock_get.call_count == 0
+        assert cold.status_code == 200
+        assert cold.headers["content-type"] == "text/html; charset=utf-8"
+        assert "content-length" not in cold.headers
+        assert "etag" not in cold.headers
+
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            page = await client.get("/my-topic")
+        with patch("modal_redirect.requests.get") as mock_get:
+            warm = await client.head("/Manager-Book/My-Topic/")
+        assert mock_get.call_count == 0
+        assert warm.headers["content-length"] == str(len(page.content))
+        assert warm.headers["etag"] == page.headers["etag"]
+        assert warm.content == b""
+
+        code = _short_url("manager-book", "my-topic").rsplit("/", 1)[1]
+        short = await client.head(f"/s/{code}")
+        assert short.headers["etag"] == page.headers["etag"]
+        assert (await client.head("/s/zzzzzz")).status_code == 404
+
+        # A code minted by another container, not yet in this one's memory
+        modal_redirect.short_links.keys.clear()
+        modal_redirect.short_links.codes.clear()
+        elsewhere = await client.head(f"/s/{code}")
+        assert elsewhere.status_code == 200
+
+        for path in ("/preview/my-topic", "/preview_text/my-topic", "/search"):
+            assert (await client.head(path)).status_code == 405
+        assert (await client.head("/admin/metrics")).status_code == 405
+
+    assert modal_redirect.probe_stats["head"] == 4
+    assert modal_redirect.probe_stats["head_without_length"] == 1
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_returns_not_modified():
+    """A GET with a current ETag gets 304 without rendering"""
+    from unittest.mock import patch
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            page = await client.get("/my-topic")
+        with patch("modal_redirect.render_redirect") as render:
+            not_modified = await client.get(
+                "/my-topic", headers={"If-None-Match": page.headers["etag"]}
+            )
+        assert render.call_count == 0
+        assert not_modified.status_code == 304
+        assert not_modified.headers["etag"] == page.headers["etag"]
+
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            changed = await client.get("/my-topic", headers={"If-None-Match": 'W/"0"'})
+        assert changed.status_code == 200
+
+
+def test_slow_origin_fetch_is_hedged_to_www(monkeypatch):
+    """A fetch slower than the hedge delay races www.idvork.in and takes the winner"""
+    import threading
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "HEDGE_DEFAULT_DELAY", 0.01)
+    release = threading.Event()
+    fast = Mock(text="<html><body><h2 id='x'>Hedged</h2></body></html>")
+
+    def get(url, timeout):
+        if url.startswith("https://www.idvork.in/"):
+            return fast
+        release.wait(5)
+        return Mock(text="<html></html>")
+
+    with patch("modal_redirect.requests.get", side_effect=get) as mock_get:
+        heading = modal_redirect.get_heading_text_from_url(
+            "https://idvork.in/manager-book", "x"
+        )
+        release.set()
+
+    assert heading == "Hedged"
+    assert [c.args[0] for c in mock_get.call_args_list] == [
+        "https://idvork.in/manager-book",
+        "https://www.idvork.in/manager-book",
+    ]
+    assert modal_redirect.origin_stats["hedges_fired"] == 1
+    assert modal_redirect.origin_stats["hedges_won"] == 1
+    # Cached under the canonical URL either way
+    assert "https://idvork.in/manager-book" in modal_redirect.page_cache
+
+
+def test_hedged_fetches_stay_within_the_origin_caps(monkeypatch):
+    """A first attempt that loses to its hedge keeps its slot until it's done,
+    so the origin never sees more requests than the scheduler allows"""
+    import threading
+    import time
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+    from blog_origin import OriginScheduler
+
+    monkeypatch.setattr(modal_redirect, "HEDGE_DEFAULT_DELAY", 0.01)
+    monkeypatch.setattr(modal_redirect, "origin_scheduler", OriginScheduler(4, 2))
+    lock = threading.Lock()
+    in_flight, peak = Counter(), Counter()
+
+    def get(url, timeout):
+        host = url.split("/")[2]
+        with lock:
+            in_flight[host] += 1
+            in_flight["all"] += 1
+            for key in (host, "all"):
+                peak[key] = max(peak[key], in_flight[key])
+        try:
+            # The first attempt is slow, so every fetch fires a hedge
+            time.sleep(0.01 if host == "www.idvork.in" else 0.1)
+            return Mock(text="<html><body><h2 id='x'>X</h2></body></html>")
+        finally:
+            with lock:
+                in_flight[host] -= 1
+                in_flight["all"] -= 1
+
+    urls = [f"https://idvork.in/page-{i}" for i in range(8)]
+    with patch("modal_redirect.requests.get", side_effect=get):
+        with ThreadPoolExecutor(8) as pool:
+            pages = list(pool.map(modal_redirect.fetch_cached_page, urls))
+        # Let first attempts that lost their race finish
+        time.sleep(0.2)
+
+    assert all(pages)
+    assert modal_redirect.origin_stats["hedges_fired"] > 0
+    assert peak["idvork.in"] <= 2 and peak["www.idvork.in"] <= 2
+    assert peak["all"] <= 4
+    assert modal_redirect.origin_scheduler.report()["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_admin_refresh_refetches_hot_pages_and_reports_changes(monkeypatch):
+    """/admin/refresh refetches pages that are about to expire and diffs them"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+
+    def page(text):
+        return Mock(text=f"<html><body><h2 id='a'>A</h2><p>{text}</p></body></html>")
+
+    url = "https://idvork.in/manager-book"
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=page("old")):
+            await client.get("/a")
+        assert modal_redirect.hot_pages.estimate(url) == 1
+
+        # Fresh for longer than the refresh interval: nothing to do
+        refresh = "/admin/refresh"
+        headers = {"X-Admin-Token": "s3cret"}
+        with patch("modal_redirect.requests.get") as mock_get:
+            idle = (await client.post(refresh, headers=headers)).json()
+        assert mock_get.call_count == 0
+        assert idle["pages"] == 0
+
+        body, _ = modal_redirect.page_cache[url]
+        modal_redirect.page_cache[url] = (body, datetime.now())
+        with patch("modal_redirect.requests.get", return_value=page("new")):
+            report = (await client.post(refresh, headers=headers)).json()
+
+    assert report["pages"] == 1 and report["failed"] == 0
+    assert report["sections_changed"] == 1
+    assert report["results"][0]["url"] == url
+    assert datetime.now() < modal_redirect.page_cache[url][1]
+
+
+def test_origin_fetches_go_through_the_scheduler(monkeypatch):
+    """Refresh fetches run at background priority, and a request that gets no
+    origin slot in time falls back to the stale page without blaming the origin"""
+    from unittest.mock import patch
+
+    import modal_redirect
+    from blog_origin import BACKGROUND, FOREGROUND, OriginScheduler, request_deadline
+
+    url = "https://idvork.in/manager-book"
+    monkeypatch.setattr(modal_redirect, "ORIGIN_HEDGING", False)
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        modal_redirect.fetch_cached_html(url)
+        modal_redirect.refresh_page(url)
+    priorities = modal_redirect.origin_scheduler.report()["priorities"]
+    assert priorities[FOREGROUND]["granted"] == 1
+    assert priorities[BACKGROUND]["granted"] == 1
+
+    stale = modal_redirect.page_cache[url][0]
+    modal_redirect.page_cache[url] = (stale, datetime.now())
+    monkeypatch.setattr(modal_redirect, "origin_scheduler", OriginScheduler(0, 0))
+    with patch("modal_redirect.requests.get", side_effect=AssertionError("fetch")):
+        with request_deadline(0.05):
+            html = modal_redirect.fetch_cached_html(url)
+    assert html == modal_redirect._decode_body(stale)
+    assert modal_redirect.origin_stats["no_origin_slot"] == 1
+    assert modal_redirect.breaker_for("idvork.in").failures == 0
+
+
+def test_refresh_cache_pings_the_web_function(monkeypatch):
+    """The scheduled function runs locally; it POSTs /admin/refresh, then
+    /admin/snapshot"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    response = Mock(status_code=200)
+    response.json.return_value = {"pages": 2, "results": []}
+    with patch("modal_redirect.requests.post", return_value=response) as post:
+        modal_redirect.refresh_cache.local()
+
+    refresh, snapshot = post.call_args_list
+    assert refresh.args[0] == f"{modal_redirect.SERVICE_URL}/admin/refresh"
+    assert refresh.kwargs["headers"] == {"x-admin-token": "s3cret"}
+    assert snapshot.args[0] == f"{modal_redirect.SERVICE_URL}/admin/snapshot"
+
+
+def test_full_rendered_cache_evicts_cold_links_first(monkeypatch):
+    """Crawler renders push out cold links, not the frequently shared one"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+    from blog_routing import RouteKey
+
+    monkeypatch.setattr(modal_redirect, "MAX_RENDERED_ENTRIES", 4)
+    sections = "".join(f"<h2 id='s{i}'>S{i}</h2><p>Text {i}.</p>" for i in range(20))
+    response = Mock(text=f"<html><body>{sections}</body></html>")
+
+    popular = RouteKey("manager-book", "s0")
+    with patch("modal_redirect.requests.get", return_value=response):
+        for _ in range(5):
+            modal_redirect.record_request(popular)
+        modal_redirect.render_redirect(popular)
+        for i in range(1, 20):
+            key = RouteKey("manager-book", f"s{i}")
+            modal_redirect.record_request(key)
+            modal_redirect.render_redirect(key)
+
+    assert len(modal_redirect.rendered_cache) == 4
+    assert popular in modal_redirect.rendered_cache
+
+
+@pytest.mark.asyncio
+async def test_admin_hotkeys_lists_most_requested_links(monkeypatch):
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            for _ in range(3):
+                await client.get("/my-topic")
+            await client.get("/preview_text/my-page/my-topic")
+        hot = (
+            await client.get("/admin/hotkeys", headers={"X-Admin-Token": "s3cret"})
+        ).json()
+
+    assert hot["links"][0] == {"page": "manager-book", "anchor": "my-topic", "count": 3}
+    assert hot["pages"][0] == {"url": "https://idvork.in/manager-book", "count": 3}
+    assert hot["updates"] == 4
+
+
+@pytest.mark.asyncio
+async def test_snapshot_round_trip_warms_a_new_container(monkeypatch, tmp_path):
+    """A snapshot restores pages, indexes and renders without refetching"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+    from blog_routing import RouteKey
+    from blog_snapshot import LocalDiskBackend
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(modal_redirect, "snapshot_store", LocalDiskBackend(tmp_path))
+    headers = {"X-Admin-Token": "s3cret"}
+    response = Mock(text="<html><body><h2 id='a'>A</h2><p>Warm.</p></body></html>")
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=response):
+            before = await client.get("/a")
+        saved = (await client.post("/admin/snapshot", headers=headers)).json()
+        assert saved["pages"] == saved["indexes"] == saved["rendered"] == 1
+
+        modal_redirect.reset_caches()  # a fresh container
+        loaded = (await client.post("/admin/snapshot/restore", headers=headers)).json()
+        assert loaded["loaded"] and loaded["rendered"] == 1
+
+        with patch("modal_redirect.requests.get") as mock_get:
+            after = await client.get("/a")
+            search = (await client.get("/search?q=warm")).json()
+        assert mock_get.call_count == 0
+    assert after.text == before.text
+    assert modal_redirect.rendered_cache[RouteKey("manager-book", "a")][0] == after.text
+    assert [r["anchor"] for r in search["results"]] == ["a"]
+
+
+def test_snapshot_load_skips_expired_pages_and_other_schemas(monkeypatch, tmp_path):
+    import blog_snapshot
+    import modal_redirect
+    from blog_snapshot import LocalDiskBackend
+
+    store = LocalDiskBackend(tmp_path)
+    monkeypatch.setattr(modal_redirect, "snapshot_store", store)
+    url = "https://idvork.in/manager-book"
+    modal_redirect.page_cache[url] = ("<html></html>", datetime(2000, 1, 1))
+    modal_redirect.save_snapshot()
+    modal_redirect.reset_caches()
+
+    result = modal_redirect.load_snapshot()
+    assert result["loaded"] and "pages" not in result
+    assert url not in modal_redirect.page_cache
+
+    written = blog_snapshot.SCHEMA_VERSION
+    monkeypatch.setattr(blog_snapshot, "SCHEMA_VERSION", written + 1)
+    result = modal_redirect.load_snapshot()
+    assert not result["loaded"] and f"schema {written}" in result["reason"]
+    store.write(b"garbage")
+    assert modal_redirect.load_snapshot()["reason"] == "not a cache snapshot"
+
+
+@pytest.mark.asyncio
+async def test_other_workers_serve_renders_from_the_shared_bundle():
+    """A worker with cold caches answers GET and HEAD from the bundle, no fetch"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            rendered = await client.get("/my-topic")
+        assert modal_redirect.write_render_bundle() == 1
+
+        modal_redirect.reset_caches()  # another worker process
+        with patch("modal_redirect.requests.get") as mock_get:
+            head = await client.head("/my-topic")
+            page = await client.get("/my-topic")
+            not_modified = await client.get(
+                "/my-topic", headers={"If-None-Match": rendered.headers["etag"]}
+            )
+        assert mock_get.call_count == 0
+
+    assert page.text == rendered.text
+    assert page.headers["etag"] == rendered.headers["etag"]
+    assert page.headers["content-type"] == "text/html; charset=utf-8"
+    assert head.headers["content-length"] == str(len(rendered.content))
+    assert not_modified.status_code == 304
+    assert modal_redirect.page_cache_stats["bundle_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_new_workers_load_page_indexes_from_the_bundle():
+    """A worker starting after the bundle was written has the page indexed,
+    so other sections of it render without a fetch"""
+    from unittest.mock import patch
+
+    import modal_redirect
+    from blog_routing import RouteKey
+
+    with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+        modal_redirect.get_page_index(RouteKey("manager-book", None).url)
+    modal_redirect.write_render_bundle()
+
+    modal_redirect.reset_caches()  # a worker process starting up
+    assert modal_redirect.load_bundled_indexes() == 1
+    assert modal_redirect.load_bundled_indexes() == 0  # already in memory
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get") as mock_get:
+            page = await client.get("/my-topic")
+        assert mock_get.call_count == 0
+
+    assert "My Topic" in page.text
+    assert modal_redirect.page_cache_stats["bundle_hits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_profile_header_profiles_one_request(monkeypatch):
+    """X-Profile with the admin token profiles that request through the fetch,
+    parse and render threads; other requests aren't profiled"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    admin = {"X-Admin-Token": "s3cret"}
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            await client.get("/my-topic", headers={"X-Profile": "wrong"})
+            modal_redirect.reset_caches()
+            await client.get("/my-topic", headers={"X-Profile": "s3cret"})
+        listing = (await client.get("/admin/profiles", headers=admin)).json()
+        profile_id = listing["profiles"][0]["id"]
+        report = await client.get(f"/admin/profiles/{profile_id}", headers=admin)
+        by_own_time = await client.get(
+            f"/admin/profiles/{profile_id}?sort=tottime", headers=admin
+        )
+        missing = await client.get("/admin/profiles/999", headers=admin)
+
+    assert len(listing["profiles"]) == 1
+    summary = listing["profiles"][0]
+    assert summary["path"] == "/my-topic" and summary["reason"] == "header"
+    assert summary["status"] == 200
+    for name in ("render_redirect", "resolve_preview", "get_page_index"):
+        assert name in report.text
+    assert "tottime" in by_own_time.text
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_profile_sample_rate(monkeypatch):
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "PROFILE_SAMPLE_RATE", 1.0)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        await client.get("/search?q=")
+    assert [p["reason"] for p in modal_redirect.profiles.summaries()] == ["sampled"]
+
+
+def test_origin_fixtures_record_then_replay_without_network(monkeypatch, tmp_path):
+    """ORIGIN_FIXTURES=record saves origin responses; replay serves them
+    without touching the network"""
+    from unittest.mock import patch
+
+    import requests
+
+    import modal_redirect
+
+    url = "https://idvork.in/manager-book"
+    origin = requests.Response()
+    origin.status_code = 200
+    origin.encoding = "utf-8"
+    origin._content = b"<html><body><h2 id='a'>Recorded</h2><p>Text.</p></body></html>"
+    monkeypatch.setattr(modal_redirect, "ORIGIN_FIXTURE_DIR", str(tmp_path))
+    monkeypatch.setattr(modal_redirect, "ORIGIN_HEDGING", False)
+
+    monkeypatch.setattr(modal_redirect, "ORIGIN_FIXTURES", "record")
+    with patch("modal_redirect.requests.get", return_value=origin):
+        recorded = modal_redirect.get_heading_text_from_url(url, "a")
+
+    modal_redirect.reset_caches()
+    monkeypatch.setattr(modal_redirect, "ORIGIN_FIXTURES", "replay")
+    with patch("modal_redirect.requests.get", side_effect=AssertionError("network")):
+        replayed = modal_redirect.get_heading_text_from_url(url, "a")
+
+    assert recorded == replayed == "Recorded"
+    assert len(list(tmp_path.glob("*.body"))) == 1
+
+
+def _wait_for_shadow():
+    import time
+
+    import modal_redirect
+
+    for _ in range(200):
+        if modal_redirect.shadow_store().counts["comparisons"]:
+            return
+        time.sleep(0.01)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "engine,mismatches",
+    [("modal_redirect:extract_from_html", 0), ("test_modal_redirect:_shouting", 1)],
+)
+async def test_shadow_mode_compares_engines_on_live_requests(
+    monkeypatch, engine, mismatches
+):
+    """Sampled requests run the candidate on the page they used, in the
+    background, and mismatches are reported by field"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "SHADOW_ENGINE", engine)
+    monkeypatch.setattr(modal_redirect, "SHADOW_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(modal_redirect, "ADMIN_TOKEN", "s3cret")
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            await client.get("/my-topic")
+        _wait_for_shadow()
+        report = (
+            await client.get("/admin/shadow", headers={"X-Admin-Token": "s3cret"})
+        ).json()
+
+    assert report["engine"] == engine
+    assert report["comparisons"] == 1 and report["mismatches"] == mismatches
+    if mismatches:
+        [mismatch] = report["recent_mismatches"]
+        assert mismatch["fields"] == {"heading": ["My Topic", "MY TOPIC"]}
+
+
+def _shouting(html, url, anchor, max_chars):
+    """A candidate engine that disagrees about headings"""
+    import modal_redirect
+
+    current = modal_redirect.extract_from_html(html, url, anchor, max_chars)
+    return current._replace(heading=current.heading.upper())
+
+
+@pytest.mark.asyncio
+async def test_shed_requests_get_degraded_pages_without_fetching(monkeypatch):
+    """With no slot free, a redirect is answered from memory (a cached render
+    if there is one, else the URL alone) and the tool routes get a 503"""
+    from unittest.mock import patch
+
+    import modal_redirect
+    from blog_admission import CLASSES, AdmissionController
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=_page_with_topic()):
+            full = await client.get("/my-topic")
+
+        saturated = AdmissionController(0, queue_limits=dict.fromkeys(CLASSES, 0))
+        monkeypatch.setattr(modal_redirect, "admission", saturated)
+        with patch("modal_redirect.requests.get", side_effect=AssertionError("fetch")):
+            cached = await client.get("/my-topic", headers={"User-Agent": "Slackbot"})
+            uncached = await client.get("/other-page/some-thing")
+            preview = await client.get("/preview_text/my-topic")
+            head = await client.head("/my-topic")
+
+    assert cached.headers["x-degraded"] == "rendered"
+    assert cached.text == full.text
+    assert uncached.headers["x-degraded"] == "url"
+    assert uncached.headers["cache-control"] == "no-store"
+    assert 'content="Some thing (Other page)"' in uncached.text
+    assert preview.status_code == 503
+    assert head.status_code == 200  # HEAD only reads memory, so it's never shed
+    report = modal_redirect.admission.report()
+    assert report["shed"] == 3
+    assert report["classes"]["unfurl"]["shed_full"] == 1
+    assert modal_redirect.degraded_stats == {"rendered": 1, "url": 1, "unavailable": 1}
+
+
+@pytest.mark.asyncio
+async def test_bare_anchor_resolves_to_the_page_that_has_it():
+    """Once the manager book is known not to have an anchor, /anchor goes to
+    the indexed page that does, without fetching anything"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    pages = {
+        "https://idvork.in/manager-book": _page_with_topic(),
+        "https://idvork.in/travel": Mock(
+            text="<html><body><h2 id='packing'>Packing</h2><p>Less.</p></body></html>"
+        ),
+    }
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch(
+            "modal_redirect.requests.get", side_effect=lambda url, **_: pages[url]
+        ):
+            await client.get("/my-topic")
+            await client.get("/travel/packing")
+        with patch("modal_redirect.requests.get", side_effect=AssertionError("fetch")):
+            bare = await client.get("/packing")
+            head = await client.head("/packing")
+            preview = await client.get("/preview_text/packing")
+
+    assert "https://idvork.in/travel#packing" in bare.text
+    assert 'content="Packing (Travel)"' in bare.text
+    assert head.headers["etag"] == bare.headers["etag"]
+    assert preview.json()["preview"] == "Less."
+    assert modal_redirect.anchor_index.page_for("my-topic") == "manager-book"
+
+
+@pytest.mark.asyncio
+async def test_mixed_case_ids_keep_their_heading_image_and_fragment():
+    """RouteKey anchors are lowercased, but the page's ids are matched ignoring
+    case and the redirect goes to the id as the page writes it"""
+    from unittest.mock import Mock, patch
+
+    page = Mock(
+        text="<html><body><h2 id='Key-Ideas'>Key Ideas</h2>"
+        "<img src='/ideas.png'><p>Ideas.</p></body></html>"
+    )
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch("modal_redirect.requests.get", return_value=page):
+            response = await client.get("/some-page/Key-Ideas")
+            bare = await client.get("/preview/some-page/key-ideas")
+
+    assert 'content="Key Ideas (Some page)"' in response.text
+    assert 'content="https://idvork.in/ideas.png"' in response.text
+    assert 'window.location.href = "https://idvork.in/some-page#Key-Ideas"' in (
+        response.text
+    )
+    assert "https://idvork.in/some-page#Key-Ideas" in bare.text
+
+
+def test_reindex_clears_misses_for_added_sections():
+    """A section added to the page is served as soon as the page is
+    reindexed, not after its negative cache entry expires"""
+    from unittest.mock import Mock, patch
+
+    import modal_redirect
+
+    def page(body):
+        return Mock(text=f"<html><body>{body}</body></html>")
+
+    url = "https://idvork.in/manager-book"
+    with patch("modal_redirect.requests.get", return_value=page("<h2 id='a'>A</h2>")):
+        assert modal_redirect.get_heading_text_from_url(url, "b") is None
+    assert modal_redirect.is_known_miss(url, "b")
+
+    added = page("<h2 id='a'>A</h2><h2 id='b'>B</h2>")
+    with patch("modal_redirect.requests.get", return_value=added):
+        modal_redirect.refresh_page(url)
+    assert modal_redirect.get_heading_text_from_url(url, "b") == "B"
+
+
+def test_reindex_tolerates_renders_added_concurrently():
+    """_on_reindex walks rendered_cache while lookup threads write to it"""
+    import threading
+
+    import modal_redirect
+    from blog_index import build_page_index, diff_indexes
+    from blog_routing import RouteKey
+
+    url = "https://idvork.in/manager-book"
+    html = "<html><body><h2 id='a'>A</h2><p>Text.</p></body></html>"
+    index = build_page_index(BeautifulSoup(html, "html.parser"), url)
+    diff = diff_indexes(None, index)
+    for n in range(5000):
+        modal_redirect.rendered_cache[RouteKey("other", str(n))] = ("", b"")
+    done = threading.Event()
+
+    def render():
+        keys = [RouteKey("manager-book", f"x{n}") for n in range(50)]
+        while not done.is_set():
+            for key in keys:
+                modal_redirect.rendered_cache[key] = ("", b"")
+            for key in keys:
+                modal_redirect.rendered_cache.pop(key, None)
+
+    writer = threading.Thread(target=render)
+    writer.start()
+    try:
+        for _ in range(300):
+            modal_redirect._on_reindex(url, index, diff, full=True)
+    finally:
+        done.set()
+        writer.join()
+
+
+def test_live_requests_dont_wait_on_a_refresh(monkeypatch):
+    """A refresh holds no lock a live request needs, and a second refresh of
+    the same page while one runs is skipped"""
+    import threading
+    import time
+    from datetime import timedelta
+    from unittest.mock import patch
+
+    import blog_origin
+    import modal_redirect
+
+    monkeypatch.setattr(modal_redirect, "ORIGIN_HEDGING", False)
+    url = "https://idvork.in/manager-book"
+    stale = "<html><body><h2 id='a'>Stale</h2></body></html>"
+    modal_redirect.page_cache[url] = (stale, datetime.now() - timedelta(minutes=1))
+    refreshing, release = threading.Event(), threading.Event()
+
+    def get(url, **kwargs):
+        if blog_origin.current_priority() == blog_origin.BACKGROUND:
+            refreshing.set()
+            release.wait(5)
+        return _page_with_topic()
+
+    with patch("modal_redirect.requests.get", side_effect=get):
+        refresh = threading.Thread(target=modal_redirect.refresh_page, args=(url,))
+        refresh.start()
+        refreshing.wait(5)
+        try:
+            assert modal_redirect.refresh_page(url) is None
+            start = time.perf_counter()
+            with blog_origin.request_deadline(modal_redirect.REQUEST_DEADLINE_SECONDS):
+                heading = modal_redirect.get_heading_text_from_url(url, "my-topic")
+            assert time.perf_counter() - start < 1
+            assert heading == "My Topic"
+        finally:
+            release.set()
+            refresh.join()
+
+
+def test_live_request_waits_for_a_fetch_only_within_its_budget():
+    """A request that can't join the in-flight fetch in time serves stale"""
+    from datetime import timedelta
+    from unittest.mock import patch
+
+    import blog_origin
+    import modal_redirect
+
+    url = "https://idvork.in/manager-book"
+    stale = modal_redirect.page_cache[url] = ("stale", datetime.now() - timedelta(1))
+    with modal_redirect._stripe(modal_redirect._fetch_locks, url):
+        with patch("modal_redirect.requests.get", side_effect=AssertionError("fetch")):
+            with blog_origin.request_deadline(0.05):
+                assert modal_redirect.fetch_cached_page(url) is stale
+    assert modal_redirect.page_cache_stats["fetch_wait_timeouts"] == 1
+
+
+def test_junk_paths_dont_grow_the_lock_tables():
+    """Single-flight locks are striped, so scanner paths leave nothing behind"""
+    from unittest.mock import Mock, patch
+
+    import requests
+
+    import modal_redirect
+
+    gone = Mock(status_code=404)
+    response = Mock(
+        raise_for_status=Mock(side_effect=requests.HTTPError(response=gone))
+    )
+    with patch("modal_redirect.requests.get", return_value=response):
+        for i in range(300):
+            modal_redirect.get_page_index(f"https://idvork.in/wp-admin-{i}.php")
+
+    assert len(modal_redirect._fetch_locks) == modal_redirect.LOCK_STRIPES
+    assert len(modal_redirect._index_locks) == modal_redirect.LOCK_STRIPES
+
+
+@pytest.mark.asyncio
+async def test_mixed_case_pages_are_fetched_and_redirected_as_written():
+    """GitHub Pages paths are case-sensitive: the origin is asked for the page
+    as the link wrote it, while every spelling shares one cache entry"""
+    from unittest.mock import patch
+
+    import modal_redirect
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=web_app), base_url="http://test"
+    ) as client:
+        with patch(
+            "modal_redirect.requests.get", return_value=_page_with_topic()
+        ) as mock_get:
+            response = await client.get("/Some-Page/my-topic")
+            lower = await client.get("/some-page/my-topic")
+
+    assert [c.args[0] for c in mock_get.call_args_list] == [
+        "https://idvork.in/Some-Page"
+    ]
+    assert get_redirect_url(response.text) == "https://idvork.in/Some-Page#my-topic"
+    assert get_redirect_url(lower.text) == "https://idvork.in/Some-Page#my-topic"
+    assert "https://idvork.in/some-page" in modal_redirect.page_cache
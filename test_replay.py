@@ -0,0 +1,85 @@
+import json
+
+from replay import StandInOrigin, load_log, report, route_for, run
+
+
+def _log(*entries):
+    return load_log(json.dumps(e) for e in entries)
+
+
+def test_load_log_sorts_and_parses_timestamps():
+    logged = _log(
+        {"ts": "2026-01-01T00:00:02Z", "path": "/b"},
+        {"ts": 1767225600.5, "path": "/a", "query": "?path=x", "user_agent": "bot"},
+    )
+    assert [r.path for r in logged] == ["/a", "/b"]
+    assert logged[0].target == "/a?path=x"
+    assert logged[1].ts == 1767225602.0
+
+
+def test_stand_in_origin_serves_logged_pages_only():
+    logged = _log(
+        {"ts": 1, "path": "/manager-book/hiring"},
+        {"ts": 2, "path": "/", "query": "path=manager-book%23one-on-ones"},
+        {"ts": 3, "path": "/preview_text/about/me"},
+        {"ts": 4, "path": "/wp-admin/setup.php"},
+    )
+    origin = StandInOrigin.for_log(logged, latency=0, page_bytes=10_000)
+    assert origin.anchors == {
+        "manager-book": {"hiring", "one-on-ones"},
+        "about": {"me"},
+    }
+
+    page = origin.get("https://idvork.in/manager-book")
+    assert page.status_code == 200 and 'id="one-on-ones"' in page.text
+    assert len(page.text) >= 10_000
+    assert origin.get("https://idvork.in/wp-admin").status_code == 404
+    assert origin.fetches == 2
+
+
+def test_route_for_names_the_route_template():
+    from modal_redirect import web_app
+
+    assert route_for(web_app, "/s/abc123") == "/s/{code}"
+    assert route_for(web_app, "/manager-book/hiring") == "/{full_path:path}"
+
+
+def test_replay_reports_latency_and_cache_hits():
+    logged = _log(
+        *({"ts": i, "path": "/manager-book/hiring"} for i in range(5)),
+        {"ts": 5, "path": "/Manager-Book.html/Hiring/"},
+        {"ts": 6, "path": "/preview_text/manager-book/hiring"},
+    )
+    summary = run(logged, origin_ms=0, page_kb=20, concurrency=1)
+
+    assert summary["requests"] == 7
+    assert summary["origin_fetches"] == 1
+    # One render, then every variant of the link hits it
+    assert summary["rendered_cache_hit_ratio"] == round(5 / 6, 3)
+    redirect = summary["routes"]["/{full_path:path}"]
+    assert redirect["count"] == 6 and redirect["statuses"] == {200: 6}
+    assert redirect["served_without_fetch"] == round(5 / 6, 3)
+    assert summary["routes"]["/preview_text/{full_path:path}"]["count"] == 1
+    assert "/preview_text/{full_path:path}" in report(summary)
+
+
+def test_replay_against_recorded_fixtures(tmp_path):
+    import requests
+
+    from blog_fixtures import FixtureStore
+
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response._content = b"<html><body><h2 id='hiring'>Hiring</h2><p>x</p></body></html>"
+    FixtureStore(str(tmp_path)).save(
+        "https://idvork.in/manager-book", response, seconds=0.001
+    )
+
+    logged = _log(
+        {"ts": 1, "path": "/manager-book/hiring"},
+        {"ts": 2, "path": "/unrecorded/page"},
+    )
+    summary = run(logged, fixtures=str(tmp_path), concurrency=1)
+    assert summary["origin_fetches"] == 2
+    assert summary["routes"]["/{full_path:path}"]["statuses"] == {200: 2}